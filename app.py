@@ -1,33 +1,93 @@
-from astropy.time import Time
-from flask import Flask, g, request, jsonify
+from flask import Flask, request, jsonify, g
 from flask_compress import Compress
 from flask_cors import CORS
-import firebase_admin
-from google.cloud.firestore_v1.base_query import FieldFilter
-from firebase_admin import credentials
-from firebase_admin import firestore
-from utilities import time_utils
-from utilities import target_utils
+from utilities import catalog_utils
+from utilities import job_utils
+from utilities import lazy_utils
+from utilities import metrics_utils
+from utilities import search_utils
+from utilities import storage_utils
+from utilities import warmup_utils
+import cProfile
 import datetime
+import os
 import pytz
-import re
+import time
 
-# Use a service account.
-cred = credentials.Certificate('astroplanner-25d27-firebase-adminsdk-tv1sf-3516a4d7d5.json')
-firebase_admin.initialize_app(cred)
+# Slow to import (astropy, astroplan, firebase_admin): imported on first use, or by the pre-warm thread (see warmup_utils)
+resolver_utils = lazy_utils.lazy_import('utilities.resolver_utils')
+target_utils = lazy_utils.lazy_import('utilities.target_utils')
+time_utils = lazy_utils.lazy_import('utilities.time_utils')
+timezone_utils = lazy_utils.lazy_import('utilities.timezone_utils')
 
-def create_app():
+def create_app(config=None):
     app = Flask(__name__)
+
+    # Defaults from the environment, overridden by config
+    app.config.update(
+        FIREBASE_CREDENTIALS=os.environ.get('FIREBASE_CREDENTIALS', 'astroplanner-25d27-firebase-adminsdk-tv1sf-3516a4d7d5.json'),
+        STORAGE_BACKEND=storage_utils.STORAGE_BACKEND,
+        # Load the catalog indexes, the astronomy modules, the IERS tables and the clients in a background thread
+        PREWARM=os.environ.get('PREWARM', '').lower() in ('1', 'true', 'yes'),
+        # Allow ?profile=1 to return a cProfile summary instead of the response (off by default: it exposes code paths)
+        PROFILE_REQUESTS=os.environ.get('PROFILE_REQUESTS', '').lower() in ('1', 'true', 'yes'),
+        # Run the optimal times generation jobs in this process (on by default; turn it off in all but one process sharing JOBS_DB_PATH)
+        JOB_WORKER=os.environ.get('JOB_WORKER', '1').lower() in ('1', 'true', 'yes')
+    )
+    app.config.update(config or {})
+
     Compress(app)   # Enable compression for all routes
 
+    # One Firestore client per process, created on first use (see db_utils); Firebase is only needed by the Firestore backend
+    storage_utils.configure(app.config['STORAGE_BACKEND'])
+
+    if app.config['STORAGE_BACKEND'] == 'firestore':
+        storage_utils.init_firebase(app.config['FIREBASE_CREDENTIALS'])
+
+    # Run queued optimal times generation jobs (and resume interrupted ones) in the background, or only queue them
+    if app.config['JOB_WORKER']:
+        job_utils.start_worker(app)
+    else:
+        job_utils.init_db()
+
+    # Build the /search_objects index now, or in the background with the rest of the pre-warm
+    # (the catalog used to resolve target coordinates is otherwise loaded by the first request that needs it)
+    if app.config['PREWARM']:
+        warmup_utils.start_prewarm(app)
+    else:
+        warmup_utils.load_search_index(app)
+
     @app.before_request
-    def before_request():
-        if 'db' not in g:
-            g.db = firestore.client()
+    def start_request_timing():
+        # Collect the spans of the request (see metrics_utils) for its Server-Timing header
+        g.request_started = time.perf_counter()
+        g.spans_token = metrics_utils.start_request()
+
+        if app.config['PROFILE_REQUESTS'] and request.args.get('profile') == '1':
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    @app.after_request
+    def end_request_timing(response):
+        profiler = g.pop('profiler', None)
+
+        if profiler is not None:
+            profiler.disable()
+
+        if 'spans_token' not in g:
+            return response
 
-    @app.teardown_appcontext
-    def teardown_db(exception=None):
-        db = g.pop('db', None)
+        seconds = time.perf_counter() - g.request_started
+        spans = metrics_utils.end_request(g.pop('spans_token'))
+
+        metrics_utils.observe_request(request.endpoint, request.method, response.status_code, seconds)
+        response.headers['Server-Timing'] = metrics_utils.get_server_timing(spans, seconds)
+
+        if profiler is not None:
+            response.set_data(metrics_utils.get_profile_summary(profiler))
+            response.mimetype = 'text/plain'
+
+        return response
 
     @app.route('/test', methods=['GET'])
     def test():
@@ -72,6 +132,45 @@ def create_app():
             return jsonify({'error': str(e)}), 400       
 
 
+    @app.route('/target_calendar', methods=['GET'])
+    def target_calendar():
+        # Get per-night dark minutes, peak altitude and moon fraction of a target (e.g. for a year view)
+
+        start_date_str = request.args.get('start_date')
+        end_date_str = request.args.get('end_date')
+        latitude = request.args.get('latitude')
+        longitude = request.args.get('longitude')
+        location_name = request.args.get('location_name')
+        target_id = request.args.get('target_id')
+        min_altitude = request.args.get('min_altitude')
+
+        try:
+            calendar = target_utils.get_target_calendar(start_date_str, end_date_str, latitude, longitude, location_name, target_id, min_altitude)
+            return jsonify(calendar)
+
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+    @app.route('/plan_targets', methods=['POST'])
+    def plan_targets():
+        # Get optimal times to shoot several targets from one location
+
+        start_date_str = request.json.get('start_date')
+        end_date_str = request.json.get('end_date')
+        latitude = request.json.get('latitude')
+        longitude = request.json.get('longitude')
+        location_name = request.json.get('location_name')
+        targets = request.json.get('targets')
+        min_altitude = request.json.get('min_altitude')
+        min_session_length = request.json.get('min_session_length')
+
+        try:
+            plans = target_utils.get_optimal_targets_times(start_date_str, end_date_str, latitude, longitude, location_name, targets, min_altitude, min_session_length)
+            return jsonify(plans)
+
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
     @app.route('/get_optimal_times', methods=['GET'])
     def get_optimal_times():
         start_date_str = request.args.get('start_date')
@@ -94,13 +193,12 @@ def create_app():
 
             optimal_times = time_utils.get_or_generate_optimal_times(start_date_utc, end_date_utc, latitude, longitude)
 
-            times_iso = []
+            # Compact form: the first time and the offsets (in seconds) of every time from it
+            if request.args.get('format') == 'epoch':
+                return jsonify(dict(timezone_utils.get_epoch_offsets(optimal_times.unix), timezone=local_timezone.zone))
 
-            # Convert the Astropy Time objects to datetime objects in UTC and then to the local timezone
-            optimal_times_local = [pytz.utc.localize(time.datetime).astimezone(local_timezone) for time in optimal_times]
-
-            # Format the times to the required ISO format without the offset
-            times_iso += [time.strftime('%Y-%m-%dT%H:%M:%S.000') for time in optimal_times_local]
+            # Convert the times to the local timezone and format them to the required ISO format without the offset
+            times_iso = timezone_utils.format_local_times(optimal_times.unix, local_timezone.zone)
 
             return jsonify(times_iso)
 
@@ -125,16 +223,47 @@ def create_app():
             latitude = float(latitude)
             longitude = float(longitude)
 
-            time_utils.generate_optimal_times_full(start_date_utc, end_date_utc, latitude, longitude)
+            # Generate in the background; the job status is available at /jobs/<job_id>
+            job_id = job_utils.submit_generation_job(start_date_utc, end_date_utc, latitude, longitude)
 
         except ValueError as e:
             return jsonify({'error': str(e)}), 400
 
         response = {
-            "status": "success",
-            "message": "Optimal times generated successfully"
+            "status": "queued",
+            "message": "Optimal times generation queued",
+            "job_id": job_id,
+            "status_url": f"/jobs/{job_id}"
         }
-        return jsonify(response), 200
+        return jsonify(response), 202
+
+    @app.route('/jobs/<job_id>', methods=['GET'])
+    def get_job(job_id):
+        job = job_utils.get_job(job_id)
+
+        if job is None:
+            return jsonify({'error': f'Job {job_id} not found'}), 404
+
+        return jsonify(job)
+
+    @app.route('/admin/optimal_times_cache', methods=['GET', 'DELETE'])
+    def optimal_times_cache():
+        # Inspect (GET) or flush (DELETE) the process-local optimal times cache
+        if request.method == 'DELETE':
+            cleared = time_utils.optimal_times_cache.clear()
+            return jsonify({"status": "success", "cleared": cleared, "cache": time_utils.optimal_times_cache.stats()})
+
+        return jsonify(time_utils.optimal_times_cache.stats())
+
+    @app.route('/admin/resolver', methods=['GET'])
+    def resolver_stats():
+        # Target resolver hit rates (local catalog vs. remote lookups)
+        return jsonify(resolver_utils.get_stats())
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        # Request and span duration histograms of this process, in the Prometheus text format
+        return metrics_utils.render_metrics(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
 
     # @app.route('/search_objects', methods=['GET'])
     # def search_objects():
@@ -166,156 +295,28 @@ def create_app():
     #         )
     #     return jsonify(suggestions)
 
-    def query_objects_by_id(field_name, field_value):
-        astro_objects_ref = g.db.collection("astro_objects_full")
-
-        query_ref = astro_objects_ref.where(filter=FieldFilter(field_name, "==", field_value))
-
-        # Execute the query and print the results
-        astro_objects = query_ref.stream()
-
-        suggestions = []
-
-        for obj in astro_objects:
-            obj_dict = obj.to_dict()
-
-            object_name = obj_dict["object_name"].split(',')[0] if obj_dict["object_name"] else None
-            suggestions.append(
-                {
-                    "id": field_value,
-                    "display_name": f'{field_value} - {object_name}' if object_name else field_value
-                }
-            )
-        return suggestions
-
-    def query_objects_by_name(name):
-        astro_objects_ref = g.db.collection("astro_objects_full")
-
-        # The field name for object_name
-        field_name = 'object_name'
-
-        # Query for documents where the field starts with the given value
-        query_ref = astro_objects_ref.order_by(field_name) \
-                                .start_at({field_name: name}) \
-                                .end_at({field_name: name + '\uf8ff'})
-
-        # Execute the query and print the results
-        astro_objects = query_ref.stream()
-
-        suggestions = []
-
-        for obj in astro_objects:
-            obj_dict = obj.to_dict()
+    def query_objects_by_keywords(query):
+        # The canonical identifier of the query, or its words (see catalog_utils.get_search_keywords)
+        keywords = catalog_utils.get_query_keywords(query)
 
-            object_name = obj_dict["object_name"].split(',')[0] if obj_dict["object_name"] else None
+        if not keywords:
+            return []
 
-            messier_id = obj_dict["messier_id"]
-            ngc_id = obj_dict["ngc_id"]
-            ic_id = obj_dict["ic_id"]
+        # Every object the index would match has a keyword starting with each word: query the store
+        # with the longest (most selective) one, then match and rank the objects as the index does
+        astro_objects = storage_utils.get_astro_objects_store().search_keyword_prefix(max(keywords, key=len))
 
-            id_value = None
-
-            if messier_id:
-                id_value = messier_id
-            elif ngc_id:
-                id_value = ngc_id
-            elif ic_id:
-                id_value = ic_id            
-
-            suggestions.append(
-                {
-                    "id": id_value,
-                    "display_name": f'{id_value} - {object_name}'
-                }
-            )
-        return suggestions
-
-    def query_objects_by_keyword(name):
-        astro_objects_ref = g.db.collection("astro_objects_full")
-
-        # Keyword field names
-        keywords = [
-            'keyword_01',
-            'keyword_02',
-            'keyword_03',
-            'keyword_04',
-            'keyword_05',
-            'keyword_06',
-            'keyword_07'
-        ]
-
-        suggestions = []
-
-        for keyword in keywords:
-            # Query for documents where the field starts with the given value
-            query_ref = astro_objects_ref.order_by(keyword) \
-                                    .start_at({keyword: name.lower()}) \
-                                    .end_at({keyword: name.lower() + '\uf8ff'})
-
-            # Execute the query and print the results
-            astro_objects = query_ref.stream()
-
-            for obj in astro_objects:
-                obj_dict = obj.to_dict()
-
-                object_name = obj_dict["object_name"].split(',')[0] if obj_dict["object_name"] else None
-
-                messier_id = obj_dict["messier_id"]
-                ngc_id = obj_dict["ngc_id"]
-                ic_id = obj_dict["ic_id"]
-
-                id_value = None
-
-                if messier_id:
-                    id_value = messier_id
-                elif ngc_id:
-                    id_value = ngc_id
-                elif ic_id:
-                    id_value = ic_id            
-
-                suggestions.append(
-                    {
-                        "id": id_value,
-                        "display_name": f'{id_value} - {object_name}'
-                    }
-                )
-
-        # suggestions = list(set(suggestions))
-
-        return suggestions
+        return search_utils.search_rows(astro_objects, query)
 
     @app.route('/search_objects', methods=['GET'])
     def search_objects():
         query = request.args.get('query', '').strip()
 
-        astro_objects_ref = g.db.collection("astro_objects_full")
-
-        # TODO: Figure out which identifier to use
-        # Identifier format could be IC123, IC-123, IC 123, NGC321, NGC-321, NGC 321, M31, M-31, M 31
-        # If no identifier match, fallback to common name
-
-        identifier_pattern = r'\b(IC|NGC|M)[\s\-]?(\d+)\b'
-
-        matches = re.findall(identifier_pattern, query)
-
-        suggestions = []
-
-        # Check if we have an identifier
-        if matches:
-            prefix = matches[0][0]
-            number = matches[0][1]
+        # Answer from the in-memory index; the astro objects store is only queried if the catalog is not loaded (yet)
+        if search_utils.search_index.ready:
+            return jsonify(search_utils.search_index.search(query))
 
-            if prefix == "IC":
-                # Query for IC object
-                suggestions = query_objects_by_id("ic_id", f"{prefix}{number}")
-            elif prefix == "NGC":
-                # Query for NGC object
-                suggestions = query_objects_by_id("ngc_id", f"{prefix}{number}")
-            elif prefix == "M":
-                # Query for M object
-                suggestions = query_objects_by_id("messier_id", f"{prefix}{number}")
-        else:
-            suggestions = query_objects_by_keyword(query)
+        suggestions = query_objects_by_keywords(query)
 
         return jsonify(suggestions)
 
@@ -0,0 +1,118 @@
+import datetime
+import os
+import sys
+
+import pytest
+import pytz
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+sys.path.insert(0, ROOT)
+
+from utilities import altaz_utils
+from utilities import catalog_utils
+from utilities import ephemeris_utils
+from utilities import storage_utils
+from utilities import time_utils
+
+# Benchmarks of the planner hot paths (pytest-benchmark), run against SQLite
+# stores in a temporary directory: no Firebase credentials or network access
+# are needed (targets are resolved from the local catalog).
+#
+# Run from the repository root:
+#
+#   python -m pytest benchmarks
+#
+# Compare with the latest saved baseline, failing on a regression:
+#
+#   python -m pytest benchmarks --benchmark-compare --benchmark-compare-fail=median:25%
+#
+# Save a new baseline (e.g. after upgrading astropy or changing an algorithm):
+#
+#   python -m pytest benchmarks --benchmark-save=baseline
+#
+# Baselines are JSON files in benchmarks/baselines/<machine>/ (see
+# pytest.ini). They are only comparable on the same machine and with the same
+# settings: the versions of the libraries, whether the ephemeris table exists
+# (EPHEMERIS_PATH) and FAST_ALTAZ are recorded in their machine_info.
+
+# The location and the months of the optimal times read by the planning benchmarks
+LATITUDE = 43.45
+LONGITUDE = -80.58
+LOCATION_NAME = 'Waterloo'
+START_DATE = datetime.datetime(2025, 1, 1, tzinfo=pytz.utc)
+PLANNED_MONTHS = 3
+
+def add_months(input_datetime, months):
+    month_index = input_datetime.month - 1 + months
+
+    return input_datetime.replace(year=input_datetime.year + month_index // 12, month=month_index % 12 + 1)
+
+# The nights planned by the planning benchmarks (inclusive), within the generated months
+START_DATE_STR = START_DATE.strftime('%Y-%m-%d')
+END_DATE_STR = (add_months(START_DATE, PLANNED_MONTHS) - datetime.timedelta(days=1)).strftime('%Y-%m-%d')
+
+# 100 objects that resolve from the local catalog, so that no target needs a network lookup
+# (see resolver_utils: entries whose declination sign is ambiguous are resolved remotely)
+TARGETS = [{'target_id': f'NGC {number}'} for number in range(1517, 1617)]
+
+def pytest_benchmark_update_machine_info(config, machine_info):
+    import astroplan
+    import astropy
+    import numpy
+
+    machine_info['astroplanner'] = {
+        'astropy': astropy.__version__,
+        'astroplan': astroplan.__version__,
+        'numpy': numpy.__version__,
+        'ephemeris_table': os.path.exists(ephemeris_utils.EPHEMERIS_PATH),
+        'fast_altaz': altaz_utils.FAST_ALTAZ
+    }
+
+@pytest.fixture(scope='session')
+def storage_path(tmp_path_factory):
+    return str(tmp_path_factory.mktemp('storage') / 'storage.sqlite3')
+
+@pytest.fixture(scope='session')
+def optimal_times_store(storage_path):
+    """
+    An optimal times store with PLANNED_MONTHS months generated at the benchmark location.
+    """
+
+    store = storage_utils.SQLiteOptimalTimesStore(storage_path)
+
+    # Also loads the IERS tables and builds astropy's transforms, which would otherwise be timed by the first benchmark
+    time_utils.get_or_generate_optimal_times(START_DATE, add_months(START_DATE, PLANNED_MONTHS), LATITUDE, LONGITUDE, store=store)
+
+    return store
+
+@pytest.fixture(scope='session')
+def astro_objects_store(storage_path):
+    """
+    An astro objects store with the local catalog (see catalog_utils.CATALOG_PATH).
+    """
+
+    store = storage_utils.SQLiteAstroObjectsStore(storage_path)
+    store.set_many((catalog_utils.get_document_id(row), catalog_utils.get_document(row)) for row in catalog_utils.read_catalog())
+
+    return store
+
+@pytest.fixture(scope='session')
+def app(storage_path, optimal_times_store, astro_objects_store, tmp_path_factory):
+    """
+    The application with the 'sqlite' backend, using the stores above.
+    """
+
+    import app as app_module
+    from utilities import job_utils
+
+    # No job worker: the benchmarks do not submit jobs, and the job tables are created in a temporary directory
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(storage_utils, 'STORAGE_SQLITE_PATH', storage_path)
+        monkeypatch.setattr(job_utils, 'JOBS_DB_PATH', str(tmp_path_factory.mktemp('jobs') / 'jobs.sqlite3'))
+
+        yield app_module.create_app({'STORAGE_BACKEND': 'sqlite', 'PREWARM': False, 'JOB_WORKER': False})
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
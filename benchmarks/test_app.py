@@ -0,0 +1,33 @@
+import pytest
+
+from conftest import END_DATE_STR, LATITUDE, LOCATION_NAME, LONGITUDE, START_DATE_STR, TARGETS
+
+# End-to-end latency of the endpoints through the Flask test client: argument
+# parsing, the planner, JSON serialization, compression and the after-request
+# hooks. The optimal times come from the process-local cache after the first round.
+
+LOCATION_ARGS = f'latitude={LATITUDE}&longitude={LONGITUDE}&location_name={LOCATION_NAME}'
+
+GET_PATHS = {
+    'get_optimal_target_times': f'/get_optimal_target_times?start_date={START_DATE_STR}&end_date={END_DATE_STR}&{LOCATION_ARGS}'
+                                '&target_id=M31&target_name=Andromeda&min_altitude=30&min_session_length=60',
+    'target_calendar': f'/target_calendar?start_date={START_DATE_STR}&end_date={END_DATE_STR}&{LOCATION_ARGS}&target_id=M31&min_altitude=30',
+    'get_optimal_times': f'/get_optimal_times?start_date={START_DATE_STR}%2000:00&end_date={END_DATE_STR}%2000:00&{LOCATION_ARGS}'
+                         '&local_timezone=America/Toronto',
+    'search_objects': '/search_objects?query=andromeda'
+}
+
+@pytest.mark.parametrize('endpoint', list(GET_PATHS))
+def test_get(benchmark, client, endpoint):
+    response = benchmark(client.get, GET_PATHS[endpoint], headers={'Accept-Encoding': 'gzip'})
+
+    assert response.status_code == 200
+
+def test_plan_targets(benchmark, client):
+    body = {'start_date': START_DATE_STR, 'end_date': END_DATE_STR, 'latitude': LATITUDE, 'longitude': LONGITUDE,
+            'location_name': LOCATION_NAME, 'targets': TARGETS, 'min_altitude': 30, 'min_session_length': 60}
+
+    benchmark.extra_info['targets'] = len(TARGETS)
+    response = benchmark(client.post, '/plan_targets', json=body, headers={'Accept-Encoding': 'gzip'})
+
+    assert response.status_code == 200
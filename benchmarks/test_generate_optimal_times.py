@@ -0,0 +1,34 @@
+import itertools
+
+import pytest
+
+from conftest import LATITUDE, LONGITUDE, START_DATE, add_months
+from utilities import storage_utils
+from utilities import time_utils
+
+# Generation of the optimal times of 1, 6 and 12 months, as the app does it:
+# month by month through time_utils.get_or_generate_month_optimal_times (the
+# claim, the darkness computation and the write of one document per month).
+# Each round starts from an empty store and cache. Rounds take seconds, so
+# few are run (optimal_times_store is only used so that astropy is warmed up first).
+
+def _generate_months(store, first_day_of_month_list):
+    return [time_utils.get_or_generate_month_optimal_times(store, first_day_of_month, LATITUDE, LONGITUDE)
+            for first_day_of_month in first_day_of_month_list]
+
+@pytest.mark.parametrize('months', [1, 6, 12])
+def test_generate_months_optimal_times(benchmark, optimal_times_store, tmp_path, months):
+    first_day_of_month_list = [add_months(START_DATE, month) for month in range(months)]
+    rounds = itertools.count()
+
+    def setup():
+        time_utils.optimal_times_cache.clear()
+        store = storage_utils.SQLiteOptimalTimesStore(str(tmp_path / f'optimal_times_{next(rounds)}.sqlite3'))
+
+        return (store, first_day_of_month_list), {}
+
+    benchmark.extra_info['months'] = months
+    months_times = benchmark.pedantic(_generate_months, setup=setup, rounds=3, iterations=1)
+
+    assert len(months_times) == months
+    assert all(len(month_times) > 0 for month_times in months_times)
@@ -0,0 +1,26 @@
+from utilities import catalog_utils
+from utilities import search_utils
+
+# /search_objects: the in-memory index (search_utils), and the astro objects
+# store it falls back to while the index is not loaded. Each round runs
+# every query, so the queries per second are QUERIES / the round time.
+
+QUERIES = ['m31', 'andromeda', 'ngc 7000', 'ngc 70', 'ic 434', 'orion', 'horse', 'crab nebula', 'm', 'pleiades',
+           'whirlpool', 'ngc 869', 'double cluster', 'veil', 'm4', 'eagle', 'ring nebula', 'sombrero', 'ngc', 'triangulum']
+
+def test_search_index(benchmark):
+    index = search_utils.SearchIndex()
+    index.load()
+
+    benchmark.extra_info['queries'] = len(QUERIES)
+    results = benchmark(lambda: [index.search(query) for query in QUERIES])
+
+    assert any(results)
+
+def test_search_store_prefix(benchmark, astro_objects_store):
+    prefixes = [max(catalog_utils.get_query_keywords(query), key=len) for query in QUERIES]
+
+    benchmark.extra_info['queries'] = len(QUERIES)
+    results = benchmark(lambda: [astro_objects_store.search_keyword_prefix(prefix) for prefix in prefixes])
+
+    assert any(results)
@@ -0,0 +1,34 @@
+import pytest
+
+from conftest import END_DATE_STR, LATITUDE, LOCATION_NAME, LONGITUDE, START_DATE_STR, TARGETS
+from utilities import target_utils
+from utilities import time_utils
+
+# target_utils: the observing sessions of one target, and of a batch of
+# targets computed in one broadcast altitude computation. 'cold' reads and
+# decodes the optimal times from the store, 'cached' gets them from the
+# process-local cache (time_utils.optimal_times_cache).
+
+def _clear_cache():
+    time_utils.optimal_times_cache.clear()
+
+def _setup(cache):
+    return _clear_cache if cache == 'cold' else None
+
+@pytest.mark.parametrize('cache', ['cold', 'cached'])
+def test_get_optimal_target_times(benchmark, optimal_times_store, cache):
+    sessions = benchmark.pedantic(target_utils.get_optimal_target_times,
+                                  args=(START_DATE_STR, END_DATE_STR, LATITUDE, LONGITUDE, LOCATION_NAME, 'M31', 'Andromeda Galaxy', 30, 60),
+                                  kwargs={'store': optimal_times_store}, setup=_setup(cache), rounds=20, warmup_rounds=1)
+
+    assert len(sessions) > 0
+
+@pytest.mark.parametrize('cache', ['cold', 'cached'])
+def test_get_optimal_targets_times(benchmark, optimal_times_store, cache):
+    benchmark.extra_info['targets'] = len(TARGETS)
+    plans = benchmark.pedantic(target_utils.get_optimal_targets_times,
+                               args=(START_DATE_STR, END_DATE_STR, LATITUDE, LONGITUDE, LOCATION_NAME, TARGETS, 30, 60),
+                               kwargs={'store': optimal_times_store}, setup=_setup(cache), rounds=10, warmup_rounds=1)
+
+    assert len(plans) == len(TARGETS)
+    assert not any('error' in plan for plan in plans)
@@ -0,0 +1,72 @@
+import argparse
+import datetime
+import os
+import sys
+import time
+
+import numpy as np
+import pytz
+from astroplan import Observer
+from astropy.time import Time, TimeDelta
+from astropy import units as u, coordinates as coord
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from utilities import altaz_utils
+from utilities import time_utils
+
+# Benchmarks the analytic alt/az kernel (utilities/altaz_utils.py) against
+# Observer.altaz for the work done per request: the Sun and Moon over a
+# month of 15-minute samples, and a batch of targets over the same grid.
+# See scripts/validate_fast_altaz.py for its accuracy.
+
+def best_of(repeat, function):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the analytic alt/az kernel.')
+    parser.add_argument('--start-date', default='2024-01-01')
+    parser.add_argument('--days', type=int, default=31)
+    parser.add_argument('--latitude', type=float, default=43.4494)
+    parser.add_argument('--longitude', type=float, default=-80.5752)
+    parser.add_argument('--targets', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    start_datetime_utc = pytz.utc.localize(datetime.datetime.strptime(args.start_date, '%Y-%m-%d'))
+    sample_count = args.days * 24 * 3600 // time_utils.OPTIMAL_TIMES_INTERVAL_SECONDS
+    times = Time(start_datetime_utc) + TimeDelta(np.arange(sample_count) * time_utils.OPTIMAL_TIMES_INTERVAL_SECONDS, format='sec')
+
+    observer = Observer(latitude=args.latitude * u.deg, longitude=args.longitude * u.deg, elevation=329 * u.m)
+
+    sun = coord.get_sun(times)
+    moon = coord.get_body("moon", times)
+
+    # Warm up (IERS tables)
+    observer.altaz(times[:2], sun[:2])
+
+    print(f"{'case':>14} {'samples':>9} {'astropy (s)':>12} {'fast (s)':>9} {'speedup':>8}")
+
+    def report(case, samples, astropy_seconds, fast_seconds):
+        print(f"{case:>14} {samples:>9} {astropy_seconds:>12.4f} {fast_seconds:>9.4f} {astropy_seconds / fast_seconds:>7.0f}x")
+
+    astropy_seconds = best_of(args.repeat, lambda: (observer.altaz(times, sun).alt, observer.altaz(times, moon).alt))
+    fast_seconds = best_of(args.repeat, lambda: (altaz_utils.get_observer_altitudes(observer, times, sun), altaz_utils.get_observer_altitudes(observer, times, moon)))
+    report('sun + moon', 2 * sample_count, astropy_seconds, fast_seconds)
+
+    rng = np.random.default_rng(0)
+
+    for target_count in args.targets:
+        targets = coord.SkyCoord(ra=rng.uniform(0, 360, target_count) * u.deg, dec=rng.uniform(-60, 90, target_count) * u.deg)
+
+        astropy_seconds = best_of(args.repeat, lambda: observer.altaz(times, targets, grid_times_targets=True).alt)
+        fast_seconds = best_of(args.repeat, lambda: altaz_utils.get_observer_altitudes(observer, times, targets, grid_times_targets=True))
+        report(f'{target_count} targets', target_count * sample_count, astropy_seconds, fast_seconds)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+import argparse
+import datetime
+import os
+import sys
+import time
+
+import pytz
+from astroplan import Observer, moon_illumination
+from astropy.time import Time, TimeDelta
+from astropy import units as u, coordinates as coord
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from utilities import geo_utils
+from utilities import time_utils
+
+# Benchmarks the vectorized darkness engine (time_utils.compute_optimal_times)
+# against the original sample-by-sample loop, and checks that both produce
+# the same optimal times.
+
+def legacy_optimal_times(start_datetime_utc, end_datetime_utc, latitude, longitude):
+    # The original implementation of generate_optimal_times, without the Firestore write
+    loc_elevation = geo_utils.get_elevation(latitude, longitude)
+    loc_timezone_str = geo_utils.get_timezone(latitude, longitude)
+    loc_timezone = pytz.timezone(loc_timezone_str)
+
+    start_date_local = start_datetime_utc.astimezone(loc_timezone)
+    end_date_local = end_datetime_utc.astimezone(loc_timezone)
+
+    observer = Observer(latitude=latitude * u.deg,
+                        longitude=longitude * u.deg,
+                        elevation=loc_elevation * u.m,
+                        timezone=loc_timezone_str)
+
+    start_date = Time(start_date_local.astimezone(pytz.UTC))
+    end_date = Time(end_date_local.astimezone(pytz.UTC))
+
+    interval = TimeDelta(15*60, format='sec')
+
+    times = []
+    current_time = start_date
+    while current_time < end_date:
+        times.append(current_time)
+        current_time += interval
+
+    times = Time(times)
+
+    sun_alt = observer.altaz(times, coord.get_sun(times)).alt
+    moon_alt = observer.altaz(times, coord.get_body("moon", times)).alt
+
+    optimal_times = []
+    for index in range(len(times)):
+        if sun_alt[index].deg < -18:
+            if moon_alt[index].deg < -5 or moon_illumination(times[index]) < 0.1:
+                optimal_times.append(times[index])
+
+    return optimal_times
+
+def add_months(input_datetime, months):
+    for _ in range(months):
+        input_datetime = time_utils.get_first_day_of_next_month(input_datetime)
+    return input_datetime
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark optimal times generation.')
+    parser.add_argument('--start-date', default='2023-08-01')
+    parser.add_argument('--latitude', type=float, default=43.4494)
+    parser.add_argument('--longitude', type=float, default=-80.5752)
+    parser.add_argument('--months', type=int, nargs='+', default=[1, 6, 12])
+    parser.add_argument('--skip-legacy', action='store_true', help='Only time the vectorized implementation')
+    args = parser.parse_args()
+
+    start_datetime_utc = pytz.utc.localize(datetime.datetime.strptime(args.start_date, '%Y-%m-%d'))
+
+    # Warm up astropy (IERS tables, ephemeris) so the first measurement is not skewed
+    time_utils.compute_optimal_times(start_datetime_utc, start_datetime_utc + datetime.timedelta(days=1), args.latitude, args.longitude)
+
+    print(f"{'months':>6} {'samples':>8} {'legacy (s)':>11} {'vectorized (s)':>15} {'speedup':>8}")
+
+    for months in args.months:
+        end_datetime_utc = add_months(start_datetime_utc, months)
+
+        started = time.perf_counter()
+        vectorized_times = time_utils.compute_optimal_times(start_datetime_utc, end_datetime_utc, args.latitude, args.longitude)
+        vectorized_seconds = time.perf_counter() - started
+
+        if args.skip_legacy:
+            print(f"{months:>6} {len(vectorized_times):>8} {'-':>11} {vectorized_seconds:>15.3f} {'-':>8}")
+            continue
+
+        started = time.perf_counter()
+        legacy_times = legacy_optimal_times(start_datetime_utc, end_datetime_utc, args.latitude, args.longitude)
+        legacy_seconds = time.perf_counter() - started
+
+        legacy_iso = [t.isot for t in legacy_times]
+        vectorized_iso = vectorized_times.isot.tolist()
+
+        if legacy_iso != vectorized_iso:
+            print(f"Mismatch for {months} month(s): legacy has {len(legacy_iso)} samples, vectorized has {len(vectorized_iso)}")
+            sys.exit(1)
+
+        print(f"{months:>6} {len(vectorized_iso):>8} {legacy_seconds:>11.3f} {vectorized_seconds:>15.3f} {legacy_seconds / vectorized_seconds:>7.1f}x")
+
+if __name__ == '__main__':
+    main()
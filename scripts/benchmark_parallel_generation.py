@@ -0,0 +1,73 @@
+import argparse
+import datetime
+import os
+import sys
+import time
+
+import numpy as np
+import pytz
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from utilities import time_utils
+
+# Measures how parallel generation (time_utils.compute_months_optimal_times_parallel)
+# scales with the number of worker processes when pre-warming a new site, and
+# checks that every worker count produces the same optimal times.
+
+def add_months(input_datetime, months):
+    for _ in range(months):
+        input_datetime = time_utils.get_first_day_of_next_month(input_datetime)
+    return input_datetime
+
+def run(first_day_of_month_list, latitude, longitude, workers, chunk_days):
+    with time_utils.create_process_pool(workers) as executor:
+        # Start every process (and import astropy in it) before timing
+        warm_up_start = first_day_of_month_list[0]
+        warm_up_end = warm_up_start + datetime.timedelta(hours=1)
+        list(executor.map(time_utils.compute_optimal_times_unix, [warm_up_start] * workers, [warm_up_end] * workers, [latitude] * workers, [longitude] * workers))
+
+        started = time.perf_counter()
+
+        months_times = {}
+        for months in time_utils.compute_months_optimal_times_parallel(first_day_of_month_list, latitude, longitude, executor, workers, chunk_days):
+            months_times.update(months)
+
+        return time.perf_counter() - started, months_times
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark parallel optimal times generation.')
+    parser.add_argument('--start-date', default='2024-01-01')
+    parser.add_argument('--months', type=int, default=12)
+    parser.add_argument('--latitude', type=float, default=43.4494)
+    parser.add_argument('--longitude', type=float, default=-80.5752)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument('--chunk-days', type=int, default=None, help='Days per task (default: whole months, or an even split when there are fewer months than workers)')
+    args = parser.parse_args()
+
+    start_datetime_utc = pytz.utc.localize(datetime.datetime.strptime(args.start_date, '%Y-%m-%d'))
+    first_day_of_month_list = time_utils.get_first_days_of_month_for_time_range(start_datetime_utc, add_months(start_datetime_utc, args.months) - datetime.timedelta(seconds=1))
+
+    print(f"{'workers':>7} {'tasks':>6} {'seconds':>8} {'speedup':>8} {'efficiency':>11}")
+
+    worker_counts = sorted(set(args.workers))
+
+    baseline_seconds = None
+    baseline_times = None
+
+    for workers in worker_counts:
+        seconds, months_times = run(first_day_of_month_list, args.latitude, args.longitude, workers, args.chunk_days)
+        tasks = len(time_utils.get_generation_chunks(first_day_of_month_list, workers, args.chunk_days))
+
+        if baseline_times is None:
+            baseline_seconds = seconds
+            baseline_times = months_times
+        elif any(not np.array_equal(months_times[month], baseline_times[month]) for month in first_day_of_month_list):
+            print(f"Mismatch with {workers} workers")
+            sys.exit(1)
+
+        speedup = baseline_seconds / seconds
+        print(f"{workers:>7} {tasks:>6} {seconds:>8.2f} {speedup:>7.1f}x {speedup * worker_counts[0] / workers:>10.0%}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pytz
+from astropy.time import Time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from utilities import session_utils
+
+# Benchmarks the NumPy session engine (session_utils.find_sessions) against the
+# original per-sample loop from target_utils, on a synthetic year of optimal
+# times (dark from 22:00 to 04:00 UTC) and a target altitude curve with a
+# sidereal period.
+
+def legacy_sessions(optimal_times, target_alt_deg, min_altitude, min_session_length, local_timezone):
+    # The original loop from target_utils.get_optimal_target_times
+    time_list = []
+
+    for time, alt in zip(optimal_times, target_alt_deg):
+        if alt >= float(min_altitude):
+            time_list.append(time.to_datetime(timezone=local_timezone))
+
+    if len(time_list) == 0:
+        return []
+
+    blocks = []
+    current_block = [time_list[0]]
+
+    for i in range(1, len(time_list)):
+        if (time_list[i] - time_list[i - 1]).seconds <= 20 * 60:
+            current_block.append(time_list[i])
+        else:
+            blocks.append(current_block)
+            current_block = [time_list[i]]
+
+    blocks.append(current_block)
+
+    sessions = []
+
+    for block in blocks:
+        start_date = block[0]
+        end_date = block[-1]
+        duration = (end_date - start_date).total_seconds() / 60
+        if duration >= float(min_session_length) and duration < 1440:
+            sessions.append({'start': start_date.astimezone(local_timezone).strftime('%Y-%m-%d %H:%M:%S'), 'end': end_date.astimezone(local_timezone).strftime('%Y-%m-%d %H:%M:%S'), 'duration': duration})
+
+    return sessions
+
+def synthetic_samples(days):
+    start = Time('2023-01-01T00:00:00').unix
+    grid = start + np.arange(days * 96) * 15 * 60
+
+    hours = (grid % 86400) / 3600
+    dark = (hours >= 22) | (hours < 4)
+
+    unix_times = grid[dark]
+    target_alt_deg = 60 * np.sin(2 * np.pi * (unix_times - start) / 86164.0905)
+
+    return unix_times, target_alt_deg
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark session block merging.')
+    parser.add_argument('--days', type=int, nargs='+', default=[30, 182, 365])
+    parser.add_argument('--timezone', default='America/Toronto')
+    args = parser.parse_args()
+
+    local_timezone = pytz.timezone(args.timezone)
+
+    print(f"{'days':>5} {'samples':>8} {'sessions':>9} {'loop (s)':>9} {'numpy (s)':>10} {'speedup':>8}")
+
+    for days in args.days:
+        unix_times, target_alt_deg = synthetic_samples(days)
+        optimal_times = Time(unix_times, format='unix')
+
+        started = time.perf_counter()
+        expected = legacy_sessions(optimal_times, target_alt_deg, 30, 60, local_timezone)
+        loop_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        sessions = session_utils.find_sessions(optimal_times.unix, target_alt_deg >= 30, local_timezone, 60)
+        numpy_seconds = time.perf_counter() - started
+
+        if sessions != expected:
+            print(f"Mismatch for {days} day(s): loop has {len(expected)} sessions, numpy has {len(sessions)}")
+            sys.exit(1)
+
+        print(f"{days:>5} {len(unix_times):>8} {len(sessions):>9} {loop_seconds:>9.3f} {numpy_seconds:>10.4f} {loop_seconds / numpy_seconds:>7.0f}x")
+
+if __name__ == '__main__':
+    main()
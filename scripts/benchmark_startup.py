@@ -0,0 +1,81 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Measures the cold start of the app: importing app.py, create_app() and the
+# first request, each in a fresh Python process (so nothing is already
+# imported or cached). With --importtime, also lists the modules that take
+# the longest to import (python -X importtime).
+#
+# Runs with the 'sqlite' storage backend by default, so no Firebase
+# credentials are needed (see storage_utils).
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+_CHILD = """
+import json, sys, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+flask_app = app.create_app({'PREWARM': %(prewarm)r})
+created = time.perf_counter()
+response = flask_app.test_client().get(%(path)r)
+responded = time.perf_counter()
+print(json.dumps({'import': imported - started, 'create_app': created - imported, 'first_request': responded - created, 'status': response.status_code}))
+"""
+
+def run_child(args, env):
+    code = _CHILD % {'prewarm': args.prewarm, 'path': args.path}
+    output = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env, capture_output=True, text=True, check=True).stdout
+
+    return json.loads(output.strip().splitlines()[-1])
+
+def print_import_times(env, top):
+    # -X importtime writes one line per module to stderr: self (us) | cumulative (us) | module
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=ROOT, env=env, capture_output=True, text=True, check=True).stderr
+
+    modules = []
+
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+
+        self_us, cumulative_us, name = [part.strip() for part in line[len('import time:'):].split('|')]
+        modules.append((int(cumulative_us), int(self_us), name))
+
+    print(f"\n{'cumulative (ms)':>16} {'self (ms)':>10}  module (import app)")
+
+    for cumulative_us, self_us, name in sorted(modules, reverse=True)[:top]:
+        print(f"{cumulative_us / 1000:>16.1f} {self_us / 1000:>10.1f}  {name}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the cold start of the app.')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--backend', choices=['firestore', 'sqlite'], default='sqlite')
+    parser.add_argument('--prewarm', action='store_true', help='Start the pre-warm thread (see warmup_utils)')
+    parser.add_argument('--path', default='/search_objects?query=m31', help='The first request')
+    parser.add_argument('--importtime', type=int, default=0, metavar='N', help='List the N slowest imports')
+    args = parser.parse_args()
+
+    env = dict(os.environ, STORAGE_BACKEND=args.backend)
+
+    results = [run_child(args, env) for _ in range(args.runs)]
+
+    print(f"{args.runs} cold starts, backend {args.backend}, prewarm {args.prewarm}, first request GET {args.path} ({results[0]['status']})")
+    print(f"{'phase':>14} {'median (s)':>11} {'min (s)':>8} {'max (s)':>8}")
+
+    for phase in ['import', 'create_app', 'first_request']:
+        seconds = [result[phase] for result in results]
+        print(f"{phase:>14} {statistics.median(seconds):>11.3f} {min(seconds):>8.3f} {max(seconds):>8.3f}")
+
+    total = [result['import'] + result['create_app'] + result['first_request'] for result in results]
+    print(f"{'total':>14} {statistics.median(total):>11.3f} {min(total):>8.3f} {max(total):>8.3f}")
+
+    if args.importtime:
+        print_import_times(env, args.importtime)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+import argparse
+import datetime
+import os
+import sys
+import time
+
+import numpy as np
+import pytz
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from utilities import ephemeris_utils
+
+# Builds the table of geocentric Sun/Moon positions and Moon illumination
+# read by utilities/ephemeris_utils.py. The table does not depend on the
+# observer, so one file serves every location; it is written once and then
+# memory-mapped by every process of the app.
+#
+# Example (about 45 MB for 20 years):
+#   python scripts/build_ephemeris.py --start-year 2020 --end-year 2039
+
+def main():
+    current_year = datetime.datetime.now(pytz.utc).year
+
+    parser = argparse.ArgumentParser(description='Build the Sun/Moon ephemeris table.')
+    parser.add_argument('--start-year', type=int, default=current_year - 1)
+    parser.add_argument('--end-year', type=int, default=current_year + 5, help='Last year in the table (inclusive)')
+    parser.add_argument('--output', default=ephemeris_utils.EPHEMERIS_PATH)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+
+    # One year at a time, to bound the memory used by astropy
+    tables = []
+
+    for year in range(args.start_year, args.end_year + 1):
+        start_unix = int(datetime.datetime(year, 1, 1, tzinfo=pytz.utc).timestamp())
+        end_unix = int(datetime.datetime(year + 1, 1, 1, tzinfo=pytz.utc).timestamp())
+
+        tables.append(ephemeris_utils.build_ephemeris(start_unix, end_unix))
+        print(f"{year}: {len(tables[-1])} samples")
+
+    table = np.concatenate(tables)
+
+    # Write to a temporary file and rename it, so running processes never map a partial table
+    temporary_path = args.output + '.tmp.npy'
+    np.save(temporary_path, table)
+    os.replace(temporary_path, args.output)
+
+    print(f"Wrote {len(table)} samples ({os.path.getsize(args.output) / 1e6:.1f} MB) to {args.output} in {time.perf_counter() - started:.1f}s")
+
+if __name__ == '__main__':
+    main()
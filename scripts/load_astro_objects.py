@@ -1,50 +1,59 @@
-import firebase_admin
-from firebase_admin import credentials
-from firebase_admin import firestore
+import argparse
+import os
+import sys
 
-import csv
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
 
-def add_keywords(obj):
-    object_names = obj["object_name"].split(",")
+from utilities import batch_utils
+from utilities import catalog_utils
+from utilities import db_utils
+from utilities import storage_utils
 
-    keywords = []
-    for name in object_names:
-        keywords += name.split(" ")
+# Loads the catalog CSV into 'astro_objects_full'. Rows are streamed from the
+# file and written in batches, with a few batches committed concurrently.
+# Every object is stored under its canonical identifier (e.g. 'M31'), so a
+# load that stopped part way can simply be run again. Search fields are a
+# 'keywords' array, a 'keyword_prefixes' array and an 'aliases' array (see
+# catalog_utils.get_document).
+# With --backend sqlite, the catalog is loaded into the local database of
+# the 'sqlite' storage backend instead (see storage_utils).
 
-    # Remove duplicates
-    keywords = list(set(keywords))
+def get_documents(path):
+    # Stream (document_id, data) pairs from the catalog
+    for row in catalog_utils.read_catalog(path):
+        yield catalog_utils.get_document_id(row), catalog_utils.get_document(row)
 
-    for index, keyword in enumerate(keywords):
-        obj[f"keyword_0{index+1}"] = keyword.lower()
+def main():
+    parser = argparse.ArgumentParser(description='Load the catalog CSV into Firestore (or the local SQLite store).')
+    parser.add_argument('--catalog', default=catalog_utils.CATALOG_PATH)
+    parser.add_argument('--backend', choices=['firestore', 'sqlite'], default='firestore')
+    parser.add_argument('--sqlite-path', default=storage_utils.STORAGE_SQLITE_PATH)
+    parser.add_argument('--credentials', default='astroplanner-25d27-firebase-adminsdk-tv1sf-3516a4d7d5.json')
+    parser.add_argument('--collection', default='astro_objects_full')
+    parser.add_argument('--batch-size', type=int, default=batch_utils.MAX_BATCH_SIZE)
+    parser.add_argument('--concurrency', type=int, default=4, help='Batches committed at once')
+    args = parser.parse_args()
 
-    return obj
+    def report(written, seconds):
+        print(f"{written} rows written ({written / seconds:.0f} rows/s)", flush=True)
 
-# List to hold the JSON objects
-json_list = []
+    if args.backend == 'sqlite':
+        written = storage_utils.SQLiteAstroObjectsStore(args.sqlite_path).set_many(get_documents(args.catalog), on_progress=report)
 
-# Use a service account.
-cred = credentials.Certificate('astroplanner-25d27-firebase-adminsdk-tv1sf-3516a4d7d5.json')
+        print(f"Done: {written} rows written")
+        return
 
-app = firebase_admin.initialize_app(cred)
+    # Use a service account.
+    storage_utils.init_firebase(args.credentials)
 
-db = firestore.client()
+    db = db_utils.get_client()
 
-astro_objects_ref = db.collection("astro_objects_full")
+    astro_objects_ref = db.collection(args.collection)
 
-# Open the CSV file
-with open('full_catalog.csv', mode='r') as csv_file:
-    reader = csv.DictReader(csv_file)
+    written = batch_utils.write_documents(db, astro_objects_ref, get_documents(args.catalog),
+                                          batch_size=args.batch_size, concurrency=args.concurrency, on_progress=report)
 
-    obj = None
+    print(f"Done: {written} rows written")
 
-    # Iterate over each row
-    for row in reader:
-        obj = row
-        if obj["object_name"]:
-            obj = add_keywords(obj)
-
-        # Append the row to the JSON list (no need to explicitly convert to JSON here)
-        json_list.append(obj)
-
-for item in json_list:
-    astro_objects_ref.add(item)
+if __name__ == '__main__':
+    main()
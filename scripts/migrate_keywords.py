@@ -0,0 +1,66 @@
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from utilities import batch_utils
+from utilities import catalog_utils
+from utilities import db_utils
+from utilities import storage_utils
+
+# Converts the 'astro_objects_full' documents written by the previous loader
+# to the current schema (see catalog_utils.get_document): the numbered
+# keyword_01, keyword_02, ... fields become one 'keywords' array, with the
+# canonical identifiers as 'aliases'. Documents in the current schema are
+# rewritten as is, so running it again adds fields added to the schema since
+# (e.g. 'keyword_prefixes', used by the /search_objects fallback).
+#
+# The previous loader used random document IDs. Documents are first written
+# under their canonical identifier (e.g. 'M31'); only then are the
+# documents with a random ID deleted. If the migration stops part way, run
+# it again.
+
+def get_converted_documents(collection_ref):
+    # Stream every document in the current schema, under its deterministic ID
+    for snapshot in collection_ref.stream():
+        row = snapshot.to_dict()
+        yield catalog_utils.get_document_id(row), catalog_utils.get_document(row)
+
+def get_stale_documents(collection_ref):
+    # Stream the IDs of the documents that are not stored under their deterministic ID
+    for snapshot in collection_ref.stream():
+        if snapshot.id != catalog_utils.get_document_id(snapshot.to_dict()):
+            yield snapshot.id, None
+
+def main():
+    parser = argparse.ArgumentParser(description='Migrate astro objects to the keywords array schema.')
+    parser.add_argument('--credentials', default='astroplanner-25d27-firebase-adminsdk-tv1sf-3516a4d7d5.json')
+    parser.add_argument('--collection', default='astro_objects_full')
+    parser.add_argument('--batch-size', type=int, default=batch_utils.MAX_BATCH_SIZE)
+    parser.add_argument('--concurrency', type=int, default=4, help='Batches committed at once')
+    args = parser.parse_args()
+
+    # Use a service account.
+    storage_utils.init_firebase(args.credentials)
+
+    db = db_utils.get_client()
+
+    astro_objects_ref = db.collection(args.collection)
+
+    def report(written, seconds):
+        print(f"{written} documents ({written / seconds:.0f} documents/s)", flush=True)
+
+    print("Writing documents in the new schema")
+    converted = batch_utils.write_documents(db, astro_objects_ref, get_converted_documents(astro_objects_ref),
+                                            batch_size=args.batch_size, concurrency=args.concurrency, on_progress=report)
+
+    # Only once every document exists under its new ID
+    print("Deleting documents with a random ID")
+    deleted = batch_utils.write_documents(db, astro_objects_ref, get_stale_documents(astro_objects_ref),
+                                          batch_size=args.batch_size, concurrency=args.concurrency, on_progress=report)
+
+    print(f"Done: {converted} documents converted, {deleted} deleted")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+import argparse
+import datetime
+import os
+import sys
+import warnings
+
+import numpy as np
+import pytz
+from astroplan import Observer
+from astropy.time import Time
+from astropy import units as u, coordinates as coord
+from erfa import ErfaWarning
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from utilities import altaz_utils
+from utilities import time_utils
+
+# Checks the analytic alt/az kernel (utilities/altaz_utils.py) against
+# astropy over a multi-year grid of times, for several observer latitudes:
+# the maximum altitude deviation of the Sun, the Moon and a spread of fixed
+# targets, and how many samples land on the other side of the thresholds
+# used by the app. Exits with status 1 if a deviation exceeds --max-arcmin.
+
+# Altitude thresholds (degrees): Sun and Moon darkness limits, and a typical min_altitude
+SUN_THRESHOLD = -18
+MOON_THRESHOLD = -5
+TARGET_THRESHOLD = 30
+
+def get_targets():
+    # Fixed targets every 30 degrees of RA and 20 degrees of declination
+    ra, dec = np.meshgrid(np.arange(0, 360, 30), np.arange(-80, 81, 20))
+    return coord.SkyCoord(ra=ra.ravel() * u.deg, dec=dec.ravel() * u.deg)
+
+def compare(name, astropy_alt, fast_alt, threshold):
+    deviation = np.abs(fast_alt - astropy_alt) * 60
+    flips = np.count_nonzero((astropy_alt < threshold) != (fast_alt < threshold))
+
+    print(f"{name:>8} {deviation.max():>12.3f} {np.percentile(deviation, 99):>12.3f} {flips:>7} / {astropy_alt.size}")
+
+    return deviation.max()
+
+def main():
+    parser = argparse.ArgumentParser(description='Validate the analytic alt/az kernel against astropy.')
+    parser.add_argument('--start-year', type=int, default=2020)
+    parser.add_argument('--end-year', type=int, default=2035, help='Last year of the grid (inclusive)')
+    parser.add_argument('--samples', type=int, default=20000, help='Number of times in the grid')
+    parser.add_argument('--latitudes', type=float, nargs='+', default=[-60, -33.9, 0, 19.8, 43.4494, 65])
+    parser.add_argument('--longitude', type=float, default=-80.5752)
+    parser.add_argument('--max-arcmin', type=float, default=1.0, help='Fail if any deviation is larger (arcminutes)')
+    parser.add_argument('--month', default='2024-03-01', help='Also compare the optimal times of this month for every latitude')
+    args = parser.parse_args()
+
+    # Leap seconds are not known for future years; that affects astropy and the kernel alike
+    warnings.simplefilter('ignore', ErfaWarning)
+
+    start_unix = datetime.datetime(args.start_year, 1, 1, tzinfo=pytz.utc).timestamp()
+    end_unix = datetime.datetime(args.end_year + 1, 1, 1, tzinfo=pytz.utc).timestamp()
+
+    # Irregular spacing, so the grid does not alias with the day or the lunar month
+    rng = np.random.default_rng(0)
+    times = Time(np.sort(rng.uniform(start_unix, end_unix, args.samples)), format='unix')
+
+    sun = coord.get_sun(times)
+    moon = coord.get_body("moon", times)
+    targets = get_targets()
+
+    worst = 0.0
+
+    for latitude in args.latitudes:
+        observer = Observer(latitude=latitude * u.deg, longitude=args.longitude * u.deg, elevation=329 * u.m)
+
+        print(f"\nLatitude {latitude}, {args.start_year}-{args.end_year}")
+        print(f"{'object':>8} {'max (arcmin)':>12} {'p99 (arcmin)':>12} {'flips':>17}")
+
+        worst = max(worst, compare('sun', observer.altaz(times, sun).alt.deg, altaz_utils.get_observer_altitudes(observer, times, sun), SUN_THRESHOLD))
+        worst = max(worst, compare('moon', observer.altaz(times, moon).alt.deg, altaz_utils.get_observer_altitudes(observer, times, moon), MOON_THRESHOLD))
+
+        # A smaller time grid for the targets, to keep the astropy side reasonable
+        target_times = times[::10]
+        worst = max(worst, compare('targets',
+                                   observer.altaz(target_times, targets, grid_times_targets=True).alt.deg,
+                                   altaz_utils.get_observer_altitudes(observer, target_times, targets, grid_times_targets=True),
+                                   TARGET_THRESHOLD))
+
+    if args.month:
+        first_day_of_month = pytz.utc.localize(datetime.datetime.strptime(args.month, '%Y-%m-%d'))
+        next_month = time_utils.get_first_day_of_next_month(first_day_of_month)
+
+        print(f"\nOptimal times of {args.month}: samples that differ between astropy and the fast kernel")
+
+        for latitude in args.latitudes:
+            altaz_utils.FAST_ALTAZ = False
+            astropy_times = time_utils.compute_optimal_times(first_day_of_month, next_month, latitude, args.longitude).unix
+            altaz_utils.FAST_ALTAZ = True
+            fast_times = time_utils.compute_optimal_times(first_day_of_month, next_month, latitude, args.longitude).unix
+
+            print(f"{latitude:>8} {len(np.setxor1d(astropy_times, fast_times)):>5} of {len(astropy_times)}")
+
+    print(f"\nMaximum deviation: {worst:.3f} arcmin (limit {args.max_arcmin})")
+
+    if worst > args.max_arcmin:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
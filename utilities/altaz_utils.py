@@ -0,0 +1,153 @@
+# altaz_utils.py
+
+from astropy import units as u
+import numpy as np
+import os
+
+# Use the analytic kernel below instead of astropy's frame transforms for the Sun, Moon and target altitudes
+FAST_ALTAZ = os.environ.get('FAST_ALTAZ', '').lower() in ('1', 'true', 'yes')
+
+# WGS84 ellipsoid
+EARTH_EQUATORIAL_RADIUS_M = 6378137.0
+EARTH_FLATTENING = 1 / 298.257223563
+
+AU_M = u.au.to(u.m)
+
+UNIX_EPOCH_JD = 2440587.5
+J2000_JD = 2451545.0
+
+def get_julian_centuries(unix_times):
+    """
+    Returns the Julian centuries since J2000.0 of unix times (UTC is used for UT1 and TT).
+    """
+
+    return (np.asarray(unix_times, dtype=np.float64) / 86400 + UNIX_EPOCH_JD - J2000_JD) / 36525
+
+def get_sidereal_time(unix_times, longitude):
+    """
+    Returns the local mean sidereal time, in degrees (IAU 1982 GMST).
+    """
+
+    days = np.asarray(unix_times, dtype=np.float64) / 86400 + UNIX_EPOCH_JD - J2000_JD
+    centuries = days / 36525
+
+    gmst = 280.46061837 + 360.98564736629 * days + 0.000387933 * centuries ** 2 - centuries ** 3 / 38710000
+
+    return (gmst + longitude) % 360
+
+def precess_from_j2000(ra, dec, unix_times):
+    """
+    Precesses J2000 (ICRS/GCRS) equatorial coordinates to the mean equator and equinox of date (IAU 1976).
+
+    Parameters:
+        ra (numpy.ndarray): The right ascensions, in degrees.
+        dec (numpy.ndarray): The declinations, in degrees.
+        unix_times (numpy.ndarray): The times, in unix seconds (broadcast against ra and dec).
+
+    Returns:
+        tuple[numpy.ndarray, numpy.ndarray]: The right ascensions and declinations of date, in degrees.
+    """
+
+    centuries = get_julian_centuries(unix_times)
+
+    arcseconds = np.pi / (180 * 3600)
+    zeta = (2306.2181 * centuries + 0.30188 * centuries ** 2 + 0.017998 * centuries ** 3) * arcseconds
+    z = (2306.2181 * centuries + 1.09468 * centuries ** 2 + 0.018203 * centuries ** 3) * arcseconds
+    theta = (2004.3109 * centuries - 0.42665 * centuries ** 2 - 0.041833 * centuries ** 3) * arcseconds
+
+    ra = np.radians(ra)
+    dec = np.radians(dec)
+
+    a = np.cos(dec) * np.sin(ra + zeta)
+    b = np.cos(theta) * np.cos(dec) * np.cos(ra + zeta) - np.sin(theta) * np.sin(dec)
+    c = np.sin(theta) * np.cos(dec) * np.cos(ra + zeta) + np.cos(theta) * np.sin(dec)
+
+    return np.degrees(np.arctan2(a, b) + z), np.degrees(np.arcsin(np.clip(c, -1, 1)))
+
+def get_altitudes(unix_times, ra, dec, latitude, longitude, elevation=0.0, distance=None):
+    """
+    Returns the altitudes of objects for an observer, without refraction.
+
+    The J2000 positions are precessed to the date and rotated by the local
+    sidereal time. When a distance is given, the position is made
+    topocentric (the Moon's parallax is about 1 degree). Nutation,
+    aberration and UT1-UTC are ignored, which keeps the result within an
+    arcminute of astropy (see scripts/validate_fast_altaz.py). That is
+    plenty for the altitude thresholds used here.
+
+    Parameters:
+        unix_times (numpy.ndarray): The times, in unix seconds.
+        ra (numpy.ndarray): The J2000 (ICRS/GCRS) right ascensions, in degrees.
+        dec (numpy.ndarray): The J2000 declinations, in degrees.
+        latitude (float): The geodetic latitude of the observer, in degrees.
+        longitude (float): The longitude of the observer, in degrees (east positive).
+        elevation (float): The height of the observer above the ellipsoid, in meters.
+        distance (numpy.ndarray): The geocentric distances, in AU, or None for distant objects.
+
+    Returns:
+        numpy.ndarray: The altitudes, in degrees, with the broadcast shape of the inputs.
+
+    Example:
+        # Altitude of 2 targets (rows) at every time (columns)
+        alt = get_altitudes(times.unix, ra[:, np.newaxis], dec[:, np.newaxis], 43.4494, -80.5752)
+    """
+
+    ra_date, dec_date = precess_from_j2000(ra, dec, unix_times)
+
+    hour_angle = np.radians(get_sidereal_time(unix_times, longitude) - ra_date)
+    dec_date = np.radians(dec_date)
+    latitude = np.radians(latitude)
+
+    # Direction in a frame with x towards the observer's meridian on the equator and z towards the pole
+    x = np.cos(dec_date) * np.cos(hour_angle)
+    y = np.cos(dec_date) * np.sin(hour_angle)
+    z = np.sin(dec_date)
+
+    if distance is not None:
+        # Position of the observer in the same frame (WGS84 ellipsoid), in AU
+        e2 = EARTH_FLATTENING * (2 - EARTH_FLATTENING)
+        prime_vertical = EARTH_EQUATORIAL_RADIUS_M / np.sqrt(1 - e2 * np.sin(latitude) ** 2)
+        observer_x = (prime_vertical + elevation) * np.cos(latitude) / AU_M
+        observer_z = (prime_vertical * (1 - e2) + elevation) * np.sin(latitude) / AU_M
+
+        distance = np.asarray(distance, dtype=np.float64)
+        x, y, z = x * distance - observer_x, y * distance, z * distance - observer_z
+
+    # Component along the local vertical (the geodetic normal)
+    sin_altitude = (np.cos(latitude) * x + np.sin(latitude) * z) / np.sqrt(x ** 2 + y ** 2 + z ** 2)
+
+    return np.degrees(np.arcsin(np.clip(sin_altitude, -1, 1)))
+
+def get_observer_altitudes(observer, times, coords, grid_times_targets=False):
+    """
+    Returns the altitudes (in degrees) of coordinates for an astroplan Observer with the analytic kernel.
+
+    Parameters:
+        observer (Observer): The observer.
+        times (astropy.time.Time): The times.
+        coords (SkyCoord): ICRS or GCRS coordinates; GCRS coordinates with a
+            distance (from coord.get_sun / coord.get_body) are made topocentric.
+        grid_times_targets (bool): As for Observer.altaz: return an
+            (N coords x M times) grid instead of one altitude per time.
+
+    Returns:
+        numpy.ndarray: The altitudes, in degrees.
+    """
+
+    location = observer.location
+    unix_times = np.atleast_1d(times.unix)
+
+    ra = np.atleast_1d(coords.ra.deg)
+    dec = np.atleast_1d(coords.dec.deg)
+    distance = None
+
+    # ICRS coordinates without a distance have a dimensionless unit-sphere distance
+    if coords.distance.unit.physical_type == 'length':
+        distance = np.atleast_1d(coords.distance.to_value(u.au))
+
+    if grid_times_targets:
+        ra = ra[:, np.newaxis]
+        dec = dec[:, np.newaxis]
+        distance = distance[:, np.newaxis] if distance is not None else None
+
+    return get_altitudes(unix_times, ra, dec, location.lat.deg, location.lon.deg, location.height.to_value(u.m), distance)
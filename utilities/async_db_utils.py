@@ -0,0 +1,131 @@
+# async_db_utils.py
+
+from google.cloud.firestore_v1.base_query import FieldFilter
+import asyncio
+import os
+import threading
+import weakref
+from utilities import db_utils
+
+# Maximum number of Firestore queries in flight at once for one call
+FIRESTORE_FETCH_CONCURRENCY = int(os.environ.get('FIRESTORE_FETCH_CONCURRENCY', 8))
+
+# How long a synchronous caller waits for an async call, in seconds
+FIRESTORE_FETCH_TIMEOUT_SECONDS = float(os.environ.get('FIRESTORE_FETCH_TIMEOUT_SECONDS', 30))
+
+# The async client is bound to the event loop it is first used on, so every
+# async call runs on one long-lived event loop in a background thread.
+# Neither the thread nor the gRPC channels survive a fork, so a forked process
+# (e.g. a preloading server's worker) gets a loop and clients of its own.
+_loop = None
+_loop_lock = threading.Lock()
+_loop_pid = None
+_client = None
+
+# The async clients of the Firestore clients injected into stores (see storage_utils.FirestoreStore)
+_db_clients = weakref.WeakKeyDictionary()
+
+def _get_loop():
+    global _loop, _loop_pid, _client, _db_clients
+
+    with _loop_lock:
+        if _loop is None or _loop_pid != os.getpid():
+            _loop = asyncio.new_event_loop()
+            _loop_pid = os.getpid()
+            _client = None
+            _db_clients = weakref.WeakKeyDictionary()
+
+            threading.Thread(target=_loop.run_forever, name="firestore-async", daemon=True).start()
+
+    return _loop
+
+def get_client(db=None):
+    """
+    Returns the process-wide async Firestore client (with the channel
+    options of db_utils), or the one for the project and database of a
+    Firestore client. Must be called on the background event loop.
+    """
+
+    global _client
+
+    if db is not None:
+        client = _db_clients.get(db)
+
+        if client is None:
+            client = _db_clients[db] = db_utils.create_async_client(db)
+
+        return client
+
+    if _client is None:
+        _client = db_utils.create_async_client()
+
+    return _client
+
+def run(coroutine, timeout=None):
+    """
+    Runs a coroutine on the background event loop and waits for its result.
+
+    This is the adapter used by synchronous code (such as Flask routes) to
+    call the async data-access functions.
+
+    Parameters:
+        coroutine (coroutine): The coroutine to run.
+        timeout (float): How long to wait, in seconds. Defaults to FIRESTORE_FETCH_TIMEOUT_SECONDS.
+
+    Returns:
+        The result of the coroutine.
+
+    Example:
+        documents = run(fetch_optimal_times_ranges([(start_date, end_date)], 43.45, -80.58))
+    """
+
+    future = asyncio.run_coroutine_threadsafe(coroutine, _get_loop())
+
+    return future.result(timeout or FIRESTORE_FETCH_TIMEOUT_SECONDS)
+
+async def fetch_optimal_times_range(collection_ref, start_date, end_date, latitude_course, longitude_course, semaphore):
+    """
+    Fetches the 'optimal_times' documents of a range of months for a location with one range query.
+
+    Needs the (latitude, longitude, start_date) composite index in firestore.indexes.json.
+
+    Returns:
+        list[dict]: The documents with start_date in [start_date, end_date).
+    """
+
+    query_ref = collection_ref.where(filter=FieldFilter("latitude", "==", latitude_course)) \
+                              .where(filter=FieldFilter("longitude", "==", longitude_course)) \
+                              .where(filter=FieldFilter("start_date", ">=", start_date)) \
+                              .where(filter=FieldFilter("start_date", "<", end_date))
+
+    async with semaphore:
+        return [result.to_dict() async for result in query_ref.stream()]
+
+async def fetch_optimal_times_ranges(date_ranges, latitude_course, longitude_course, concurrency=None, client=None, db=None):
+    """
+    Fetches the 'optimal_times' documents of several ranges of months for a location concurrently.
+
+    Parameters:
+        date_ranges (list[tuple[datetime, datetime]]): The (start, end) of each
+            range; start is the first day of a month and end is exclusive.
+        latitude_course (float): The latitude, rounded to 2 decimals.
+        longitude_course (float): The longitude, rounded to 2 decimals.
+        concurrency (int): The maximum number of queries in flight. Defaults
+            to FIRESTORE_FETCH_CONCURRENCY.
+        client (AsyncClient): The async Firestore client. Defaults to get_client(db).
+        db (Client): The Firestore client of the store, whose project and
+            database are queried. Defaults to the default Firebase app's.
+
+    Returns:
+        list[dict]: The documents of every range.
+    """
+
+    collection_ref = (client or get_client(db)).collection("optimal_times")
+    semaphore = asyncio.Semaphore(concurrency or FIRESTORE_FETCH_CONCURRENCY)
+
+    results = await asyncio.gather(*[
+        fetch_optimal_times_range(collection_ref, start_date, end_date, latitude_course, longitude_course, semaphore)
+        for start_date, end_date in date_ranges
+    ])
+
+    return [document for documents in results for document in documents]
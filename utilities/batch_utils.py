@@ -0,0 +1,92 @@
+# batch_utils.py
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import itertools
+import time
+
+# Firestore accepts at most 500 writes in one batch
+MAX_BATCH_SIZE = 500
+
+def iter_batches(items, batch_size):
+    """
+    Groups an iterable into lists of at most batch_size items, without reading it all into memory.
+    """
+
+    iterator = iter(items)
+
+    while True:
+        batch = list(itertools.islice(iterator, batch_size))
+
+        if not batch:
+            return
+
+        yield batch
+
+def write_documents(db, collection_ref, documents, batch_size=MAX_BATCH_SIZE, concurrency=4, merge=False, on_progress=None):
+    """
+    Writes (document_id, data) pairs to a collection with batched writes.
+
+    Documents are read from the iterable as batches are sent, and at most
+    concurrency batches are committed at once. Writes are set() calls on
+    the given IDs, so writing the same documents again is idempotent.
+
+    Parameters:
+        db (Client): The Firestore client.
+        collection_ref (CollectionReference): The collection to write to.
+        documents (iterable[tuple[str, dict]]): The document IDs and data (None to delete the document).
+        batch_size (int): The number of documents per batch (at most 500).
+        concurrency (int): The maximum number of batches committed at once.
+        merge (bool): Merge the data into existing documents instead of replacing them.
+        on_progress (callable): Called after every committed batch with the
+            number of documents written so far and the seconds elapsed.
+
+    Returns:
+        int: The number of documents written.
+
+    Example:
+        written = write_documents(db, db.collection("astro_objects_full"), [("M31", {"object_name": "Andromeda Galaxy"})])
+    """
+
+    if not 0 < batch_size <= MAX_BATCH_SIZE:
+        raise ValueError(f"batch_size must be between 1 and {MAX_BATCH_SIZE}")
+
+    def commit(batch_documents):
+        batch = db.batch()
+
+        for document_id, data in batch_documents:
+            if data is None:
+                batch.delete(collection_ref.document(document_id))
+            else:
+                batch.set(collection_ref.document(document_id), data, merge=merge)
+
+        batch.commit()
+
+        return len(batch_documents)
+
+    started = time.perf_counter()
+    written = 0
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        pending = set()
+
+        def collect(done):
+            nonlocal written
+
+            for future in done:
+                written += future.result()
+
+                if on_progress is not None:
+                    on_progress(written, time.perf_counter() - started)
+
+        for batch_documents in iter_batches(documents, batch_size):
+            # Wait for a commit to finish before reading more documents
+            if len(pending) >= concurrency:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+
+            pending.add(executor.submit(commit, batch_documents))
+
+        done, pending = wait(pending)
+        collect(done)
+
+    return written
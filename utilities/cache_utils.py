@@ -0,0 +1,99 @@
+# cache_utils.py
+
+from collections import OrderedDict
+import threading
+import time
+
+class LRUCache:
+    """
+    A thread-safe, process-local LRU cache with optional time-to-live eviction.
+
+    Entries are evicted when the cache grows past max_size (least recently
+    used first) or when they are older than ttl_seconds. Hits, misses and
+    evictions are counted so the cache can be inspected at runtime.
+
+    Parameters:
+        max_size (int): The maximum number of entries to keep.
+        ttl_seconds (float): The maximum age of an entry, in seconds. None
+            keeps entries until they are evicted by size.
+
+    Example:
+        cache = LRUCache(max_size=2, ttl_seconds=60)
+        cache.put("a", 1)
+        print(cache.get("a"))  # Output: 1
+        print(cache.get("b"))  # Output: None
+    """
+
+    def __init__(self, max_size, ttl_seconds=None):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                self.misses += 1
+                return default
+
+            value, stored_at = entry
+
+            if self.ttl_seconds is not None and time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+
+            return default if entry is None else entry[0]
+
+    def clear(self):
+        with self._lock:
+            cleared = len(self._entries)
+            self._entries.clear()
+
+            return cleared
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else None,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
@@ -0,0 +1,238 @@
+# catalog_utils.py
+
+import csv
+import os
+import re
+
+# The Messier/NGC/IC catalog loaded into 'astro_objects_full' by scripts/load_astro_objects.py
+CATALOG_PATH = os.environ.get('CATALOG_PATH', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts', 'full_catalog.csv'))
+
+# Identifier format could be IC123, IC-123, IC 123, NGC321, NGC-321, NGC 321, M31, M-31, M 31 (and leading zeros, e.g. NGC0224)
+IDENTIFIER_PATTERN = re.compile(r'^\s*(IC|NGC|M)[\s\-]*0*(\d+)\s*(.*?)\s*$', re.IGNORECASE)
+
+# Catalog fields holding identifiers, in the order they are preferred for display
+IDENTIFIER_FIELDS = ['messier_id', 'ngc_id', 'ic_id']
+
+# Search fields of an 'astro_objects_full' document, and the numbered fields they replace
+KEYWORDS_FIELD = 'keywords'
+KEYWORD_PREFIXES_FIELD = 'keyword_prefixes'
+ALIASES_FIELD = 'aliases'
+LEGACY_KEYWORD_PATTERN = re.compile(r'^keyword_\d+$')
+
+def normalize_identifier(value):
+    """
+    Returns the canonical form of a Messier/NGC/IC identifier, or None.
+
+    Example:
+        print(normalize_identifier("m 31"))      # Output: M31
+        print(normalize_identifier("NGC-0224"))  # Output: NGC224
+        print(normalize_identifier("Vega"))      # Output: None
+    """
+
+    if not value:
+        return None
+
+    match = IDENTIFIER_PATTERN.match(value)
+
+    if not match:
+        return None
+
+    prefix, number, suffix = match.groups()
+    identifier = f"{prefix.upper()}{number}"
+
+    # Keep component suffixes such as 'IC2082 NED01'
+    if suffix:
+        identifier += f" {suffix.upper()}"
+
+    return identifier
+
+def normalize_name(value):
+    """
+    Returns a lookup key for a free-form name: lower case with collapsed whitespace.
+    """
+
+    return " ".join(value.lower().split())
+
+def get_identifiers(row):
+    """
+    Returns the canonical identifiers of a catalog row, preferred identifier first.
+
+    Secondary IC identifiers are stored as e.g. 'IC5030,5041,5047', where the
+    prefix is only written on the first number.
+    """
+
+    identifiers = []
+
+    for field in IDENTIFIER_FIELDS:
+        identifier = normalize_identifier(row.get(field))
+
+        if identifier:
+            identifiers.append(identifier)
+
+    prefix = None
+
+    for part in (row.get('ic_second_id') or '').split(','):
+        part = part.strip()
+
+        if not part:
+            continue
+
+        match = IDENTIFIER_PATTERN.match(part)
+
+        if match:
+            prefix = match.group(1)
+        elif prefix:
+            part = prefix + part
+
+        identifier = normalize_identifier(part)
+
+        if identifier:
+            identifiers.append(identifier)
+
+    # Remove duplicates while keeping the order
+    return list(dict.fromkeys(identifiers))
+
+def get_document_id(row):
+    """
+    Returns the deterministic document ID of a catalog row in 'astro_objects_full': its preferred canonical identifier.
+
+    Example:
+        print(get_document_id({"messier_id": "M31", "ngc_id": "NGC0224"}))  # Output: M31
+    """
+
+    identifiers = get_identifiers(row)
+
+    if not identifiers:
+        raise ValueError(f"Catalog row has no identifier: {row}")
+
+    return identifiers[0]
+
+def get_display_identifier(row):
+    """
+    Returns the identifier shown to users for a catalog row (Messier, then NGC, then IC).
+    """
+
+    for field in IDENTIFIER_FIELDS:
+        if row.get(field):
+            return row[field]
+
+    return None
+
+def get_names(row):
+    """
+    Returns the common names of a catalog row (the 'object_name' field is comma separated).
+    """
+
+    return [name.strip() for name in (row.get('object_name') or '').split(',') if name.strip()]
+
+def get_keywords(row):
+    """
+    Returns the lower case words of the common names of a catalog row, without duplicates.
+
+    Example:
+        print(get_keywords({"object_name": "Great Orion Nebula,Orion Nebula"}))  # Output: ['great', 'orion', 'nebula']
+    """
+
+    keywords = []
+
+    for name in get_names(row):
+        keywords += [keyword.lower() for keyword in name.split(" ") if keyword]
+
+    return list(dict.fromkeys(keywords))
+
+def get_search_keywords(row):
+    """
+    Returns the search keywords of a catalog row: the words of its names and its identifiers, lower case.
+
+    Identifiers are stored in canonical form, so 'M 31', 'm-31' and 'M031'
+    all match once the query is normalized (see get_query_keywords).
+
+    Example:
+        print(get_search_keywords({"messier_id": "M31", "ngc_id": "NGC0224", "object_name": "Andromeda Galaxy"}))
+        # Output: ['andromeda', 'galaxy', 'm31', 'ngc224']
+    """
+
+    return list(dict.fromkeys(get_keywords(row) + [identifier.lower() for identifier in get_identifiers(row)]))
+
+def get_keyword_prefixes(keywords):
+    """
+    Returns every prefix of the keywords, without duplicates.
+
+    Firestore cannot query a range of array values, so the documents also
+    hold the prefixes of their keywords: 'andro' then matches Andromeda
+    with an array_contains query.
+
+    Example:
+        print(get_keyword_prefixes(['m31', 'm32']))  # Output: ['m', 'm3', 'm31', 'm32']
+    """
+
+    return list(dict.fromkeys(keyword[:length] for keyword in keywords for length in range(1, len(keyword) + 1)))
+
+def get_query_keywords(query):
+    """
+    Returns the keywords a search query must match: its canonical identifier, or its words.
+
+    Example:
+        print(get_query_keywords("NGC 224"))       # Output: ['ngc224']
+        print(get_query_keywords("Orion Nebula"))  # Output: ['orion', 'nebula']
+    """
+
+    identifier = normalize_identifier(query)
+
+    if identifier:
+        return [identifier.lower()]
+
+    return list(dict.fromkeys(query.lower().split()))
+
+def get_document(row):
+    """
+    Returns the 'astro_objects_full' document of a catalog row: its fields, keywords, keyword prefixes and aliases.
+
+    Numbered keyword fields (keyword_01, keyword_02, ...) of the previous
+    schema are dropped, so this also converts an existing document.
+    """
+
+    data = {field: value for field, value in row.items() if not LEGACY_KEYWORD_PATTERN.match(field) and field not in (KEYWORDS_FIELD, KEYWORD_PREFIXES_FIELD, ALIASES_FIELD)}
+
+    data[KEYWORDS_FIELD] = get_search_keywords(data)
+    data[KEYWORD_PREFIXES_FIELD] = get_keyword_prefixes(data[KEYWORDS_FIELD])
+    data[ALIASES_FIELD] = get_identifiers(data)
+
+    return data
+
+def get_magnitude(row):
+    """
+    Returns the visual magnitude of a catalog row (blue magnitude if there is none), or None.
+    """
+
+    for field in ['v_mag', 'b_mag']:
+        try:
+            return float(row[field])
+        except (KeyError, TypeError, ValueError):
+            continue
+
+    return None
+
+def get_coordinates(row):
+    """
+    Returns the (ra_deg, dec_deg, dec_sign) of a catalog row, or None if it has no position.
+
+    dec_deg is the absolute declination; dec_sign is '+', '-' or ''.
+    """
+
+    try:
+        ra_deg = (float(row['ra_hour']) + float(row['ra_minute']) / 60) * 15
+        dec_deg = float(row['dec_deg']) + float(row['dec_minute']) / 60
+    except (KeyError, TypeError, ValueError):
+        return None
+
+    return ra_deg, dec_deg, (row.get('dec_sign') or '').strip()
+
+def read_catalog(path=None):
+    """
+    Streams the rows of the catalog CSV as dicts.
+    """
+
+    with open(path or CATALOG_PATH, mode='r', encoding='utf-8') as csv_file:
+        for row in csv.DictReader(csv_file):
+            yield row
@@ -0,0 +1,165 @@
+# db_utils.py
+
+from google.cloud import firestore
+import firebase_admin
+import itertools
+import os
+import threading
+import warnings
+
+# Number of Firestore clients (each with its own gRPC channel) per process, used in turn
+FIRESTORE_CHANNEL_POOL_SIZE = int(os.environ.get('FIRESTORE_CHANNEL_POOL_SIZE', 1))
+
+# gRPC channel options (the defaults are the ones the Firestore library uses)
+FIRESTORE_GRPC_KEEPALIVE_MS = int(os.environ.get('FIRESTORE_GRPC_KEEPALIVE_MS', 30000))
+FIRESTORE_GRPC_KEEPALIVE_TIMEOUT_MS = int(os.environ.get('FIRESTORE_GRPC_KEEPALIVE_TIMEOUT_MS', 20000))
+FIRESTORE_GRPC_MAX_MESSAGE_BYTES = int(os.environ.get('FIRESTORE_GRPC_MAX_MESSAGE_BYTES', -1))
+
+# The private attributes of the library's clients that _ChannelOptionsMixin relies on
+# (written against google-cloud-firestore 2.x; tested with 2.34)
+_CLIENT_ATTRIBUTES = ('_firestore_api_internal', '_emulator_host', '_target', '_credentials', '_client_options', '_client_info')
+
+_CHANNEL_OPTIONS_WARNING = "google-cloud-firestore internals changed: Firestore clients use the default gRPC channel options"
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_channel_options():
+    """
+    Returns the gRPC channel options of the Firestore clients (see the FIRESTORE_GRPC_* settings).
+    """
+
+    return [
+        ("grpc.keepalive_time_ms", FIRESTORE_GRPC_KEEPALIVE_MS),
+        ("grpc.keepalive_timeout_ms", FIRESTORE_GRPC_KEEPALIVE_TIMEOUT_MS),
+        ("grpc.max_send_message_length", FIRESTORE_GRPC_MAX_MESSAGE_BYTES),
+        ("grpc.max_receive_message_length", FIRESTORE_GRPC_MAX_MESSAGE_BYTES),
+        # Without it, channels with the same options share one connection, and a pool would not spread the load
+        ("grpc.use_local_subchannel_pool", 1)
+    ]
+
+def supports_channel_options():
+    """
+    Returns whether the installed google-cloud-firestore lets the clients use get_channel_options().
+
+    Otherwise (e.g. after a library upgrade changed its internals) the clients use the library's defaults.
+    """
+
+    return hasattr(firestore.Client, '_firestore_api_helper') and hasattr(firestore.AsyncClient, '_firestore_api_helper')
+
+class _ChannelOptionsMixin:
+    # The library creates the gRPC channel on first use with fixed options; this creates it with get_channel_options().
+    # It overrides a private method, so it falls back to the stock client if the internals it needs are missing.
+    def _firestore_api_helper(self, transport, client_class, client_module):
+        if not all(hasattr(self, name) for name in _CLIENT_ATTRIBUTES) or not hasattr(transport, 'create_channel'):
+            warnings.warn(_CHANNEL_OPTIONS_WARNING, RuntimeWarning)
+            return super()._firestore_api_helper(transport, client_class, client_module)
+
+        if self._firestore_api_internal is None and self._emulator_host is None:
+            try:
+                channel = transport.create_channel(self._target, credentials=self._credentials, options=get_channel_options())
+
+                self._transport = transport(host=self._target, channel=channel)
+                self._firestore_api_internal = client_class(transport=self._transport, client_options=self._client_options)
+                client_module._client_info = self._client_info
+            except TypeError:
+                # A signature changed: the library creates the channel itself
+                warnings.warn(_CHANNEL_OPTIONS_WARNING, RuntimeWarning)
+                self._firestore_api_internal = None
+
+        return super()._firestore_api_helper(transport, client_class, client_module)
+
+class Client(_ChannelOptionsMixin, firestore.Client):
+    """
+    A Firestore client whose gRPC channel uses get_channel_options().
+    """
+
+class AsyncClient(_ChannelOptionsMixin, firestore.AsyncClient):
+    """
+    An async Firestore client whose gRPC channel uses get_channel_options().
+    """
+
+if not supports_channel_options():
+    warnings.warn(_CHANNEL_OPTIONS_WARNING, RuntimeWarning)
+
+def _get_client_arguments():
+    # The credentials and project of the default Firebase app (see storage_utils.init_firebase)
+    app = firebase_admin.get_app()
+
+    if not app.project_id:
+        raise ValueError("A project ID is required to access Firestore (use service account credentials or set the projectId option)")
+
+    return {"credentials": app.credential.get_credential(), "project": app.project_id}
+
+def create_client():
+    """
+    Creates a Firestore client for the default Firebase app. Prefer get_client, which reuses clients.
+    """
+
+    return Client(**_get_client_arguments())
+
+def create_async_client(db=None):
+    """
+    Creates an async Firestore client for the default Firebase app, or for
+    the project, credentials and database of a (synchronous) Firestore client.
+
+    The client is bound to the event loop it is first used on (see async_db_utils).
+    """
+
+    if db is None:
+        return AsyncClient(**_get_client_arguments())
+
+    return AsyncClient(project=db.project, credentials=db._credentials, database=db._database, client_options=db._client_options)
+
+class ClientPool:
+    """
+    A fixed number of Firestore clients, created on first use and handed out in turn.
+
+    A client is thread-safe and multiplexes concurrent calls over its gRPC
+    channel, so one client per process is usually enough; more channels
+    help when many threads call Firestore at once.
+    """
+
+    def __init__(self, size, factory=create_client):
+        self.size = max(1, size)
+        self.pid = os.getpid()
+        self._factory = factory
+        self._clients = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def get(self):
+        index = next(self._counter) % self.size
+
+        if index >= len(self._clients):
+            with self._lock:
+                while len(self._clients) <= index:
+                    self._clients.append(self._factory())
+
+        return self._clients[index]
+
+def get_client():
+    """
+    Returns a Firestore client of the process-wide pool (see FIRESTORE_CHANNEL_POOL_SIZE).
+
+    Works without a Flask context, e.g. in workers, scripts and benchmarks;
+    the default Firebase app must be initialized. gRPC channels cannot be
+    used across a fork, so a forked process (e.g. a preloading server's
+    worker) gets a pool of its own.
+
+    Returns:
+        google.cloud.firestore.Client: The client.
+
+    Example:
+        storage_utils.init_firebase('service-account.json')
+        document = get_client().collection("optimal_times").document("2024-01_43.45_-80.58").get()
+    """
+
+    global _pool
+
+    if _pool is None or _pool.pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool.pid != os.getpid():
+                _pool = ClientPool(FIRESTORE_CHANNEL_POOL_SIZE)
+
+    return _pool.get()
@@ -0,0 +1,120 @@
+# elevation_utils.py
+
+import math
+import numpy as np
+import os
+import re
+from utilities import cache_utils
+
+# Directory of SRTM .hgt tiles (e.g. N43W081.hgt), 1 or 3 arc-second, as distributed by USGS/NASA
+DEM_DIR = os.environ.get('DEM_DIR', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'dem'))
+
+# Maximum number of tiles kept open (memory-mapped) at once
+DEM_MAX_OPEN_TILES = int(os.environ.get('DEM_MAX_OPEN_TILES', 64))
+
+# SRTM marks missing samples with this value
+DEM_VOID = -32768
+
+# Tiles are square: 1201 samples a side (3 arc-second) or 3601 (1 arc-second)
+_TILE_SIZES = {1201 * 1201 * 2: 1201, 3601 * 3601 * 2: 3601}
+
+_TILE_NAME_PATTERN = re.compile(r'^([NS])(\d{2})([EW])(\d{3})$')
+
+# Open tiles by name; False marks a tile that does not exist, so it is not looked for again
+tile_cache = cache_utils.LRUCache(DEM_MAX_OPEN_TILES)
+
+def get_tile_name(latitude, longitude):
+    """
+    Returns the name of the SRTM tile containing a location, from its south-west corner.
+
+    Example:
+        print(get_tile_name(43.4494, -80.5752))  # Output: N43W081
+    """
+
+    south = math.floor(latitude)
+    west = math.floor(longitude)
+
+    return f"{'N' if south >= 0 else 'S'}{abs(south):02d}{'E' if west >= 0 else 'W'}{abs(west):03d}"
+
+def open_tile(name, dem_dir=None):
+    """
+    Memory-maps an SRTM tile (big-endian int16, north row first), or returns None if there is no such tile.
+    """
+
+    if not _TILE_NAME_PATTERN.match(name):
+        raise ValueError(f"Invalid tile name: {name}")
+
+    path = os.path.join(dem_dir or DEM_DIR, f"{name}.hgt")
+
+    try:
+        size = _TILE_SIZES.get(os.path.getsize(path))
+    except OSError:
+        return None
+
+    if size is None:
+        raise ValueError(f"{path} is not a 1 or 3 arc-second SRTM tile")
+
+    return np.memmap(path, dtype='>i2', mode='r', shape=(size, size))
+
+def get_tile(name):
+    # Open tiles are kept in an LRU, so a lookup does not open (or look for) the file again
+    tile = tile_cache.get(name)
+
+    if tile is None:
+        tile = open_tile(name)
+
+        if tile is None:
+            tile = False
+
+        tile_cache.put(name, tile)
+
+    return tile if tile is not False else None
+
+def get_elevation(latitude, longitude):
+    """
+    Returns the elevation of a location from the local DEM tiles, or None if it is not covered.
+
+    The elevation is interpolated bilinearly between the 4 surrounding
+    samples. Void samples are left out of the interpolation.
+
+    Parameters:
+        latitude (float): The latitude coordinate for the location.
+        longitude (float): The longitude coordinate for the location.
+
+    Returns:
+        float: The elevation above sea level, in meters, or None.
+
+    Example:
+        print(get_elevation(19.8207, -155.4681))  # Output: 4205.2 (with the N19W156 tile in DEM_DIR)
+    """
+
+    tile = get_tile(get_tile_name(latitude, longitude))
+
+    if tile is None:
+        return None
+
+    size = tile.shape[0]
+
+    # Position in the tile, in samples: row 0 is the north edge, column 0 the west edge
+    row = (math.floor(latitude) + 1 - latitude) * (size - 1)
+    column = (longitude - math.floor(longitude)) * (size - 1)
+
+    row0 = min(int(row), size - 2)
+    column0 = min(int(column), size - 2)
+    row_weight = row - row0
+    column_weight = column - column0
+
+    samples = tile[row0:row0 + 2, column0:column0 + 2].astype(np.float64)
+    weights = np.array([[(1 - row_weight) * (1 - column_weight), (1 - row_weight) * column_weight],
+                        [row_weight * (1 - column_weight), row_weight * column_weight]])
+
+    valid = samples != DEM_VOID
+
+    if not valid.any():
+        return None
+
+    # On a void sample, the surrounding valid samples are averaged
+    if weights[valid].sum() == 0:
+        return float(samples[valid].mean())
+
+    return float((samples[valid] * weights[valid]).sum() / weights[valid].sum())
@@ -0,0 +1,85 @@
+# encoding_utils.py
+
+import struct
+import numpy as np
+
+# Compact storage format for the optimal times of a month.
+#
+# Version 1 layout (big-endian):
+#   uint8   format version (1)
+#   int64   start epoch, in unix seconds
+#   uint32  slot interval, in seconds
+#   uint32  number of slots in the grid
+#   bytes   bitmask of the optimal slots, one bit per slot (numpy.packbits order)
+
+OPTIMAL_TIMES_FORMAT_VERSION = 1
+
+_HEADER_V1 = struct.Struct('>BqII')
+
+def encode_optimal_times(start_epoch, interval_seconds, slot_count, optimal_unix_times):
+    """
+    Encodes optimal times that lie on a regular time grid as compact bytes.
+
+    Parameters:
+        start_epoch (int): The start of the time grid, in unix seconds.
+        interval_seconds (int): The spacing of the time grid, in seconds.
+        slot_count (int): The number of slots in the time grid.
+        optimal_unix_times (array-like): The optimal times, in unix seconds.
+            Every time must lie on the grid.
+
+    Returns:
+        bytes: The encoded optimal times.
+
+    Example:
+        encoded = encode_optimal_times(1690848000, 900, 2976, [1690848000, 1690848900])
+        print(len(encoded))  # Output: 389
+    """
+
+    if start_epoch != int(start_epoch):
+        raise ValueError("The start of the time grid must be a whole number of seconds")
+
+    optimal_unix_times = np.asarray(optimal_unix_times, dtype=np.float64)
+
+    slot_indices = np.rint((optimal_unix_times - start_epoch) / interval_seconds).astype(np.int64)
+
+    if slot_indices.size and (slot_indices.min() < 0 or slot_indices.max() >= slot_count):
+        raise ValueError("Optimal times must lie within the time grid")
+
+    mask = np.zeros(slot_count, dtype=bool)
+    mask[slot_indices] = True
+
+    header = _HEADER_V1.pack(OPTIMAL_TIMES_FORMAT_VERSION, int(start_epoch), int(interval_seconds), int(slot_count))
+
+    return header + np.packbits(mask).tobytes()
+
+def decode_optimal_times(encoded):
+    """
+    Decodes bytes produced by encode_optimal_times into unix seconds.
+
+    Parameters:
+        encoded (bytes): The encoded optimal times.
+
+    Returns:
+        numpy.ndarray: The optimal times, in unix seconds (int64), sorted ascending.
+
+    Example:
+        unix_times = decode_optimal_times(encoded)
+        print(unix_times[:2])  # Output: [1690848000 1690848900]
+    """
+
+    encoded = bytes(encoded)
+
+    if not encoded:
+        raise ValueError("Encoded optimal times are empty")
+
+    version = encoded[0]
+
+    if version != OPTIMAL_TIMES_FORMAT_VERSION:
+        raise ValueError(f"Unsupported optimal times format version: {version}")
+
+    _, start_epoch, interval_seconds, slot_count = _HEADER_V1.unpack_from(encoded)
+
+    bitmask = np.frombuffer(encoded, dtype=np.uint8, offset=_HEADER_V1.size)
+    mask = np.unpackbits(bitmask, count=slot_count).astype(bool)
+
+    return start_epoch + np.flatnonzero(mask).astype(np.int64) * interval_seconds
@@ -0,0 +1,185 @@
+# ephemeris_utils.py
+
+from astropy.time import Time
+from astropy.coordinates import SkyCoord
+from astropy import units as u, coordinates as coord
+import numpy as np
+import os
+import threading
+
+# Table of geocentric Sun/Moon positions built by scripts/build_ephemeris.py (not required: without it, positions are computed)
+EPHEMERIS_PATH = os.environ.get('EPHEMERIS_PATH', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'ephemeris.npy'))
+
+# Spacing of the table, in seconds (the 15-minute grid of the optimal times)
+EPHEMERIS_INTERVAL_SECONDS = 15 * 60
+
+# Columns of the table: angles in degrees, distances in AU
+COLUMN_UNIX = 0
+COLUMN_SUN_RA = 1
+COLUMN_SUN_DEC = 2
+COLUMN_SUN_DISTANCE = 3
+COLUMN_MOON_RA = 4
+COLUMN_MOON_DEC = 5
+COLUMN_MOON_DISTANCE = 6
+COLUMN_MOON_ILLUMINATION = 7
+COLUMN_COUNT = 8
+
+# Samples closer to a grid time than this (in fractions of the interval) use the grid value as is
+_GRID_TOLERANCE = 1e-6
+
+_ephemeris = None
+_ephemeris_lock = threading.Lock()
+
+def get_moon_illumination(sun, moon):
+    """
+    Returns the fraction of the Moon illuminated for precomputed Sun and Moon positions.
+
+    This is the same calculation as astroplan.moon_illumination, but it reuses
+    Sun and Moon coordinates that have already been computed for the time grid
+    instead of computing both ephemerides a second time.
+
+    Parameters:
+        sun (SkyCoord): Geocentric Sun positions, as returned by coord.get_sun.
+        moon (SkyCoord): Geocentric Moon positions, as returned by coord.get_body("moon", ...).
+
+    Returns:
+        numpy.ndarray: The illuminated fraction of the Moon (0 to 1) at each time.
+    """
+
+    elongation = sun.separation(moon)
+    phase_angle = np.arctan2(sun.distance * np.sin(elongation),
+                             moon.distance - sun.distance * np.cos(elongation))
+
+    return ((1 + np.cos(phase_angle)) / 2.0).value
+
+def build_ephemeris(start_unix, end_unix, interval_seconds=EPHEMERIS_INTERVAL_SECONDS):
+    """
+    Computes the rows of the ephemeris table for a range of unix times.
+
+    Parameters:
+        start_unix (int): The first time of the table, in unix seconds (a multiple of interval_seconds).
+        end_unix (int): The end of the table (exclusive), in unix seconds.
+        interval_seconds (int): The spacing of the table, in seconds.
+
+    Returns:
+        numpy.ndarray: A (samples, COLUMN_COUNT) float64 array.
+    """
+
+    unix_times = np.arange(start_unix, end_unix, interval_seconds, dtype=np.float64)
+    times = Time(unix_times, format='unix')
+
+    sun = coord.get_sun(times)
+    moon = coord.get_body("moon", times)
+
+    table = np.empty((len(unix_times), COLUMN_COUNT))
+    table[:, COLUMN_UNIX] = unix_times
+    table[:, COLUMN_SUN_RA] = sun.ra.deg
+    table[:, COLUMN_SUN_DEC] = sun.dec.deg
+    table[:, COLUMN_SUN_DISTANCE] = sun.distance.to_value(u.au)
+    table[:, COLUMN_MOON_RA] = moon.ra.deg
+    table[:, COLUMN_MOON_DEC] = moon.dec.deg
+    table[:, COLUMN_MOON_DISTANCE] = moon.distance.to_value(u.au)
+    table[:, COLUMN_MOON_ILLUMINATION] = get_moon_illumination(sun, moon)
+
+    return table
+
+def load_ephemeris(path=None):
+    """
+    Memory-maps the ephemeris table, so the pages are shared by every process using it.
+
+    Returns:
+        numpy.memmap: The table, or None if the file does not exist.
+    """
+
+    global _ephemeris
+
+    path = path or EPHEMERIS_PATH
+
+    with _ephemeris_lock:
+        if not os.path.exists(path):
+            _ephemeris = None
+            return None
+
+        table = np.load(path, mmap_mode='r')
+
+        if table.ndim != 2 or table.shape[1] != COLUMN_COUNT or table.shape[0] < 2:
+            raise ValueError(f"{path} is not an ephemeris table")
+
+        _ephemeris = table
+
+    return _ephemeris
+
+def get_ephemeris():
+    """
+    Returns the ephemeris table, loading it on first use (None if there is no table).
+    """
+
+    if _ephemeris is None:
+        return load_ephemeris()
+
+    return _ephemeris
+
+def _interpolate_angle(start_values, end_values, weights):
+    # Interpolate along the shortest way around the circle (e.g. RA 359.9 -> 0.1)
+    difference = (end_values - start_values + 180) % 360 - 180
+
+    return (start_values + weights * difference) % 360
+
+def get_sun_moon_positions(times):
+    """
+    Returns the geocentric Sun and Moon positions and the Moon illumination from the ephemeris table.
+
+    Times on the table grid use the stored values; other times are linearly
+    interpolated between the two surrounding rows (well under an arcsecond
+    for a 15-minute table).
+
+    Parameters:
+        times (astropy.time.Time): The times.
+
+    Returns:
+        tuple[SkyCoord, SkyCoord, numpy.ndarray]: The Sun and Moon GCRS positions
+            and the Moon illumination, or None if there is no table or it does not cover the times.
+
+    Example:
+        positions = get_sun_moon_positions(times)
+        if positions is None:
+            sun, moon = coord.get_sun(times), coord.get_body("moon", times)
+    """
+
+    table = get_ephemeris()
+
+    if table is None or len(times) == 0:
+        return None
+
+    start_unix = table[0, COLUMN_UNIX]
+    interval_seconds = table[1, COLUMN_UNIX] - start_unix
+
+    positions = (np.atleast_1d(times.unix) - start_unix) / interval_seconds
+
+    # Snap times that are on the grid (up to floating point error) to it
+    rounded = np.rint(positions)
+    positions = np.where(np.abs(positions - rounded) < _GRID_TOLERANCE, rounded, positions)
+
+    if positions.min() < 0 or positions.max() > len(table) - 1:
+        return None
+
+    lower = np.minimum(np.floor(positions).astype(np.int64), len(table) - 2)
+    weights = positions - lower
+
+    start_rows = np.asarray(table[lower])
+    end_rows = np.asarray(table[lower + 1])
+
+    def interpolate(column):
+        return start_rows[:, column] + weights * (end_rows[:, column] - start_rows[:, column])
+
+    sun = SkyCoord(ra=_interpolate_angle(start_rows[:, COLUMN_SUN_RA], end_rows[:, COLUMN_SUN_RA], weights) * u.deg,
+                   dec=interpolate(COLUMN_SUN_DEC) * u.deg,
+                   distance=interpolate(COLUMN_SUN_DISTANCE) * u.au,
+                   frame=coord.GCRS(obstime=times))
+
+    moon = SkyCoord(ra=_interpolate_angle(start_rows[:, COLUMN_MOON_RA], end_rows[:, COLUMN_MOON_RA], weights) * u.deg,
+                    dec=interpolate(COLUMN_MOON_DEC) * u.deg,
+                    distance=interpolate(COLUMN_MOON_DISTANCE) * u.au,
+                    frame=coord.GCRS(obstime=times))
+
+    return sun, moon, interpolate(COLUMN_MOON_ILLUMINATION)
@@ -1,19 +1,93 @@
 # geo_utils.py
 
 from timezonefinder import TimezoneFinder
+import os
+import threading
+from utilities import cache_utils
+from utilities import elevation_utils
+from utilities import metrics_utils
 
-# Returns the elevation (in meters) for a given location.
+# Load the timezone polygons into memory (faster lookups, more memory) instead of reading them from disk
+TIMEZONE_FINDER_IN_MEMORY = os.environ.get('TIMEZONE_FINDER_IN_MEMORY', '').lower() in ('1', 'true', 'yes')
+
+# Site records are cached per coarse location (rounded to this many decimals, like the optimal times);
+# elevations are cached per exact location, since they change a lot over 0.01 degree in the mountains
+SITE_CACHE_PRECISION = 2
+SITE_CACHE_MAX_SIZE = int(os.environ.get('SITE_CACHE_MAX_SIZE', 4096))
+
+# Elevation (in meters) used where no DEM tile covers the location
+DEFAULT_ELEVATION = 329.0
+
+site_cache = cache_utils.LRUCache(SITE_CACHE_MAX_SIZE)
+elevation_cache = cache_utils.LRUCache(SITE_CACHE_MAX_SIZE)
+
+_timezone_finder = None
+_timezone_finder_lock = threading.Lock()
+
+# Returns the elevation (in meters) for a given location, from the DEM tiles in elevation_utils.DEM_DIR.
 def get_elevation(latitude, longitude):
-    return 329.0
+    elevation = elevation_utils.get_elevation(latitude, longitude)
+
+    return elevation if elevation is not None else DEFAULT_ELEVATION
 
 # Returns the location name for a given location.
 def get_location_name(latitude, longitude):
     return "Waterloo"
 
+def get_timezone_finder():
+    # One TimezoneFinder per process: creating one loads its polygon data
+    global _timezone_finder
+
+    if _timezone_finder is None:
+        with _timezone_finder_lock:
+            if _timezone_finder is None:
+                _timezone_finder = TimezoneFinder(in_memory=TIMEZONE_FINDER_IN_MEMORY)
+
+    return _timezone_finder
+
 def get_timezone(latitude, longitude):
-    # Instantiate the TimezoneFinder object
-    tz_finder = TimezoneFinder()
+    return get_timezone_finder().timezone_at(lat=latitude, lng=longitude)
+
+@metrics_utils.timed("geo")
+def get_site(latitude, longitude):
+    """
+    Returns the metadata of a site: elevation, location name and timezone.
+
+    The location name and timezone are looked up once per coarse location
+    (latitude and longitude rounded to SITE_CACHE_PRECISION decimals), and
+    the elevation once per exact location; both are then served from memory.
+
+    Parameters:
+        latitude (float): The latitude coordinate for the location.
+        longitude (float): The longitude coordinate for the location.
+
+    Returns:
+        dict: The 'latitude' and 'longitude', 'elevation' (in meters),
+            'location_name' and 'timezone' (e.g. 'America/Toronto') of the site.
+
+    Example:
+        site = get_site(43.4494, -80.5752)
+        print(site['timezone'])  # Output: America/Toronto
+    """
+
+    key = (round(latitude, SITE_CACHE_PRECISION), round(longitude, SITE_CACHE_PRECISION))
+
+    site = site_cache.get(key)
+
+    if site is None:
+        latitude_course, longitude_course = key
+
+        site = {
+            "location_name": get_location_name(latitude_course, longitude_course),
+            "timezone": get_timezone(latitude_course, longitude_course)
+        }
+
+        site_cache.put(key, site)
+
+    elevation = elevation_cache.get((latitude, longitude))
 
-    timezone = tz_finder.timezone_at(lat=latitude, lng=longitude)
+    if elevation is None:
+        elevation = get_elevation(latitude, longitude)
+        elevation_cache.put((latitude, longitude), elevation)
 
-    return timezone
\ No newline at end of file
+    return dict(site, latitude=latitude, longitude=longitude, elevation=elevation)
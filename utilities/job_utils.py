@@ -0,0 +1,327 @@
+# job_utils.py
+
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+import datetime
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import pytz
+from utilities import lazy_utils
+from utilities import storage_utils
+
+# Imported by the worker when it runs its first job (see lazy_utils)
+time_utils = lazy_utils.lazy_import('utilities.time_utils')
+
+# Generation jobs are queued in a local SQLite database, so they survive a restart
+JOBS_DB_PATH = os.environ.get('JOBS_DB_PATH', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'jobs.sqlite3'))
+
+# Number of processes computing months in parallel (defaults to OPTIMAL_TIMES_WORKERS, see time_utils)
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', os.environ.get('OPTIMAL_TIMES_WORKERS', os.cpu_count() or 1)))
+
+# How often the worker looks for queued jobs when it has not been notified, in seconds
+JOB_POLL_SECONDS = float(os.environ.get('JOB_POLL_SECONDS', 5))
+
+# A running job is queued again when its worker has not refreshed its heartbeat for this long, in seconds
+JOB_LEASE_SECONDS = float(os.environ.get('JOB_LEASE_SECONDS', 120))
+JOB_HEARTBEAT_SECONDS = JOB_LEASE_SECONDS / 4
+
+JOB_STATUS_QUEUED = "queued"
+JOB_STATUS_RUNNING = "running"
+JOB_STATUS_DONE = "done"
+JOB_STATUS_FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    latitude REAL NOT NULL,
+    longitude REAL NOT NULL,
+    start_date TEXT NOT NULL,
+    end_date TEXT NOT NULL,
+    months_total INTEGER NOT NULL,
+    months_done INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    worker_pid INTEGER,
+    worker_token TEXT,
+    heartbeat_at REAL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS job_months (
+    job_id TEXT NOT NULL,
+    month TEXT NOT NULL,
+    status TEXT NOT NULL,
+    PRIMARY KEY (job_id, month)
+);
+"""
+
+# Columns added after the first version of the schema, created by init_db in existing databases
+_ADDED_COLUMNS = {"worker_token": "TEXT", "heartbeat_at": "REAL"}
+
+# Identifies the jobs run by this process: unlike its PID, it is never reused by a later process (e.g. after a container restart)
+_worker_token = uuid.uuid4().hex
+
+_worker_thread = None
+_wake_event = threading.Event()
+
+@contextmanager
+def _connect():
+    # One connection per operation, committed on success and always closed
+    connection = sqlite3.connect(JOBS_DB_PATH, timeout=30)
+    connection.row_factory = sqlite3.Row
+
+    try:
+        with connection:
+            yield connection
+    finally:
+        connection.close()
+
+def _now():
+    return datetime.datetime.now(pytz.utc).isoformat()
+
+def _parse_month(month):
+    return pytz.utc.localize(datetime.datetime.strptime(month, '%Y-%m-%d'))
+
+def init_db():
+    """
+    Creates the job tables if they do not exist.
+    """
+
+    with _connect() as connection:
+        connection.executescript(_SCHEMA)
+
+        columns = {row["name"] for row in connection.execute("PRAGMA table_info(jobs)")}
+
+        for name, column_type in _ADDED_COLUMNS.items():
+            if name not in columns:
+                connection.execute(f"ALTER TABLE jobs ADD COLUMN {name} {column_type}")
+
+def submit_generation_job(start_datetime, end_datetime, latitude, longitude):
+    """
+    Queues the generation of the optimal times of every month in a time range.
+
+    Parameters:
+        start_datetime (datetime): The starting datetime of the range (UTC).
+        end_datetime (datetime): The ending datetime of the range (UTC).
+        latitude (float): The latitude coordinate for the location.
+        longitude (float): The longitude coordinate for the location.
+
+    Returns:
+        str: The ID of the job, to be passed to get_job.
+
+    Example:
+        job_id = submit_generation_job(start_datetime, end_datetime, 43.4494, -80.5752)
+        print(get_job(job_id)["status"])  # Output: queued
+    """
+
+    months = time_utils.get_first_days_of_month_for_time_range(start_datetime, end_datetime)
+
+    job_id = uuid.uuid4().hex
+    now = _now()
+
+    with _connect() as connection:
+        connection.execute(
+            "INSERT INTO jobs (id, status, latitude, longitude, start_date, end_date, months_total, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, JOB_STATUS_QUEUED, latitude, longitude, start_datetime.isoformat(), end_datetime.isoformat(), len(months), now, now)
+        )
+        connection.executemany(
+            "INSERT INTO job_months (job_id, month, status) VALUES (?, ?, ?)",
+            [(job_id, month.strftime('%Y-%m-%d'), JOB_STATUS_QUEUED) for month in months]
+        )
+
+    _wake_event.set()
+
+    return job_id
+
+def get_job(job_id):
+    """
+    Returns the status and progress of a job, or None if there is no such job.
+    """
+
+    with _connect() as connection:
+        job = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+    if job is None:
+        return None
+
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "latitude": job["latitude"],
+        "longitude": job["longitude"],
+        "start_date": job["start_date"],
+        "end_date": job["end_date"],
+        "months_total": job["months_total"],
+        "months_done": job["months_done"],
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"]
+    }
+
+def _requeue_interrupted_jobs():
+    # Jobs left 'running' by a worker that stopped refreshing their heartbeat are queued again; finished months are kept.
+    # A job of another process with this process's PID is stale straight away: its process was replaced by this one.
+    with _connect() as connection:
+        connection.execute(
+            "UPDATE jobs SET status = ?, worker_pid = NULL, worker_token = NULL, updated_at = ? "
+            "WHERE status = ? AND worker_token IS NOT ? AND (heartbeat_at IS NULL OR heartbeat_at < ? OR worker_pid = ?)",
+            (JOB_STATUS_QUEUED, _now(), JOB_STATUS_RUNNING, _worker_token, time.time() - JOB_LEASE_SECONDS, os.getpid())
+        )
+
+@contextmanager
+def _heartbeat(job_id, logger):
+    # Refreshes the heartbeat of a running job from a background thread until the block exits
+    stopped = threading.Event()
+
+    def beat():
+        while not stopped.wait(JOB_HEARTBEAT_SECONDS):
+            # A failed refresh (e.g. the database is locked) is retried on the next beat, within the lease
+            try:
+                with _connect() as connection:
+                    connection.execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND worker_token = ?", (time.time(), job_id, _worker_token))
+            except sqlite3.Error:
+                logger.exception(f"Refreshing the heartbeat of optimal times job {job_id} failed")
+
+    thread = threading.Thread(target=beat, name=f"optimal-times-job-{job_id}-heartbeat", daemon=True)
+    thread.start()
+
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
+
+def _claim_next_job():
+    # Atomically move the oldest queued job to 'running', so only one process runs it
+    with _connect() as connection:
+        job = connection.execute("SELECT * FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (JOB_STATUS_QUEUED,)).fetchone()
+
+        if job is None:
+            return None
+
+        claimed = connection.execute("UPDATE jobs SET status = ?, worker_pid = ?, worker_token = ?, heartbeat_at = ?, updated_at = ? WHERE id = ? AND status = ?",
+                                     (JOB_STATUS_RUNNING, os.getpid(), _worker_token, time.time(), _now(), job["id"], JOB_STATUS_QUEUED)).rowcount
+
+    return job if claimed else None
+
+def _finish_month(job_id, month):
+    with _connect() as connection:
+        connection.execute("UPDATE job_months SET status = ? WHERE job_id = ? AND month = ?", (JOB_STATUS_DONE, job_id, month))
+        connection.execute("UPDATE jobs SET months_done = (SELECT COUNT(*) FROM job_months WHERE job_id = ? AND status = ?), updated_at = ? WHERE id = ?",
+                           (job_id, JOB_STATUS_DONE, _now(), job_id))
+
+def _finish_job(job_id, status, error=None):
+    with _connect() as connection:
+        connection.execute("UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE id = ?", (status, error, _now(), job_id))
+
+def _run_job(job, executor):
+    job_id = job["id"]
+    latitude = job["latitude"]
+    longitude = job["longitude"]
+
+    with _connect() as connection:
+        months = [row["month"] for row in connection.execute("SELECT month FROM job_months WHERE job_id = ? AND status != ? ORDER BY month", (job_id, JOB_STATUS_DONE))]
+
+    latitude_course = round(latitude, 2)
+    longitude_course = round(longitude, 2)
+
+    store = storage_utils.get_optimal_times_store()
+
+    # Months that are already stored (e.g. generated by a request) are not computed again
+    months_times = time_utils.load_months_optimal_times(store, [_parse_month(month) for month in months], latitude_course, longitude_course)
+
+    missing_months = []
+
+    for month in months:
+        first_day_of_month = _parse_month(month)
+
+        if months_times[first_day_of_month] is not None:
+            _finish_month(job_id, month)
+        else:
+            missing_months.append(first_day_of_month)
+
+    def finish_months(first_day_of_month_list):
+        for first_day_of_month in first_day_of_month_list:
+            _finish_month(job_id, first_day_of_month.strftime('%Y-%m-%d'))
+
+    # Claim the months like a request does, so a month is not generated by both; persist them as soon as they are computed
+    time_utils.generate_months_optimal_times(store, missing_months, latitude, longitude, executor, JOB_WORKERS, on_commit=finish_months)
+
+def _create_executor():
+    return time_utils.create_process_pool(JOB_WORKERS)
+
+def _worker_loop(app):
+    # The pool is created for the first job, not at startup
+    executor = None
+
+    while True:
+        try:
+            job = _claim_next_job()
+        except sqlite3.Error:
+            app.logger.exception("Claiming the next optimal times job failed")
+            job = None
+
+        if job is None:
+            # Also picks up the jobs of workers that stopped (e.g. another process that crashed)
+            try:
+                _requeue_interrupted_jobs()
+            except sqlite3.Error:
+                app.logger.exception("Requeuing interrupted optimal times jobs failed")
+
+            _wake_event.wait(JOB_POLL_SECONDS)
+            _wake_event.clear()
+            continue
+
+        with app.app_context():
+            try:
+                executor = executor or _create_executor()
+
+                with _heartbeat(job["id"], app.logger):
+                    _run_job(job, executor)
+
+                status, error = JOB_STATUS_DONE, None
+            except Exception as e:
+                app.logger.exception(f"Optimal times job {job['id']} failed")
+                status, error = JOB_STATUS_FAILED, str(e)
+
+                # A pool with a crashed process cannot run anything else
+                if isinstance(e, BrokenProcessPool):
+                    executor.shutdown(wait=False)
+                    executor = _create_executor()
+
+            # If this fails, the job stays 'running' until its lease expires and it is queued again
+            try:
+                _finish_job(job["id"], status, error)
+            except sqlite3.Error:
+                app.logger.exception(f"Recording the status of optimal times job {job['id']} failed")
+
+def start_worker(app):
+    """
+    Starts the background thread that runs queued generation jobs.
+
+    Called by create_app when JOB_WORKER is set. With several app processes
+    sharing JOBS_DB_PATH, set it in one of them only: the others just queue
+    jobs (see init_db).
+
+    Jobs interrupted by a restart (still 'running' but with a heartbeat
+    older than JOB_LEASE_SECONDS) are queued again; their finished months
+    are not recomputed.
+
+    Parameters:
+        app (Flask): The application, used to give the worker an app context.
+    """
+
+    global _worker_thread
+
+    if _worker_thread is not None:
+        return
+
+    init_db()
+    _requeue_interrupted_jobs()
+
+    _worker_thread = threading.Thread(target=_worker_loop, args=(app,), name="optimal-times-jobs", daemon=True)
+    _worker_thread.start()
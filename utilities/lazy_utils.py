@@ -0,0 +1,41 @@
+# lazy_utils.py
+
+import importlib
+import sys
+
+class LazyModule:
+    """
+    Stands in for a module that is imported on first attribute access.
+
+    Used for the modules that are slow to import (astropy, astroplan,
+    firebase_admin, google.cloud.firestore) so that importing the app
+    stays cheap; the cost is paid by the first request that needs them,
+    or ahead of time by the pre-warm thread (see warmup_utils).
+
+    The import itself goes through importlib, which is thread-safe, so
+    concurrent first accesses import the module once.
+
+    Example:
+        time_utils = lazy_import('utilities.time_utils')
+        time_utils.get_optimal_times(...)  # utilities.time_utils is imported here
+    """
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attribute):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+
+        return getattr(self._module, attribute)
+
+    def __repr__(self):
+        return f"<lazy module '{self._name}' ({'imported' if self._name in sys.modules else 'not imported'})>"
+
+def lazy_import(name):
+    """
+    Returns the module if it is already imported, otherwise a LazyModule that imports it on first use.
+    """
+
+    return sys.modules.get(name) or LazyModule(name)
@@ -0,0 +1,224 @@
+# metrics_utils.py
+
+from contextlib import contextmanager
+import bisect
+import contextvars
+import functools
+import io
+import pstats
+import threading
+import time
+
+# Upper bounds of the histogram buckets, in seconds (the Prometheus client defaults)
+HISTOGRAM_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# The spans of the current request (None outside a request); contextvars keep concurrent requests apart
+_request_spans = contextvars.ContextVar('request_spans', default=None)
+
+class Histogram:
+    """
+    Counts observations in cumulative buckets, as a Prometheus histogram.
+    """
+
+    def __init__(self, buckets=HISTOGRAM_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        """
+        Returns the cumulative count of each bucket (the last one is +Inf), the sum and the count.
+        """
+
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+
+        cumulative = []
+        running = 0
+
+        for bucket_count in counts:
+            running += bucket_count
+            cumulative.append(running)
+
+        return cumulative, total, count
+
+class Registry:
+    """
+    The histograms of the process, keyed by metric name and label values.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, help_text, labels, value):
+        key = (name, tuple(sorted(labels.items())))
+
+        histogram = self._metrics.get(key)
+
+        if histogram is None:
+            with self._lock:
+                histogram = self._metrics.setdefault(key, (help_text, Histogram()))
+
+        histogram[1].observe(value)
+
+    def render(self):
+        """
+        Returns every histogram in the Prometheus text exposition format.
+        """
+
+        with self._lock:
+            metrics = sorted(self._metrics.items())
+
+        lines = []
+        previous_name = None
+
+        for (name, labels), (help_text, histogram) in metrics:
+            if name != previous_name:
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} histogram")
+                previous_name = name
+
+            cumulative, total, count = histogram.snapshot()
+            label_text = ",".join(f'{label}="{_escape(value)}"' for label, value in labels)
+
+            for bound, bucket_count in zip([*histogram.buckets, float('inf')], cumulative):
+                le = "+Inf" if bound == float('inf') else repr(bound)
+                lines.append(f'{name}_bucket{{{label_text}{"," if label_text else ""}le="{le}"}} {bucket_count}')
+
+            lines.append(f"{name}_sum{{{label_text}}} {total!r}")
+            lines.append(f"{name}_count{{{label_text}}} {count}")
+
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def record_span(name, seconds):
+    """
+    Records the duration of a span: in the current request (for its
+    Server-Timing header) and in the astroplanner_span_seconds histogram.
+    """
+
+    spans = _request_spans.get()
+
+    if spans is not None:
+        spans.append((name, seconds))
+
+    registry.observe("astroplanner_span_seconds", "Time spent in instrumented code paths.", {"span": name}, seconds)
+
+@contextmanager
+def span(name):
+    """
+    Times a block of code as a span (see record_span).
+
+    Example:
+        with span("fetch"):
+            documents = store.query_months_ranges(date_ranges, 43.45, -80.58)
+    """
+
+    started = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - started)
+
+def timed(name):
+    """
+    Decorator that times every call of a function as a span (see record_span).
+
+    Example:
+        @timed("resolve")
+        def resolve_target(target_id):
+            ...
+    """
+
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+def start_request():
+    """
+    Starts collecting the spans of a request. Returns the token to pass to end_request.
+    """
+
+    return _request_spans.set([])
+
+def end_request(token):
+    """
+    Stops collecting the spans of a request and returns them as (name, seconds) pairs.
+    """
+
+    spans = _request_spans.get() or []
+    _request_spans.reset(token)
+
+    return spans
+
+def get_server_timing(spans, total_seconds=None):
+    """
+    Formats spans as a Server-Timing header value, in milliseconds.
+
+    Spans with the same name are added up, in the order they first occurred.
+
+    Example:
+        print(get_server_timing([("geo", 0.0012), ("fetch", 0.0203), ("fetch", 0.0051)], 0.031))
+        # Output: geo;dur=1.2, fetch;dur=25.4;desc="2 calls", total;dur=31.0
+    """
+
+    durations = {}
+    calls = {}
+
+    for name, seconds in spans:
+        durations[name] = durations.get(name, 0.0) + seconds
+        calls[name] = calls.get(name, 0) + 1
+
+    entries = [f'{name};dur={seconds * 1000:.1f}' + (f';desc="{calls[name]} calls"' if calls[name] > 1 else '') for name, seconds in durations.items()]
+
+    if total_seconds is not None:
+        entries.append(f"total;dur={total_seconds * 1000:.1f}")
+
+    return ", ".join(entries)
+
+def observe_request(endpoint, method, status, seconds):
+    """
+    Records the duration of a request in the astroplanner_request_seconds histogram.
+    """
+
+    registry.observe("astroplanner_request_seconds", "Time spent handling requests.",
+                     {"endpoint": endpoint or "unknown", "method": method, "status": str(status)}, seconds)
+
+def get_profile_summary(profiler, limit=40):
+    """
+    Returns the functions of a cProfile.Profile run that took the most time (cumulative), as text.
+    """
+
+    stream = io.StringIO()
+    pstats.Stats(profiler, stream=stream).strip_dirs().sort_stats('cumulative').print_stats(limit)
+
+    return stream.getvalue()
+
+def render_metrics():
+    """
+    Returns the metrics of this process in the Prometheus text format (served at /metrics).
+    """
+
+    return registry.render()
@@ -0,0 +1,252 @@
+# resolver_utils.py
+
+from astropy.coordinates import SkyCoord, get_constellation
+from astropy import units as u
+import json
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows: the cache file is then written without a lock
+    fcntl = None
+from utilities import catalog_utils
+from utilities import metrics_utils
+
+# Targets that are not in the local catalog are resolved with SkyCoord.from_name
+# (a Sesame/SIMBAD network lookup) once, and the result is kept in this file.
+RESOLVER_CACHE_PATH = os.environ.get('RESOLVER_CACHE_PATH', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'resolver_cache.json'))
+
+# Constellation names as written in the catalog, mapped to the names returned by astropy's get_constellation
+_CONSTELLATION_ALIASES = {
+    'serpens caput': 'serpens',
+    'serpens cauda': 'serpens',
+    'chamaeleon': 'chamaleon',
+    'ophiuchus': 'ophiucus',
+    'piscis austrinus': 'pisces austrinus'
+}
+
+_lock = threading.Lock()
+
+# Catalog entries keyed by canonical identifier and by common name, loaded by load_catalog_index
+_catalog_index = None
+_name_index = None
+
+# Resolved coordinates, (ra_deg, dec_deg) keyed by lookup key, or _AMBIGUOUS for
+# catalog entries whose declination sign is ambiguous (resolved remotely)
+_resolved = {}
+_AMBIGUOUS = ()
+_remote_cache = None
+
+_stats = {
+    "catalog_hits": 0,
+    "remote_cache_hits": 0,
+    "remote_lookups": 0,
+    "remote_failures": 0
+}
+
+def _normalize_constellation(name):
+    name = catalog_utils.normalize_name(name)
+
+    return _CONSTELLATION_ALIASES.get(name, name)
+
+def get_lookup_key(target_id):
+    # Identifiers are compared in canonical form (M 31 -> M31), anything else by name
+    return catalog_utils.normalize_identifier(target_id) or catalog_utils.normalize_name(target_id)
+
+def load_catalog_index(path=None):
+    """
+    Loads the local catalog into the in-memory index used to resolve targets.
+
+    Parameters:
+        path (str): The catalog CSV. Defaults to catalog_utils.CATALOG_PATH.
+
+    Returns:
+        int: The number of catalog entries indexed.
+    """
+
+    global _catalog_index, _name_index
+
+    catalog_index = {}
+    name_index = {}
+
+    for row in catalog_utils.read_catalog(path):
+        coordinates = catalog_utils.get_coordinates(row)
+
+        if coordinates is None:
+            continue
+
+        entry = coordinates + (row.get('constellation', ''),)
+
+        for identifier in catalog_utils.get_identifiers(row):
+            catalog_index.setdefault(identifier, entry)
+
+        for name in catalog_utils.get_names(row):
+            name_index.setdefault(catalog_utils.normalize_name(name), entry)
+
+    with _lock:
+        _catalog_index = catalog_index
+        _name_index = name_index
+        _resolved.clear()
+
+    return len(catalog_index)
+
+def _read_remote_cache_file():
+    try:
+        with open(RESOLVER_CACHE_PATH, mode='r') as cache_file:
+            return json.load(cache_file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def _load_remote_cache():
+    global _remote_cache
+
+    if _remote_cache is None:
+        _remote_cache = _read_remote_cache_file()
+
+    return _remote_cache
+
+def _save_remote_cache():
+    # Several processes (web workers, the job worker) share the file: under an exclusive lock,
+    # the entries other processes saved since it was read are merged in, so none are overwritten
+    with open(f"{RESOLVER_CACHE_PATH}.lock", mode='a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+        try:
+            for key, coordinates in _read_remote_cache_file().items():
+                _remote_cache.setdefault(key, coordinates)
+
+            # Write to a temporary file first so a crash never leaves a truncated cache behind
+            temporary_path = f"{RESOLVER_CACHE_PATH}.{os.getpid()}.tmp"
+
+            with open(temporary_path, mode='w') as cache_file:
+                json.dump(_remote_cache, cache_file)
+
+            os.replace(temporary_path, RESOLVER_CACHE_PATH)
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _catalog_coordinates(entry):
+    """
+    Returns the (ra_deg, dec_deg) of a catalog entry, or None if its declination sign is ambiguous.
+
+    The catalog export lost the minus sign of southern declinations (dec_sign
+    is '+' for every row), so a '+' is not trusted. Instead, both signs are
+    tried and the one that lands in the constellation recorded for the
+    object is used. Near the equator both candidates can fall in the same
+    constellation; those entries are left to the remote resolver.
+    """
+
+    ra_deg, dec_deg, dec_sign, constellation = entry
+
+    if dec_sign == '-':
+        return ra_deg, -dec_deg
+
+    if dec_deg == 0:
+        return ra_deg, dec_deg
+
+    candidates = SkyCoord(ra=[ra_deg, ra_deg] * u.deg, dec=[dec_deg, -dec_deg] * u.deg)
+    matches = [_normalize_constellation(name) == _normalize_constellation(constellation) for name in get_constellation(candidates)]
+
+    if matches == [True, False]:
+        return ra_deg, dec_deg
+    if matches == [False, True]:
+        return ra_deg, -dec_deg
+
+    return None
+
+@metrics_utils.timed("resolve")
+def resolve_target(target_id):
+    """
+    Resolves a target name or identifier (e.g. 'M31', 'NGC 224', 'Orion Nebula') to coordinates.
+
+    The local catalog index is tried first. On a miss, the target is resolved
+    with SkyCoord.from_name and the result is stored in RESOLVER_CACHE_PATH,
+    so each target needs at most one network lookup.
+
+    Parameters:
+        target_id (str): The name or identifier of the target.
+
+    Returns:
+        SkyCoord: The ICRS coordinates of the target.
+
+    Raises:
+        NameResolveError: If the target is not in the catalog and cannot be resolved remotely.
+
+    Example:
+        target_coord = resolve_target("M 31")
+        print(round(target_coord.ra.deg, 3), round(target_coord.dec.deg, 3))  # Output: 10.683 41.269
+    """
+
+    if _catalog_index is None:
+        load_catalog_index()
+
+    key = get_lookup_key(target_id)
+
+    with _lock:
+        coordinates = _resolved.get(key)
+
+    if coordinates is None:
+        entry = _catalog_index.get(key) or _name_index.get(key)
+
+        if entry is not None:
+            coordinates = _catalog_coordinates(entry) or _AMBIGUOUS
+
+            with _lock:
+                _resolved[key] = coordinates
+
+    if coordinates:
+        with _lock:
+            _stats["catalog_hits"] += 1
+    else:
+        coordinates = _resolve_remote(key, target_id)
+
+    return SkyCoord(ra=coordinates[0] * u.deg, dec=coordinates[1] * u.deg, frame='icrs')
+
+def _resolve_remote(key, target_id):
+    with _lock:
+        coordinates = _load_remote_cache().get(key)
+
+        if coordinates is not None:
+            _stats["remote_cache_hits"] += 1
+            return tuple(coordinates)
+
+        _stats["remote_lookups"] += 1
+
+    try:
+        target_coord = SkyCoord.from_name(catalog_utils.normalize_identifier(target_id) or target_id)
+    except Exception:
+        with _lock:
+            _stats["remote_failures"] += 1
+        raise
+
+    coordinates = (float(target_coord.icrs.ra.deg), float(target_coord.icrs.dec.deg))
+
+    with _lock:
+        _load_remote_cache()[key] = list(coordinates)
+        _save_remote_cache()
+
+    return coordinates
+
+def get_stats():
+    """
+    Returns the resolver counters and hit rates.
+    """
+
+    with _lock:
+        stats = dict(_stats)
+        remote_cache_size = len(_remote_cache) if _remote_cache is not None else None
+        catalog_size = len(_catalog_index) if _catalog_index is not None else None
+
+    lookups = stats["catalog_hits"] + stats["remote_cache_hits"] + stats["remote_lookups"]
+
+    stats["lookups"] = lookups
+    stats["catalog_hit_rate"] = stats["catalog_hits"] / lookups if lookups else None
+    stats["local_hit_rate"] = (stats["catalog_hits"] + stats["remote_cache_hits"]) / lookups if lookups else None
+    stats["catalog_entries"] = catalog_size
+    stats["remote_cache_entries"] = remote_cache_size
+
+    return stats
@@ -0,0 +1,303 @@
+# search_utils.py
+
+import bisect
+import heapq
+import os
+import threading
+import time
+from utilities import catalog_utils
+
+# How often (at most) a search checks whether the catalog file has changed, in seconds
+SEARCH_INDEX_REFRESH_SECONDS = float(os.environ.get('SEARCH_INDEX_REFRESH_SECONDS', 60))
+
+# Ranks of the ways a term can match a query (lower ranks first)
+RANK_EXACT_IDENTIFIER = 0
+RANK_EXACT_NAME = 1
+RANK_EXACT_KEYWORD = 2
+RANK_PREFIX_IDENTIFIER = 3
+RANK_PREFIX_NAME = 4
+RANK_PREFIX_KEYWORD = 5
+
+# Magnitude used to sort objects without one after every object that has one
+_UNKNOWN_MAGNITUDE = 99.0
+
+KIND_IDENTIFIER = 'identifier'
+KIND_NAME = 'name'
+KIND_KEYWORD = 'keyword'
+
+def normalize_query_term(value):
+    """
+    Returns the index term for a query: identifiers in canonical form (m 31 -> m31), anything else lower case.
+    """
+
+    identifier = catalog_utils.normalize_identifier(value)
+
+    if identifier:
+        return identifier.lower()
+
+    return catalog_utils.normalize_name(value)
+
+def _get_entry(row):
+    # Everything the index needs from a catalog row
+    identifiers = catalog_utils.get_identifiers(row)
+
+    if not identifiers:
+        return None
+
+    names = catalog_utils.get_names(row)
+    magnitude = catalog_utils.get_magnitude(row)
+
+    terms = []
+    terms += [(identifier.lower(), KIND_IDENTIFIER, identifier) for identifier in identifiers]
+    terms += [(catalog_utils.normalize_name(name), KIND_NAME, None) for name in names]
+    terms += [(keyword, KIND_KEYWORD, None) for keyword in catalog_utils.get_keywords(row)]
+
+    return {
+        "key": identifiers[0],
+        "id": catalog_utils.get_display_identifier(row),
+        "object_name": names[0] if names else None,
+        "magnitude": magnitude if magnitude is not None else _UNKNOWN_MAGNITUDE,
+        "terms": list(dict.fromkeys(terms)),
+        "row": row
+    }
+
+class SearchIndex:
+    """
+    In-memory search index over the Messier/NGC/IC catalog.
+
+    Every identifier (M31, NGC224, ...), full common name and name keyword
+    of an object is a term. Terms are kept in a sorted list, so a prefix
+    query is a binary search followed by a scan of the matching range.
+    Results are ranked by how the query matched (exact identifier, exact
+    name, exact keyword, then prefix matches), then by brightness.
+
+    The index is loaded from the catalog CSV. When the file changes, only
+    the objects that were added, removed or modified are re-indexed.
+
+    Example:
+        index = SearchIndex()
+        index.load()
+        print(index.search("andromeda")[0])
+        # Output: {'id': 'M31', 'display_name': 'M31 - Andromeda Galaxy'}
+    """
+
+    def __init__(self, path=None):
+        self.path = path or catalog_utils.CATALOG_PATH
+
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._postings = {}
+        self._terms = []
+
+        self._mtime = None
+        self._checked_at = 0.0
+
+    @property
+    def ready(self):
+        return self._mtime is not None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load(self):
+        """
+        Loads the catalog, re-indexing only the objects that changed since the last load.
+
+        Returns:
+            dict: The number of objects added, updated and removed.
+        """
+
+        mtime = os.path.getmtime(self.path)
+
+        changes = self._update(catalog_utils.read_catalog(self.path))
+
+        with self._lock:
+            self._mtime = mtime
+            self._checked_at = time.monotonic()
+
+        return changes
+
+    def _update(self, rows):
+        # Index the rows, replacing the previous ones; returns the number of objects added, updated and removed
+        entries = {}
+
+        for row in rows:
+            entry = _get_entry(row)
+
+            if entry is not None:
+                entries[entry["key"]] = entry
+
+        with self._lock:
+            removed = [key for key in self._entries if key not in entries]
+            updated = [key for key, entry in entries.items() if key in self._entries and self._entries[key]["row"] != entry["row"]]
+            added = [key for key in entries if key not in self._entries]
+
+            for key in removed + updated:
+                self._remove_entry(self._entries.pop(key))
+
+            for key in updated + added:
+                self._add_entry(entries[key])
+
+        return {"added": len(added), "updated": len(updated), "removed": len(removed)}
+
+    def refresh(self):
+        """
+        Reloads the catalog if the file changed (checked at most every SEARCH_INDEX_REFRESH_SECONDS).
+        """
+
+        if time.monotonic() - self._checked_at < SEARCH_INDEX_REFRESH_SECONDS:
+            return None
+
+        self._checked_at = time.monotonic()
+
+        try:
+            changed = os.path.getmtime(self.path) != self._mtime
+        except OSError:
+            return None
+
+        return self.load() if changed else None
+
+    def _add_entry(self, entry):
+        self._entries[entry["key"]] = entry
+
+        for term, kind, identifier in entry["terms"]:
+            postings = self._postings.get(term)
+
+            if postings is None:
+                postings = self._postings[term] = {}
+                bisect.insort(self._terms, term)
+
+            postings[entry["key"]] = (kind, identifier)
+
+    def _remove_entry(self, entry):
+        for term, kind, identifier in entry["terms"]:
+            postings = self._postings.get(term)
+
+            if postings is None:
+                continue
+
+            postings.pop(entry["key"], None)
+
+            if not postings:
+                del self._postings[term]
+                del self._terms[bisect.bisect_left(self._terms, term)]
+
+    def _match(self, query_term):
+        # Best (rank, identifier) per object key for every term starting with query_term
+        matches = {}
+
+        start = bisect.bisect_left(self._terms, query_term)
+
+        for position in range(start, len(self._terms)):
+            term = self._terms[position]
+
+            if not term.startswith(query_term):
+                break
+
+            exact = term == query_term
+
+            for key, (kind, identifier) in self._postings[term].items():
+                if kind == KIND_IDENTIFIER:
+                    rank = RANK_EXACT_IDENTIFIER if exact else RANK_PREFIX_IDENTIFIER
+                elif kind == KIND_NAME:
+                    rank = RANK_EXACT_NAME if exact else RANK_PREFIX_NAME
+                else:
+                    rank = RANK_EXACT_KEYWORD if exact else RANK_PREFIX_KEYWORD
+
+                if key not in matches or rank < matches[key][0]:
+                    matches[key] = (rank, identifier)
+
+        return matches
+
+    def search(self, query, limit=50):
+        """
+        Returns ranked, de-duplicated suggestions for a search query.
+
+        A query made of several words matches the objects that match every
+        word; a query that is a full name or identifier ('Orion Nebula',
+        'NGC 224') is also matched as a whole.
+
+        Parameters:
+            query (str): The text typed by the user.
+            limit (int): The maximum number of suggestions.
+
+        Returns:
+            list[dict]: The suggestions, each with an 'id' and a 'display_name'.
+        """
+
+        query = (query or '').strip()
+
+        if not query:
+            return []
+
+        self.refresh()
+
+        return self._search(query, limit)
+
+    def _search(self, query, limit):
+        with self._lock:
+            # The whole query, as a name or identifier
+            matches = self._match(normalize_query_term(query))
+
+            # Every word of the query, as keywords (identifiers such as 'NGC 224' are only matched as a whole)
+            words = query.lower().split()
+
+            if len(words) > 1 and not catalog_utils.normalize_identifier(query):
+                word_matches = None
+
+                for word in words:
+                    matched = self._match(word)
+
+                    if word_matches is None:
+                        word_matches = {key: rank for key, (rank, identifier) in matched.items()}
+                    else:
+                        word_matches = {key: max(rank, matched[key][0]) for key, rank in word_matches.items() if key in matched}
+
+                for key, rank in word_matches.items():
+                    if key not in matches or rank < matches[key][0]:
+                        matches[key] = (rank, None)
+
+            best = heapq.nsmallest(limit, matches.items(), key=lambda item: (item[1][0], self._entries[item[0]]["magnitude"], item[0]))
+
+            suggestions = []
+
+            for key, (rank, identifier) in best:
+                entry = self._entries[key]
+
+                # Show the identifier the user searched for (e.g. NGC224 rather than M31)
+                id_value = identifier or entry["id"]
+                object_name = entry["object_name"]
+
+                suggestions.append(
+                    {
+                        "id": id_value,
+                        "display_name": f'{id_value} - {object_name}' if object_name else id_value
+                    }
+                )
+
+        return suggestions
+
+def search_rows(rows, query, limit=50):
+    """
+    Returns the suggestions SearchIndex.search would return for a query, among the given catalog rows.
+
+    Used to rank the objects of the astro objects store while the catalog
+    is not indexed (e.g. the documents of its search_keyword_prefix).
+
+    Example:
+        store = storage_utils.get_astro_objects_store()
+        print(search_rows(store.search_keyword_prefix("andromeda"), "andromeda")[0])
+        # Output: {'id': 'M31', 'display_name': 'M31 - Andromeda Galaxy'}
+    """
+
+    query = (query or '').strip()
+
+    if not query:
+        return []
+
+    index = SearchIndex()
+    index._update(rows)
+
+    return index._search(query, limit)
+
+search_index = SearchIndex()
@@ -0,0 +1,94 @@
+# session_utils.py
+
+import datetime
+import numpy as np
+import pytz
+
+# Samples closer together than this belong to the same session, in seconds
+MAX_SESSION_GAP_SECONDS = 20 * 60
+
+def find_sessions(unix_times, mask, local_timezone, min_session_length, interval_seconds=15 * 60, max_gap_seconds=MAX_SESSION_GAP_SECONDS):
+    """
+    Groups the selected samples of a regular time grid into sessions.
+
+    The samples are mapped to their index on the sample grid, runs of
+    consecutive indices are found with np.diff, and only the first and last
+    sample of each run are converted to local datetimes.
+
+    Parameters:
+        unix_times (numpy.ndarray): The sample times, in unix seconds, ascending.
+            Every time must lie on a grid of interval_seconds.
+        mask (numpy.ndarray): True for the samples to group (e.g. target above the minimum altitude).
+        local_timezone (pytz.timezone): The timezone used for the session start/end strings.
+        min_session_length (float): The minimum length of a session, in minutes.
+        interval_seconds (int): The spacing of the sample grid, in seconds.
+        max_gap_seconds (int): Samples at most this far apart are merged into one session.
+
+    Returns:
+        list[dict]: The sessions, each with a 'start', 'end' and 'duration' (in minutes).
+
+    Example:
+        unix_times = np.array([0, 900, 1800, 7200, 8100], dtype=float)
+        mask = np.array([True, True, True, True, False])
+        print(find_sessions(unix_times, mask, pytz.utc, 30))
+        # Output: [{'start': '1970-01-01 00:00:00', 'end': '1970-01-01 00:30:00', 'duration': 30.0}]
+    """
+
+    start_indices, end_indices = find_runs(unix_times, mask, interval_seconds, max_gap_seconds)
+
+    unix_times = np.asarray(unix_times, dtype=np.float64)
+
+    starts = unix_times[start_indices]
+    ends = unix_times[end_indices]
+
+    # Convert duration from seconds to minutes
+    durations = (ends - starts) / 60
+
+    keep = durations >= float(min_session_length)
+
+    sessions = []
+
+    for start, end, duration in zip(starts[keep], ends[keep], durations[keep]):
+        sessions.append({
+            'start': to_local_string(start, local_timezone),
+            'end': to_local_string(end, local_timezone),
+            'duration': float(duration)
+        })
+
+    return sessions
+
+def find_runs(unix_times, mask, interval_seconds=15 * 60, max_gap_seconds=MAX_SESSION_GAP_SECONDS):
+    """
+    Returns the positions of the first and last selected sample of every run of selected samples.
+
+    Parameters:
+        unix_times (numpy.ndarray): The sample times, in unix seconds, ascending.
+        mask (numpy.ndarray): True for the selected samples.
+        interval_seconds (int): The spacing of the sample grid, in seconds.
+        max_gap_seconds (int): Selected samples at most this far apart are in the same run.
+
+    Returns:
+        tuple[numpy.ndarray, numpy.ndarray]: The positions (into unix_times) of
+            the first and the last sample of each run.
+    """
+
+    selected_positions = np.flatnonzero(mask)
+
+    if selected_positions.size == 0:
+        return selected_positions, selected_positions
+
+    # Index of every selected sample on the grid, so gaps are measured in whole samples
+    sample_indices = np.rint(np.asarray(unix_times, dtype=np.float64)[selected_positions] / interval_seconds).astype(np.int64)
+
+    breaks = np.flatnonzero(np.diff(sample_indices) * interval_seconds > max_gap_seconds)
+
+    start_positions = selected_positions[np.concatenate(([0], breaks + 1))]
+    end_positions = selected_positions[np.concatenate((breaks, [selected_positions.size - 1]))]
+
+    return start_positions, end_positions
+
+def to_local_string(unix_time, local_timezone):
+    # Format a unix time as a local 'YYYY-MM-DD HH:MM:SS' string
+    utc_datetime = datetime.datetime.fromtimestamp(round(float(unix_time), 6), tz=pytz.utc)
+
+    return utc_datetime.astimezone(local_timezone).strftime('%Y-%m-%d %H:%M:%S')
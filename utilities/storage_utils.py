@@ -0,0 +1,517 @@
+# storage_utils.py
+
+from contextlib import contextmanager
+import datetime
+import json
+import os
+import sqlite3
+import threading
+import time
+import pytz
+from utilities import batch_utils
+from utilities import catalog_utils
+from utilities import lazy_utils
+
+# Only imported by the Firestore stores (see lazy_utils)
+firebase_admin = lazy_utils.lazy_import('firebase_admin')
+credentials = lazy_utils.lazy_import('firebase_admin.credentials')
+exceptions = lazy_utils.lazy_import('google.api_core.exceptions')
+base_query = lazy_utils.lazy_import('google.cloud.firestore_v1.base_query')
+async_db_utils = lazy_utils.lazy_import('utilities.async_db_utils')
+db_utils = lazy_utils.lazy_import('utilities.db_utils')
+
+# Where optimal times and astro objects are stored: 'firestore' or 'sqlite' (a local file, e.g. for edge deployments and benchmarks)
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'firestore')
+
+# The database of the 'sqlite' backend
+STORAGE_SQLITE_PATH = os.environ.get('STORAGE_SQLITE_PATH', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'storage.sqlite3'))
+
+# With the 'firestore' backend: a local SQLite file used as a read-through replica of the optimal times (empty to disable)
+STORAGE_REPLICA_PATH = os.environ.get('STORAGE_REPLICA_PATH', '')
+
+# Documents of months still being generated (see time_utils); they are never copied to a replica
+OPTIMAL_TIMES_STATUS_PENDING = "pending"
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS optimal_times (
+    id TEXT PRIMARY KEY,
+    latitude REAL NOT NULL,
+    longitude REAL NOT NULL,
+    start_date INTEGER NOT NULL,
+    end_date INTEGER,
+    status TEXT,
+    lease_expires_at REAL,
+    optimal_times_encoding INTEGER,
+    optimal_times_packed BLOB,
+    optimal_times TEXT
+);
+CREATE INDEX IF NOT EXISTS optimal_times_location_month ON optimal_times (latitude, longitude, start_date);
+CREATE TABLE IF NOT EXISTS astro_objects (
+    id TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS astro_object_keywords (
+    keyword TEXT NOT NULL,
+    object_id TEXT NOT NULL,
+    PRIMARY KEY (keyword, object_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS astro_object_keywords_object ON astro_object_keywords (object_id);
+"""
+
+_OPTIMAL_TIMES_COLUMNS = ['id', 'latitude', 'longitude', 'start_date', 'end_date', 'status', 'lease_expires_at',
+                          'optimal_times_encoding', 'optimal_times_packed', 'optimal_times']
+
+_backend = None
+_stores = {}
+_stores_lock = threading.Lock()
+
+def _get_month_starts(start_date, end_date):
+    # First days of the months in [start_date, end_date), start_date being the first day of a month
+    month_starts = []
+
+    while start_date < end_date:
+        month_starts.append(start_date)
+        start_date = start_date.replace(year=start_date.year + 1, month=1) if start_date.month == 12 else start_date.replace(month=start_date.month + 1)
+
+    return month_starts
+
+def _to_unix(value):
+    return value.timestamp() if value is not None else None
+
+def _from_unix(value):
+    return datetime.datetime.fromtimestamp(value, tz=pytz.utc) if value is not None else None
+
+def _is_expired_claim(document, now):
+    # A pending document whose worker did not store the month before its lease expired
+    return document is not None and document.get("status") == OPTIMAL_TIMES_STATUS_PENDING \
+        and document.get("lease_expires_at") is not None and document["lease_expires_at"] < now
+
+class FirestoreStore:
+    """
+    Base of the Firestore stores: every operation uses the given client, or
+    one from the process-wide pool (see db_utils.get_client).
+    """
+
+    collection_name = None
+
+    def __init__(self, db=None):
+        self._db = db
+
+    @property
+    def db(self):
+        return self._db or db_utils.get_client()
+
+    @property
+    def collection_ref(self):
+        return self.db.collection(self.collection_name)
+
+class FirestoreOptimalTimesStore(FirestoreStore):
+    """
+    The 'optimal_times' collection in Firestore.
+
+    Documents are dicts with start_date, end_date, latitude, longitude,
+    status and the encoded optimal times (see time_utils.get_optimal_times_document).
+    """
+
+    collection_name = "optimal_times"
+
+    def query_months(self, start_date, end_date, latitude_course, longitude_course):
+        """
+        Returns the documents of a location with start_date in [start_date, end_date), using one range query.
+
+        Needs the (latitude, longitude, start_date) composite index in firestore.indexes.json.
+        """
+
+        query_ref = self.collection_ref.where(filter=base_query.FieldFilter("latitude", "==", latitude_course)) \
+                                       .where(filter=base_query.FieldFilter("longitude", "==", longitude_course)) \
+                                       .where(filter=base_query.FieldFilter("start_date", ">=", start_date)) \
+                                       .where(filter=base_query.FieldFilter("start_date", "<", end_date))
+
+        return [result.to_dict() for result in query_ref.stream()]
+
+    def query_months_ranges(self, date_ranges, latitude_course, longitude_course):
+        """
+        Returns the documents of several ranges of months; the range queries run concurrently (see async_db_utils).
+        """
+
+        if len(date_ranges) == 1:
+            return self.query_months(date_ranges[0][0], date_ranges[0][1], latitude_course, longitude_course)
+
+        # With the injected client's project and database, if any
+        return async_db_utils.run(async_db_utils.fetch_optimal_times_ranges(date_ranges, latitude_course, longitude_course, db=self._db))
+
+    def get(self, document_id):
+        return self.collection_ref.document(document_id).get().to_dict()
+
+    def create(self, document_id, data):
+        # Returns False if the document already exists
+        try:
+            self.collection_ref.document(document_id).create(data)
+            return True
+        except exceptions.Conflict:
+            return False
+
+    def take_over(self, document_id, data, now):
+        """
+        Replaces an expired claim (see time_utils.claim_month). Returns False if the
+        document is not an expired claim, or another worker changed it first.
+        """
+
+        document_ref = self.collection_ref.document(document_id)
+        snapshot = document_ref.get()
+
+        if not snapshot.exists or not _is_expired_claim(snapshot.to_dict(), now):
+            return False
+
+        # The update only applies if the document is unchanged since it was read
+        try:
+            document_ref.update(data, option=self.db.write_option(last_update_time=snapshot.update_time))
+            return True
+        except (exceptions.FailedPrecondition, exceptions.NotFound):
+            return False
+
+    def set(self, document_id, data):
+        self.collection_ref.document(document_id).set(data)
+
+    def set_many(self, documents):
+        db = self.db
+        collection_ref = db.collection(self.collection_name)
+
+        # One batched write per (at most) 500 documents
+        for batch_documents in batch_utils.iter_batches(documents, batch_utils.MAX_BATCH_SIZE):
+            batch = db.batch()
+
+            for document_id, data in batch_documents:
+                batch.set(collection_ref.document(document_id), data)
+
+            batch.commit()
+
+    def delete(self, document_id):
+        self.collection_ref.document(document_id).delete()
+
+class SQLiteStore:
+    """
+    Base of the local SQLite stores: one connection per operation, committed on success and always closed.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or STORAGE_SQLITE_PATH
+
+        with self._connect() as connection:
+            # Readers do not block the writer (e.g. a generation job) and the other way around
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.executescript(_SQLITE_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.row_factory = sqlite3.Row
+
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+class SQLiteOptimalTimesStore(SQLiteStore):
+    """
+    The optimal times in a local SQLite database, indexed on (latitude, longitude, start_date).
+
+    Documents are the same dicts as in Firestore; dates are stored as unix seconds.
+    """
+
+    def _to_row(self, document_id, data):
+        return (
+            document_id,
+            data["latitude"],
+            data["longitude"],
+            _to_unix(data["start_date"]),
+            _to_unix(data.get("end_date")),
+            data.get("status"),
+            _to_unix(data.get("lease_expires_at")),
+            data.get("optimal_times_encoding"),
+            data.get("optimal_times_packed"),
+            json.dumps(data["optimal_times"]) if "optimal_times" in data else None
+        )
+
+    def _to_document(self, row):
+        document = {
+            "start_date": _from_unix(row["start_date"]),
+            "end_date": _from_unix(row["end_date"]),
+            "latitude": row["latitude"],
+            "longitude": row["longitude"]
+        }
+
+        for field in ["status", "optimal_times_encoding", "optimal_times_packed"]:
+            if row[field] is not None:
+                document[field] = row[field]
+
+        if row["lease_expires_at"] is not None:
+            document["lease_expires_at"] = _from_unix(row["lease_expires_at"])
+
+        if row["optimal_times"] is not None:
+            document["optimal_times"] = json.loads(row["optimal_times"])
+
+        return document
+
+    def query_months(self, start_date, end_date, latitude_course, longitude_course):
+        """
+        Returns the documents of a location with start_date in [start_date, end_date).
+        """
+
+        return self.query_months_ranges([(start_date, end_date)], latitude_course, longitude_course)
+
+    def query_months_ranges(self, date_ranges, latitude_course, longitude_course):
+        """
+        Returns the documents of several ranges of months (one indexed query per range, on one connection).
+        """
+
+        documents = []
+
+        with self._connect() as connection:
+            for start_date, end_date in date_ranges:
+                rows = connection.execute(
+                    "SELECT * FROM optimal_times WHERE latitude = ? AND longitude = ? AND start_date >= ? AND start_date < ?",
+                    (latitude_course, longitude_course, _to_unix(start_date), _to_unix(end_date))
+                )
+
+                documents += [self._to_document(row) for row in rows]
+
+        return documents
+
+    def get(self, document_id):
+        with self._connect() as connection:
+            row = connection.execute("SELECT * FROM optimal_times WHERE id = ?", (document_id,)).fetchone()
+
+        return self._to_document(row) if row is not None else None
+
+    def create(self, document_id, data):
+        # Returns False if the document already exists
+        with self._connect() as connection:
+            return connection.execute(f"INSERT OR IGNORE INTO optimal_times ({', '.join(_OPTIMAL_TIMES_COLUMNS)}) VALUES ({', '.join('?' * len(_OPTIMAL_TIMES_COLUMNS))})",
+                                      self._to_row(document_id, data)).rowcount == 1
+
+    def take_over(self, document_id, data, now):
+        # Replaces the document only if it is still an expired claim, in one statement
+        with self._connect() as connection:
+            return connection.execute(f"UPDATE optimal_times SET {', '.join(f'{column} = ?' for column in _OPTIMAL_TIMES_COLUMNS)} WHERE id = ? AND status = ? AND lease_expires_at < ?",
+                                      self._to_row(document_id, data) + (document_id, OPTIMAL_TIMES_STATUS_PENDING, _to_unix(now))).rowcount == 1
+
+    def set(self, document_id, data):
+        self.set_many([(document_id, data)])
+
+    def set_many(self, documents):
+        with self._connect() as connection:
+            connection.executemany(f"INSERT OR REPLACE INTO optimal_times ({', '.join(_OPTIMAL_TIMES_COLUMNS)}) VALUES ({', '.join('?' * len(_OPTIMAL_TIMES_COLUMNS))})",
+                                   [self._to_row(document_id, data) for document_id, data in documents])
+
+    def delete(self, document_id):
+        with self._connect() as connection:
+            connection.execute("DELETE FROM optimal_times WHERE id = ?", (document_id,))
+
+class ReplicatedOptimalTimesStore:
+    """
+    A store (e.g. Firestore) fronted by a local read-through replica (e.g. SQLite).
+
+    Range queries are answered by the replica when it holds every month of
+    the range; otherwise the primary is queried and the months it returns
+    are copied to the replica. Stored months never change, so the replica
+    does not need to be invalidated. Claims (pending documents) and single
+    document reads, used to coordinate generation, always go to the primary.
+    """
+
+    def __init__(self, primary, replica):
+        self.primary = primary
+        self.replica = replica
+
+    def _is_complete(self, documents, date_ranges):
+        months = {(document["start_date"].year, document["start_date"].month) for document in documents if document.get("status") != OPTIMAL_TIMES_STATUS_PENDING}
+
+        return all((month_start.year, month_start.month) in months
+                   for start_date, end_date in date_ranges for month_start in _get_month_starts(start_date, end_date))
+
+    def query_months(self, start_date, end_date, latitude_course, longitude_course):
+        return self.query_months_ranges([(start_date, end_date)], latitude_course, longitude_course)
+
+    def query_months_ranges(self, date_ranges, latitude_course, longitude_course):
+        documents = self.replica.query_months_ranges(date_ranges, latitude_course, longitude_course)
+
+        if self._is_complete(documents, date_ranges):
+            return documents
+
+        documents = self.primary.query_months_ranges(date_ranges, latitude_course, longitude_course)
+
+        self.replica.set_many([(_get_document_id(document), document) for document in documents if document.get("status") != OPTIMAL_TIMES_STATUS_PENDING])
+
+        return documents
+
+    def get(self, document_id):
+        return self.primary.get(document_id)
+
+    def create(self, document_id, data):
+        return self.primary.create(document_id, data)
+
+    def take_over(self, document_id, data, now):
+        return self.primary.take_over(document_id, data, now)
+
+    def set(self, document_id, data):
+        self.set_many([(document_id, data)])
+
+    def set_many(self, documents):
+        documents = list(documents)
+
+        self.primary.set_many(documents)
+        self.replica.set_many([(document_id, data) for document_id, data in documents if data.get("status") != OPTIMAL_TIMES_STATUS_PENDING])
+
+    def delete(self, document_id):
+        self.primary.delete(document_id)
+        self.replica.delete(document_id)
+
+def _get_document_id(document):
+    # The deterministic ID of an optimal times document (as time_utils.get_optimal_times_document_id)
+    return f"{document['start_date'].strftime('%Y-%m')}_{document['latitude']:.2f}_{document['longitude']:.2f}"
+
+class FirestoreAstroObjectsStore(FirestoreStore):
+    """
+    The 'astro_objects_full' collection in Firestore (see catalog_utils.get_document for the schema).
+    """
+
+    collection_name = "astro_objects_full"
+
+    def search_keyword_prefix(self, prefix):
+        """
+        Returns the objects with a keyword starting with prefix, with one array_contains query on their keyword prefixes.
+        """
+
+        query_ref = self.collection_ref.where(filter=base_query.FieldFilter(catalog_utils.KEYWORD_PREFIXES_FIELD, "array_contains", prefix))
+
+        return [result.to_dict() for result in query_ref.stream()]
+
+    def set_many(self, documents, on_progress=None):
+        db = self.db
+
+        return batch_utils.write_documents(db, db.collection(self.collection_name), documents, on_progress=on_progress)
+
+class SQLiteAstroObjectsStore(SQLiteStore):
+    """
+    The catalog objects in a local SQLite database, with an index of their keywords.
+    """
+
+    def search_keyword_prefix(self, prefix):
+        """
+        Returns the objects with a keyword starting with prefix, with a range scan of the keywords index.
+        """
+
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT data FROM astro_objects WHERE id IN (SELECT object_id FROM astro_object_keywords WHERE keyword >= ? AND keyword < ?)",
+                (prefix, prefix + '\uffff')
+            ).fetchall()
+
+        return [json.loads(row["data"]) for row in rows]
+
+    def set_many(self, documents, on_progress=None):
+        """
+        Writes (document_id, data) pairs, replacing existing objects, one
+        transaction per 500. Returns the number of objects written.
+        """
+
+        started = time.perf_counter()
+        written = 0
+
+        for batch_documents in batch_utils.iter_batches(documents, batch_utils.MAX_BATCH_SIZE):
+            with self._connect() as connection:
+                document_ids = [(document_id,) for document_id, data in batch_documents]
+
+                connection.executemany("DELETE FROM astro_object_keywords WHERE object_id = ?", document_ids)
+                connection.executemany("INSERT OR REPLACE INTO astro_objects (id, data) VALUES (?, ?)",
+                                       [(document_id, json.dumps(data)) for document_id, data in batch_documents])
+                connection.executemany("INSERT OR IGNORE INTO astro_object_keywords (keyword, object_id) VALUES (?, ?)",
+                                       [(keyword, document_id) for document_id, data in batch_documents for keyword in data.get(catalog_utils.KEYWORDS_FIELD, [])])
+
+            written += len(batch_documents)
+
+            if on_progress is not None:
+                on_progress(written, time.perf_counter() - started)
+
+        return written
+
+def create_stores(backend=None, db=None):
+    """
+    Creates the optimal times and astro objects stores of a backend ('firestore' or 'sqlite').
+
+    Parameters:
+        backend (str): The backend. Defaults to STORAGE_BACKEND.
+        db (google.cloud.firestore.Client): The client of the Firestore stores.
+            Defaults to the process-wide pool (see db_utils).
+
+    Returns:
+        tuple: The optimal times store and the astro objects store.
+    """
+
+    backend = backend or STORAGE_BACKEND
+
+    if backend == 'sqlite':
+        return SQLiteOptimalTimesStore(), SQLiteAstroObjectsStore()
+
+    if backend != 'firestore':
+        raise ValueError(f"Unknown storage backend: {backend}")
+
+    optimal_times_store = FirestoreOptimalTimesStore(db)
+
+    if STORAGE_REPLICA_PATH:
+        optimal_times_store = ReplicatedOptimalTimesStore(optimal_times_store, SQLiteOptimalTimesStore(STORAGE_REPLICA_PATH))
+
+    return optimal_times_store, FirestoreAstroObjectsStore(db)
+
+def init_firebase(credentials_path):
+    """
+    Initializes the default Firebase app with a service account, unless it is already initialized.
+    """
+
+    try:
+        firebase_admin.get_app()
+    except ValueError:
+        firebase_admin.initialize_app(credentials.Certificate(credentials_path))
+
+def configure(backend=None):
+    """
+    Sets the backend of the process-wide stores (defaults to STORAGE_BACKEND).
+
+    The stores (and their clients) are created on first use, not here.
+    """
+
+    global _backend
+
+    with _stores_lock:
+        _backend = backend
+        _stores.clear()
+
+def get_backend():
+    """
+    Returns the backend of the process-wide stores (see configure).
+    """
+
+    return _backend or STORAGE_BACKEND
+
+def _get_stores():
+    # The stores are created once per process, on first use
+    with _stores_lock:
+        if not _stores:
+            _stores["optimal_times"], _stores["astro_objects"] = create_stores(_backend)
+
+    return _stores
+
+def get_optimal_times_store():
+    """
+    Returns the process-wide optimal times store (see STORAGE_BACKEND).
+    """
+
+    return _get_stores()["optimal_times"]
+
+def get_astro_objects_store():
+    """
+    Returns the process-wide astro objects store (see STORAGE_BACKEND).
+    """
+
+    return _get_stores()["astro_objects"]
@@ -1,21 +1,42 @@
 from astroplan import Observer, FixedTarget
-from astroplan import time_grid_from_range, moon_illumination
-from astropy.time import Time, TimeDelta
+from astropy.time import Time
 from astropy.coordinates import SkyCoord
+from astropy.coordinates.name_resolve import NameResolveError
 from astropy import units as u, coordinates as coord
-from flask import g
-from google.cloud.firestore_v1.base_query import FieldFilter
 import datetime
 import numpy as np
 import pytz
-import time
+from utilities import altaz_utils
+from utilities import ephemeris_utils
 from utilities import geo_utils
+from utilities import metrics_utils
+from utilities import resolver_utils
+from utilities import session_utils
 from utilities import time_utils
 
-def get_optimal_target_times(start_date_str, end_date_str, latitude, longitude, location_name, target_id, target_name, min_altitude, min_session_length):
+def get_observer(latitude, longitude, location_name):
+    """
+    Returns the astroplan Observer for a location, along with its timezone name.
+    """
+
+    site = geo_utils.get_site(latitude, longitude)
+    location_elevation = site["elevation"]
+    location_timezone = site["timezone"]
+
+    # Define the observer location
+    observer = Observer(latitude=latitude * u.deg,
+                        longitude=longitude * u.deg,
+                        elevation=location_elevation * u.m,
+                        name=location_name,
+                        timezone=location_timezone)
+
+    return observer, location_timezone
+
+def get_time_range_utc(start_date_str, end_date_str):
+    """
+    Parses inclusive 'YYYY-MM-DD' start/end dates into a UTC datetime range.
+    """
 
-    timezone = geo_utils.get_timezone(float(latitude), float(longitude))
-    local_timezone = pytz.timezone(timezone)
     start_date_obj = datetime.datetime.strptime(start_date_str, '%Y-%m-%d')
     end_date_obj = datetime.datetime.strptime(end_date_str, '%Y-%m-%d')
 
@@ -23,74 +44,262 @@ def get_optimal_target_times(start_date_str, end_date_str, latitude, longitude,
     end_date_obj += datetime.timedelta(days=1)
 
     # Assume start_date_obj and end_date_obj are in UTC
-    start_time_utc = pytz.utc.localize(start_date_obj)
-    end_time_utc = pytz.utc.localize(end_date_obj)
+    return pytz.utc.localize(start_date_obj), pytz.utc.localize(end_date_obj)
+
+@metrics_utils.timed("sessions")
+def get_sessions(optimal_times, target_alt, min_altitude, min_session_length, local_timezone):
+    """
+    Groups the optimal times where a target is high enough into observing sessions.
+
+    Parameters:
+        optimal_times (astropy.time.Time): The optimal times to observe any target.
+        target_alt (Latitude): The altitude of the target at each optimal time.
+        min_altitude (float): The minimum altitude of the target, in degrees.
+        min_session_length (float): The minimum length of a session, in minutes.
+        local_timezone (pytz.timezone): The timezone used for the session start/end strings.
+
+    Returns:
+        list[dict]: The sessions, each with a 'start', 'end' and 'duration' (in minutes).
+    """
+
+    above_min_altitude = np.asarray(target_alt.deg) >= float(min_altitude)
+
+    return session_utils.find_sessions(optimal_times.unix, above_min_altitude, local_timezone, min_session_length,
+                                       interval_seconds=time_utils.OPTIMAL_TIMES_INTERVAL_SECONDS)
+
+@metrics_utils.timed("altaz")
+def get_target_altitudes(observer, times, coords, grid_times_targets=False):
+    """
+    Returns the altitudes of targets, with astropy or (with FAST_ALTAZ) the analytic kernel of altaz_utils.
+
+    Returns:
+        astropy.coordinates.Angle: One altitude per time, or an (N targets x M times) grid.
+    """
+
+    if altaz_utils.FAST_ALTAZ:
+        return coord.Angle(altaz_utils.get_observer_altitudes(observer, times, coords, grid_times_targets), u.deg)
+
+    return observer.altaz(times, coords, grid_times_targets=grid_times_targets).alt
+
+def get_optimal_target_times(start_date_str, end_date_str, latitude, longitude, location_name, target_id, target_name, min_altitude, min_session_length, store=None):
+
+    start_time_utc, end_time_utc = get_time_range_utc(start_date_str, end_date_str)
 
     latitude = float(latitude)
     longitude = float(longitude)
 
-    latitude_course = round(latitude, 2)
-    longitude_course = round(longitude, 2)
-
-    location_elevation = geo_utils.get_elevation(latitude, longitude)
-    location_timezone = geo_utils.get_timezone(latitude, longitude)
+    observer, location_timezone = get_observer(latitude, longitude, location_name)
 
     # Define the timezone object
-    timezone = pytz.timezone(location_timezone)
+    local_timezone = pytz.timezone(location_timezone)
 
-    # Define the observer location
-    observer = Observer(latitude=latitude * u.deg,
-                        longitude=longitude * u.deg,
-                        elevation=location_elevation * u.m,
-                        name=location_name,
-                        timezone=location_timezone)
-
-    # Create the SkyCoord object from target_id
-    target_coord = SkyCoord.from_name(target_id)
+    # Create the SkyCoord object from target_id (local catalog first, then a remote lookup)
+    target_coord = resolver_utils.resolve_target(target_id)
 
     # Create the target
     target = FixedTarget(coord=target_coord, name=target_name)
 
     # Optimal times to observe any potential target
-    optimal_times = time_utils.get_optimal_times(start_time_utc, end_time_utc, latitude, longitude)
+    optimal_times = time_utils.get_optimal_times(start_time_utc, end_time_utc, latitude, longitude, store=store)
 
     if len(optimal_times) == 0:
         return []
 
     # Measure the altitude of the target at each time
-    target_alt = observer.altaz(optimal_times, target)
+    target_alt = get_target_altitudes(observer, optimal_times, target.coord)
 
-    time_list = []
+    return get_sessions(optimal_times, target_alt, min_altitude, min_session_length, local_timezone)
 
-    for time, alt in zip(optimal_times, target_alt.alt):
-        if alt.deg >= float(min_altitude):
-            time_list.append(time.to_datetime(timezone=timezone))
+def get_optimal_targets_times(start_date_str, end_date_str, latitude, longitude, location_name, targets, min_altitude, min_session_length, store=None):
+    """
+    Returns the observing sessions for several targets at one location.
 
-    if len(time_list) == 0:
-        return []
+    The timezone lookup, the Observer and the optimal (dark) times are
+    computed once for the whole batch, and the altitudes of all targets are
+    computed in one broadcast observer.altaz call over an
+    (N targets x M times) grid.
+
+    Parameters:
+        start_date_str (str): The first night to plan, as 'YYYY-MM-DD' (inclusive).
+        end_date_str (str): The last night to plan, as 'YYYY-MM-DD' (inclusive).
+        latitude (float): The latitude coordinate for the location.
+        longitude (float): The longitude coordinate for the location.
+        location_name (str): The name of the location.
+        targets (list[dict]): The targets, each with a 'target_id' (resolvable
+            name, e.g. 'M31') and an optional 'target_name'.
+        min_altitude (float): The minimum altitude of a target, in degrees.
+        min_session_length (float): The minimum length of a session, in minutes.
+        store: The optimal times store (see storage_utils). Defaults to the process-wide store.
+
+    Returns:
+        list[dict]: One entry per target, in request order, with 'target_id',
+            'target_name' and 'sessions', or 'error' if the target could
+            not be resolved.
+
+    Example:
+        plans = get_optimal_targets_times('2023-08-01', '2023-08-07', 43.4494, -80.5752, 'Waterloo',
+                                          [{'target_id': 'M31'}, {'target_id': 'M42'}], 30, 60)
+        print(plans[0]['sessions'][0])
+        # Output: {'start': '2023-08-01 22:15:00', 'end': '2023-08-02 04:30:00', 'duration': 375.0}
+    """
+
+    if not isinstance(targets, list) or len(targets) == 0:
+        raise ValueError("targets must be a non-empty list")
+
+    for target in targets:
+        if not isinstance(target, dict) or not target.get('target_id'):
+            raise ValueError("Each target must have a target_id")
+
+    start_time_utc, end_time_utc = get_time_range_utc(start_date_str, end_date_str)
+
+    latitude = float(latitude)
+    longitude = float(longitude)
+
+    observer, location_timezone = get_observer(latitude, longitude, location_name)
+
+    # Define the timezone object
+    local_timezone = pytz.timezone(location_timezone)
+
+    plans = [{'target_id': target['target_id'], 'target_name': target.get('target_name'), 'sessions': []} for target in targets]
+
+    # Resolve every target, keeping track of the ones that resolved
+    resolved_indices = []
+    resolved_coords = []
+
+    for index, target in enumerate(targets):
+        try:
+            resolved_coords.append(resolver_utils.resolve_target(target['target_id']))
+            resolved_indices.append(index)
+        except NameResolveError as e:
+            plans[index]['error'] = str(e)
+
+    if not resolved_coords:
+        return plans
+
+    # Optimal times to observe any potential target
+    optimal_times = time_utils.get_optimal_times(start_time_utc, end_time_utc, latitude, longitude, store=store)
+
+    if len(optimal_times) == 0:
+        return plans
+
+    # Measure the altitude of every target at each time, as an (N targets x M times) grid
+    target_coords = SkyCoord(ra=u.Quantity([c.ra for c in resolved_coords]),
+                             dec=u.Quantity([c.dec for c in resolved_coords]))
+
+    targets_alt = get_target_altitudes(observer, optimal_times, target_coords, grid_times_targets=True)
+
+    for row, index in enumerate(resolved_indices):
+        plans[index]['sessions'] = get_sessions(optimal_times, targets_alt[row], min_altitude, min_session_length, local_timezone)
+
+    return plans
+
+def get_night_boundaries(start_date_str, end_date_str, local_timezone):
+    """
+    Returns the nights from start_date to end_date (inclusive) and the local noons that separate them.
+
+    A night is named after the date of its evening, and runs from local
+    noon on that date to local noon on the next, so daylight saving time
+    changes during the night are handled.
+
+    Returns:
+        tuple[list[str], numpy.ndarray]: The night dates ('YYYY-MM-DD') and
+            the len(nights) + 1 boundaries, in unix seconds.
+    """
+
+    start_date_obj = datetime.datetime.strptime(start_date_str, '%Y-%m-%d')
+    end_date_obj = datetime.datetime.strptime(end_date_str, '%Y-%m-%d')
+
+    night_count = (end_date_obj - start_date_obj).days + 1
+
+    if night_count <= 0:
+        raise ValueError("end_date must not be before start_date")
+
+    dates = [start_date_obj + datetime.timedelta(days=day) for day in range(night_count + 1)]
+
+    boundaries = np.array([local_timezone.localize(date.replace(hour=12)).timestamp() for date in dates])
+
+    return [date.strftime('%Y-%m-%d') for date in dates[:-1]], boundaries
+
+def get_target_calendar(start_date_str, end_date_str, latitude, longitude, location_name, target_id, min_altitude, store=None):
+    """
+    Returns per-night aggregates for a target over a range of nights, e.g. for a year heatmap.
+
+    The optimal (dark) times of the whole range are loaded at once, every
+    sample is assigned to its night with one searchsorted call, and the
+    aggregates are computed with bincount / ufunc.at over all samples.
+
+    Parameters:
+        start_date_str (str): The first night, as 'YYYY-MM-DD' (inclusive).
+        end_date_str (str): The last night, as 'YYYY-MM-DD' (inclusive).
+        latitude (float): The latitude coordinate for the location.
+        longitude (float): The longitude coordinate for the location.
+        location_name (str): The name of the location.
+        target_id (str): The target (resolvable name, e.g. 'M31').
+        min_altitude (float): The minimum altitude of the target, in degrees.
+        store: The optimal times store (see storage_utils). Defaults to the process-wide store.
+
+    Returns:
+        dict: 'nights' (dates of the evenings) and, one value per night:
+            'dark_minutes' (dark time with the target above min_altitude),
+            'peak_altitude' (highest altitude of the target in dark time, in
+            degrees, or None without dark time) and 'moon_fraction' (Moon
+            illumination at local midnight).
+
+    Example:
+        calendar = get_target_calendar('2024-01-01', '2024-12-31', 43.4494, -80.5752, 'Waterloo', 'M31', 30)
+        print(calendar['nights'][0], calendar['dark_minutes'][0])  # Output: 2024-01-01 210.0
+    """
+
+    latitude = float(latitude)
+    longitude = float(longitude)
+    min_altitude = float(min_altitude)
+
+    observer, location_timezone = get_observer(latitude, longitude, location_name)
+
+    nights, boundaries = get_night_boundaries(start_date_str, end_date_str, pytz.timezone(location_timezone))
+
+    target_coord = resolver_utils.resolve_target(target_id)
+
+    start_time_utc = datetime.datetime.fromtimestamp(boundaries[0], tz=pytz.utc)
+    end_time_utc = datetime.datetime.fromtimestamp(boundaries[-1], tz=pytz.utc)
+
+    # Optimal times to observe any potential target
+    optimal_times = time_utils.get_optimal_times(start_time_utc, end_time_utc, latitude, longitude, store=store)
+
+    night_count = len(nights)
+
+    dark_minutes = np.zeros(night_count)
+    peak_altitude = np.full(night_count, np.nan)
+
+    if len(optimal_times) > 0:
+        target_alt = np.asarray(get_target_altitudes(observer, optimal_times, target_coord).deg)
+
+        with metrics_utils.span("aggregate"):
+            # Night of every sample: the boundaries are the local noons
+            night_indices = np.searchsorted(boundaries, optimal_times.unix, side='right') - 1
+            in_range = (night_indices >= 0) & (night_indices < night_count)
 
-    blocks = []
-    current_block = [time_list[0]]
+            night_indices = night_indices[in_range]
+            target_alt = target_alt[in_range]
 
-    # Iterate through the datetimes, combining those that are less than 20 minutes apart
-    for i in range(1, len(time_list)):
-        if (time_list[i] - time_list[i - 1]).seconds <= 20 * 60:
-            current_block.append(time_list[i])
-        else:
-            blocks.append(current_block)
-            current_block = [time_list[i]]
+            sample_minutes = time_utils.OPTIMAL_TIMES_INTERVAL_SECONDS / 60
+            dark_minutes = np.bincount(night_indices, weights=target_alt >= min_altitude, minlength=night_count) * sample_minutes
 
-    # Append the last block
-    blocks.append(current_block) # TODO: I feel like the '1440' bug has something to do with this line
+            np.fmax.at(peak_altitude, night_indices, target_alt)
 
-    sessions = []
+    # Moon illumination at local midnight (halfway between the noons)
+    midnights = Time((boundaries[:-1] + boundaries[1:]) / 2, format='unix')
+    positions = ephemeris_utils.get_sun_moon_positions(midnights)
 
-    # Print the start and end datetimes for each contiguous block
-    for block in blocks:
-        start_date = block[0]
-        end_date = block[-1]
-        duration = (end_date - start_date).total_seconds() / 60  # Convert duration from seconds to minutes
-        if duration >= float(min_session_length) and duration < 1440: # TODO: Remove this '1440' hack
-            sessions.append({'start': start_date.astimezone(local_timezone).strftime('%Y-%m-%d %H:%M:%S'), 'end': end_date.astimezone(local_timezone).strftime('%Y-%m-%d %H:%M:%S'), 'duration': duration})
+    if positions is not None:
+        moon_fraction = positions[2]
+    else:
+        moon_fraction = ephemeris_utils.get_moon_illumination(coord.get_sun(midnights), coord.get_body("moon", midnights))
 
-    return sessions
\ No newline at end of file
+    return {
+        'target_id': target_id,
+        'nights': nights,
+        'dark_minutes': dark_minutes.tolist(),
+        'peak_altitude': [None if np.isnan(altitude) else round(float(altitude), 2) for altitude in peak_altitude],
+        'moon_fraction': np.round(moon_fraction, 3).tolist()
+    }
@@ -1,18 +1,54 @@
-from astroplan import Observer, FixedTarget
-from astroplan import time_grid_from_range, moon_illumination
+from astroplan import Observer
 from astropy.time import Time, TimeDelta
-from astropy.coordinates import SkyCoord
 from astropy import units as u, coordinates as coord
-from flask import g
-from google.cloud.firestore_v1.base_query import FieldFilter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import contextmanager
 import datetime
+import multiprocessing
 import numpy as np
+import os
 import pytz
+import threading
 import time
+from utilities import altaz_utils
+from utilities import cache_utils
+from utilities import encoding_utils
+from utilities import ephemeris_utils
 from utilities import geo_utils
+from utilities import metrics_utils
+from utilities import storage_utils
 
 # time_utils.py
 
+# Spacing of the sample grid used for the optimal times, in seconds
+OPTIMAL_TIMES_INTERVAL_SECONDS = 15 * 60
+
+# Process-local cache of decoded monthly optimal times, keyed by (start_date, latitude_course, longitude_course)
+OPTIMAL_TIMES_CACHE_MAX_SIZE = int(os.environ.get('OPTIMAL_TIMES_CACHE_MAX_SIZE', 1024))
+OPTIMAL_TIMES_CACHE_TTL_SECONDS = float(os.environ.get('OPTIMAL_TIMES_CACHE_TTL_SECONDS', 24 * 60 * 60))
+
+optimal_times_cache = cache_utils.LRUCache(OPTIMAL_TIMES_CACHE_MAX_SIZE, OPTIMAL_TIMES_CACHE_TTL_SECONDS)
+
+# Maximum number of months fetched by one start_date range query
+OPTIMAL_TIMES_QUERY_MONTHS = int(os.environ.get('OPTIMAL_TIMES_QUERY_MONTHS', 12))
+
+# Single-flight generation of a month: 'pending' documents are claims held by the worker generating them
+OPTIMAL_TIMES_STATUS_PENDING = storage_utils.OPTIMAL_TIMES_STATUS_PENDING
+OPTIMAL_TIMES_STATUS_READY = "ready"
+OPTIMAL_TIMES_LEASE_SECONDS = float(os.environ.get('OPTIMAL_TIMES_LEASE_SECONDS', 5 * 60))
+OPTIMAL_TIMES_POLL_SECONDS = 0.5
+
+# Parallel generation claims this many months at a time, so that they are all stored before their claims expire
+OPTIMAL_TIMES_CLAIM_MONTHS = int(os.environ.get('OPTIMAL_TIMES_CLAIM_MONTHS', 12))
+
+# Parallel generation: number of worker processes, and documents written per batch (at most 500)
+OPTIMAL_TIMES_WORKERS = int(os.environ.get('OPTIMAL_TIMES_WORKERS', os.cpu_count() or 1))
+OPTIMAL_TIMES_WRITE_BATCH_SIZE = int(os.environ.get('OPTIMAL_TIMES_WRITE_BATCH_SIZE', 50))
+
+# Per-key locks of the months being generated in this process, as [lock, number of users]
+_month_locks = {}
+_month_locks_guard = threading.Lock()
+
 def get_first_day_of_month(input_datetime):
     """
     Returns the first day of the month for a given datetime.
@@ -117,43 +153,219 @@ def get_first_days_of_month_for_time_range(start_date, end_date):
 
     return first_days
 
-def get_optimal_times(start_datetime, end_datetime, latitude, longitude):
+def decode_optimal_times_document(document):
+    """
+    Decodes the optimal times stored in an 'optimal_times' document.
 
-    optimal_times_ref = g.db.collection("optimal_times")
-    optimal_times_results = []
+    Documents written with the compact format store the optimal times as
+    bytes (see encoding_utils). Legacy documents store them as a list of ISO
+    strings, which are still parsed in a single vectorized call.
 
-    latitude_course  = round(latitude, 2)
-    longitude_course = round(longitude, 2)
+    Parameters:
+        document (dict): An optimal times document (see storage_utils).
 
-    first_day_of_month_list = get_first_days_of_month_for_time_range(start_datetime, end_datetime)
+    Returns:
+        numpy.ndarray: The optimal times, in unix seconds.
+
+    Example:
+        unix_times = decode_optimal_times_document(result.to_dict())
+        print(unix_times[:2])  # Output: [1.6908516e+09 1.6908525e+09]
+    """
+
+    if "optimal_times_packed" in document:
+        return encoding_utils.decode_optimal_times(document["optimal_times_packed"]).astype(np.float64)
+
+    time_results = document.get("optimal_times", [])
+
+    if not time_results:
+        return np.array([], dtype=np.float64)
+
+    return Time(time_results, format='isot').unix
+
+def select_optimal_times(unix_times_list, start_datetime, end_datetime):
+    """
+    Combines decoded optimal times and keeps those strictly inside a time range.
+
+    Parameters:
+        unix_times_list (list[numpy.ndarray]): Optimal times in unix seconds, one array per month.
+        start_datetime (datetime): The starting datetime of the range (timezone aware).
+        end_datetime (datetime): The ending datetime of the range (timezone aware).
+
+    Returns:
+        astropy.time.Time: An array of astropy Time objects with the optimal
+            times within the range, in ascending order.
+    """
+
+    if unix_times_list:
+        unix_times = np.concatenate(unix_times_list)
+    else:
+        unix_times = np.array([], dtype=np.float64)
+
+    in_range = (unix_times > start_datetime.timestamp()) & (unix_times < end_datetime.timestamp())
+
+    return Time(np.sort(unix_times[in_range]), format='unix')
+
+@metrics_utils.timed("decode")
+def decode_month_documents(documents):
+    """
+    Decodes the 'optimal_times' documents of one month into a single array.
+
+    Parameters:
+        documents (list[dict]): The documents found for the month.
+
+    Returns:
+        numpy.ndarray or None: The optimal times of the month in unix seconds,
+            or None if no document holds results yet.
+    """
+
+    # Documents still being generated by another worker are not results yet
+    documents = [document for document in documents if document.get("status") != OPTIMAL_TIMES_STATUS_PENDING]
+
+    if not documents:
+        return None
+
+    # Legacy documents may have been written more than once for the same month, so drop repeated times
+    return np.unique(np.concatenate([decode_optimal_times_document(document) for document in documents]))
+
+def cache_month_optimal_times(first_day_of_month, latitude_course, longitude_course, unix_times):
+    """
+    Stores the decoded optimal times of a month in the process-local cache.
+
+    Parameters:
+        first_day_of_month (datetime): The first day of the month (UTC).
+        latitude_course (float): The latitude, rounded to 2 decimals.
+        longitude_course (float): The longitude, rounded to 2 decimals.
+        unix_times (numpy.ndarray): The optimal times of the month, in unix seconds.
+
+    Returns:
+        numpy.ndarray: The cached (read-only) array of unix seconds.
+    """
+
+    unix_times = np.array(unix_times, dtype=np.float64)
+    unix_times.flags.writeable = False
+
+    optimal_times_cache.put((first_day_of_month, latitude_course, longitude_course), unix_times)
+
+    return unix_times
+
+def load_month_optimal_times(store, first_day_of_month, latitude_course, longitude_course):
+    """
+    Returns the optimal times of one month for a location, or None if the month has not been generated.
+
+    The process-local cache is checked first; on a miss, the store is
+    queried and the decoded result is cached.
+
+    Parameters:
+        store: The optimal times store (see storage_utils).
+        first_day_of_month (datetime): The first day of the month (UTC).
+        latitude_course (float): The latitude, rounded to 2 decimals.
+        longitude_course (float): The longitude, rounded to 2 decimals.
+
+    Returns:
+        numpy.ndarray or None: The optimal times of the month, in unix seconds.
+    """
+
+    cached_times = optimal_times_cache.get((first_day_of_month, latitude_course, longitude_course))
+
+    if cached_times is not None:
+        return cached_times
+
+    with metrics_utils.span("fetch"):
+        documents = store.query_months(first_day_of_month, get_first_day_of_next_month(first_day_of_month), latitude_course, longitude_course)
+
+    month_times = decode_month_documents(documents)
+
+    if month_times is None:
+        return None
+
+    return cache_month_optimal_times(first_day_of_month, latitude_course, longitude_course, month_times)
+
+def load_months_optimal_times(store, first_day_of_month_list, latitude_course, longitude_course):
+    """
+    Returns the optimal times of several months for a location.
+
+    Months in the process-local cache are not fetched. The span of missing
+    months is fetched with a single start_date range query per
+    OPTIMAL_TIMES_QUERY_MONTHS months, instead of one equality query per
+    month. Longer spans are split into several range queries, which the
+    Firestore store runs concurrently (see storage_utils).
+    Every month returned by the queries is cached, including months
+    between missing months that were already cached.
+
+    Parameters:
+        store: The optimal times store (see storage_utils).
+        first_day_of_month_list (list[datetime]): The first day (UTC) of each month.
+        latitude_course (float): The latitude, rounded to 2 decimals.
+        longitude_course (float): The longitude, rounded to 2 decimals.
+
+    Returns:
+        dict: The optimal times of each month in unix seconds (numpy.ndarray),
+            or None for months that have not been generated, keyed by the
+            first day of the month.
+    """
+
+    months_times = {}
+    missing_months = []
 
     for first_day_of_month in first_day_of_month_list:
+        months_times[first_day_of_month] = optimal_times_cache.get((first_day_of_month, latitude_course, longitude_course))
 
-        print(f"first_day_of_month: {first_day_of_month}")
-        print(f"latitude_course: {latitude_course}")
-        print(f"longitude_course: {longitude_course}")
-        # Check if we have results for the month
-        query_ref = optimal_times_ref.where(filter=FieldFilter("start_date", "==", first_day_of_month)).where("latitude", "==", latitude_course).where("longitude", "==", longitude_course)
+        if months_times[first_day_of_month] is None:
+            missing_months.append(first_day_of_month)
 
-        results = query_ref.stream()
-        results_list = list(results)
+    if not missing_months:
+        return months_times
 
-        print(len(results_list))
+    # Split the span of missing months into ranges of at most OPTIMAL_TIMES_QUERY_MONTHS months
+    span_months = get_first_days_of_month_for_time_range(min(missing_months), max(missing_months))
+    range_starts = span_months[::OPTIMAL_TIMES_QUERY_MONTHS]
+    range_ends = span_months[OPTIMAL_TIMES_QUERY_MONTHS::OPTIMAL_TIMES_QUERY_MONTHS] + [get_first_day_of_next_month(span_months[-1])]
+    date_ranges = list(zip(range_starts, range_ends))
 
-        for result in results_list:
-            time_results = result.to_dict()["optimal_times"]
-            astropy_times = [Time(time_string, format='isot') for time_string in time_results]
+    with metrics_utils.span("fetch"):
+        documents = store.query_months_ranges(date_ranges, latitude_course, longitude_course)
 
-            optimal_times_results += astropy_times
+    # Group the documents by month
+    documents_by_month = {}
 
-    matching_times = []
-    for time in optimal_times_results:
-        if start_datetime < time and end_datetime > time:
-            matching_times.append(time)
+    for document in documents:
+        start_date = document["start_date"]
+        documents_by_month.setdefault((start_date.year, start_date.month), []).append(document)
 
-    return matching_times
+    for first_day_of_month in span_months:
+        month_times = decode_month_documents(documents_by_month.get((first_day_of_month.year, first_day_of_month.month), []))
 
-def get_or_generate_optimal_times(start_datetime, end_datetime, latitude, longitude):
+        if month_times is not None:
+            month_times = cache_month_optimal_times(first_day_of_month, latitude_course, longitude_course, month_times)
+
+        if first_day_of_month in months_times:
+            months_times[first_day_of_month] = month_times
+
+    return months_times
+
+def get_optimal_times(start_datetime, end_datetime, latitude, longitude, store=None):
+
+    store = store or storage_utils.get_optimal_times_store()
+    optimal_times_results = []
+
+    latitude_course  = round(latitude, 2)
+    longitude_course = round(longitude, 2)
+
+    first_day_of_month_list = get_first_days_of_month_for_time_range(start_datetime, end_datetime)
+
+    # Fetch every month at once (cached months are not fetched)
+    months_times = load_months_optimal_times(store, first_day_of_month_list, latitude_course, longitude_course)
+
+    for first_day_of_month in first_day_of_month_list:
+        # Check if we have results for the month
+        month_times = months_times[first_day_of_month]
+
+        if month_times is not None:
+            optimal_times_results.append(month_times)
+
+    return select_optimal_times(optimal_times_results, start_datetime, end_datetime)
+
+def get_or_generate_optimal_times(start_datetime, end_datetime, latitude, longitude, store=None):
     """
     Retrieves or generates optimal times for a given time range and location.
 
@@ -167,9 +379,10 @@ def get_or_generate_optimal_times(start_datetime, end_datetime, latitude, longit
         end_datetime (datetime): The ending datetime of the range.
         latitude (float): The latitude coordinate for the location.
         longitude (float): The longitude coordinate for the location.
+        store: The optimal times store (see storage_utils). Defaults to the process-wide store.
 
     Returns:
-        list[astropy.time.Time]: A list of astropy Time objects representing
+        astropy.time.Time: An array of astropy Time objects representing
             the optimal times within the specified time range and location.
 
     Example:
@@ -183,7 +396,7 @@ def get_or_generate_optimal_times(start_datetime, end_datetime, latitude, longit
         # Output could include various astropy Time objects within the specified range.
     """
 
-    optimal_times_ref = g.db.collection("optimal_times")
+    store = store or storage_utils.get_optimal_times_store()
     optimal_times_results = []
 
     latitude_course  = round(latitude, 2)
@@ -191,71 +404,520 @@ def get_or_generate_optimal_times(start_datetime, end_datetime, latitude, longit
 
     first_day_of_month_list = get_first_days_of_month_for_time_range(start_datetime, end_datetime)
 
+    # Fetch every month at once (cached months are not fetched)
+    months_times = load_months_optimal_times(store, first_day_of_month_list, latitude_course, longitude_course)
+
     for first_day_of_month in first_day_of_month_list:
         # Check if we have results for the month
-        query_ref = optimal_times_ref.where(filter=FieldFilter("start_date", "==", first_day_of_month)).where("latitude", "==", latitude_course).where("longitude", "==", longitude_course)
+        month_times = months_times[first_day_of_month]
 
-        results = query_ref.stream()
-        results_list = list(results)
+        if month_times is None:
+            month_times = get_or_generate_month_optimal_times(store, first_day_of_month, latitude, longitude)
 
-        if not results_list:
-            optimal_times_results += generate_optimal_times(first_day_of_month, get_first_day_of_next_month(first_day_of_month), latitude, longitude)
-        else:
-            for result in results_list:
-                time_results = result.to_dict()["optimal_times"]
-                astropy_times = [Time(time_string, format='isot') for time_string in time_results]
+        optimal_times_results.append(month_times)
 
-                optimal_times_results += astropy_times
+    return select_optimal_times(optimal_times_results, start_datetime, end_datetime)
 
-    matching_times = []
-    for time in optimal_times_results:
-        if start_datetime < time and end_datetime > time:
-            matching_times.append(time)
+def generate_optimal_times_full(start_datetime, end_datetime, latitude, longitude, workers=None, chunk_days=None, executor=None, store=None):
+    """
+    Generates and stores the optimal times of every month in a time range that is not stored yet.
 
-    return matching_times
+    With more than one worker, the missing months (or, when there are fewer
+    months than workers, chunks of days) are computed in a process pool and
+    written back in batches as they complete. With one worker, the months
+    are generated one after the other with single-flight claims (see
+    get_or_generate_month_optimal_times).
 
-def generate_optimal_times_full(start_datetime, end_datetime, latitude, longitude):
-    optimal_times_ref = g.db.collection("optimal_times")
-    optimal_times_results = []
+    Parameters:
+        start_datetime (datetime): The starting datetime of the range (UTC).
+        end_datetime (datetime): The ending datetime of the range (UTC).
+        latitude (float): The latitude coordinate for the location.
+        longitude (float): The longitude coordinate for the location.
+        workers (int): The number of worker processes. Defaults to OPTIMAL_TIMES_WORKERS.
+        chunk_days (int): The number of days computed by one task (see get_generation_chunks).
+        executor (ProcessPoolExecutor): A pool to run the tasks on. Defaults to a new pool of workers processes.
+        store: The optimal times store (see storage_utils). Defaults to the process-wide store.
+
+    Example:
+        start_datetime = datetime.datetime(2024, 1, 1, tzinfo=pytz.utc)
+        end_datetime = datetime.datetime(2024, 12, 31, tzinfo=pytz.utc)
+        generate_optimal_times_full(start_datetime, end_datetime, 43.4494, -80.5752, workers=8)
+    """
+
+    store = store or storage_utils.get_optimal_times_store()
 
     latitude_course  = round(latitude, 2)
     longitude_course = round(longitude, 2)
 
+    workers = workers or OPTIMAL_TIMES_WORKERS
+
     first_day_of_month_list = get_first_days_of_month_for_time_range(start_datetime, end_datetime)
 
-    for first_day_of_month in first_day_of_month_list:
-        # Check if we have results for the month
-        query_ref = optimal_times_ref.where(filter=FieldFilter("start_date", "==", first_day_of_month)).where("latitude", "==", latitude_course).where("longitude", "==", longitude_course)
+    # Fetch every month at once (cached months are not fetched)
+    months_times = load_months_optimal_times(store, first_day_of_month_list, latitude_course, longitude_course)
+
+    missing_months = [first_day_of_month for first_day_of_month in first_day_of_month_list if months_times[first_day_of_month] is None]
+
+    if not missing_months:
+        return
+
+    if workers <= 1 and executor is None:
+        for first_day_of_month in missing_months:
+            get_or_generate_month_optimal_times(store, first_day_of_month, latitude, longitude)
+        return
+
+    if executor is not None:
+        generate_months_optimal_times(store, missing_months, latitude, longitude, executor, workers, chunk_days)
+        return
+
+    with create_process_pool(workers) as executor:
+        generate_months_optimal_times(store, missing_months, latitude, longitude, executor, workers, chunk_days)
+
+def create_process_pool(workers=None):
+    """
+    Returns a process pool for compute_months_optimal_times_parallel.
+
+    Processes are spawned rather than forked, so they do not inherit the
+    gRPC and thread state of the web process.
+    """
+
+    return ProcessPoolExecutor(max_workers=workers or OPTIMAL_TIMES_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+
+def compute_optimal_times_unix(start_datetime_utc, end_datetime_utc, latitude, longitude):
+    # Runs in a worker process: return plain unix seconds, which are cheap to pickle
+    return compute_optimal_times(start_datetime_utc, end_datetime_utc, latitude, longitude).unix
+
+def get_generation_chunks(first_day_of_month_list, workers, chunk_days=None):
+    """
+    Splits months into the (first_day_of_month, start, end) ranges computed by one task each.
+
+    Whole months are used when there are at least as many months as workers.
+    Otherwise the months are split into chunks of chunk_days days, by default
+    small enough to give every worker a task. Chunk boundaries are whole
+    days, so they fall on the 15-minute grid of their month and the chunks
+    of a month add up to the month.
+
+    Parameters:
+        first_day_of_month_list (list[datetime]): The first day of every month (UTC).
+        workers (int): The number of worker processes.
+        chunk_days (int): The number of days in a chunk. Defaults to whole months
+            (or an even split between the workers when there are fewer months than workers).
+
+    Returns:
+        list[tuple[datetime, datetime, datetime]]: The month, start and end (exclusive) of every chunk.
+    """
+
+    months = [(first_day_of_month, get_first_day_of_next_month(first_day_of_month)) for first_day_of_month in first_day_of_month_list]
+
+    if chunk_days is None and len(months) < workers:
+        total_days = sum((end_date - start_date).days for start_date, end_date in months)
+        chunk_days = max(total_days // workers, 1)
+
+    if not chunk_days:
+        return [(start_date, start_date, end_date) for start_date, end_date in months]
+
+    chunks = []
+
+    for start_date, end_date in months:
+        chunk_start = start_date
+
+        while chunk_start < end_date:
+            chunk_end = min(chunk_start + datetime.timedelta(days=chunk_days), end_date)
+            chunks.append((start_date, chunk_start, chunk_end))
+            chunk_start = chunk_end
+
+    return chunks
+
+def compute_months_optimal_times_parallel(first_day_of_month_list, latitude, longitude, executor, workers=None, chunk_days=None):
+    """
+    Computes the optimal times of several months on a process pool.
+
+    Nothing is read from or written to the database. The months are yielded
+    as they complete; months that complete together are yielded together,
+    so they can be written in one batch.
+
+    Parameters:
+        first_day_of_month_list (list[datetime]): The first day of every month (UTC).
+        latitude (float): The latitude coordinate for the location.
+        longitude (float): The longitude coordinate for the location.
+        executor (ProcessPoolExecutor): The pool the tasks run on (see create_process_pool).
+        workers (int): The number of processes of the pool. Defaults to OPTIMAL_TIMES_WORKERS.
+        chunk_days (int): The number of days computed by one task (see get_generation_chunks).
+
+    Yields:
+        list[tuple[datetime, numpy.ndarray]]: The first day and optimal times (in unix seconds) of completed months.
+    """
+
+    chunks = get_generation_chunks(first_day_of_month_list, workers or OPTIMAL_TIMES_WORKERS, chunk_days)
+
+    futures = {}
+    remaining = {}
+
+    for first_day_of_month, chunk_start, chunk_end in chunks:
+        futures[executor.submit(compute_optimal_times_unix, chunk_start, chunk_end, latitude, longitude)] = (first_day_of_month, chunk_start)
+        remaining[first_day_of_month] = remaining.get(first_day_of_month, 0) + 1
+
+    results = {first_day_of_month: [] for first_day_of_month in remaining}
+    pending = set(futures)
+
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+        completed = []
+
+        for future in done:
+            first_day_of_month, chunk_start = futures.pop(future)
+            results[first_day_of_month].append((chunk_start, future.result()))
+            remaining[first_day_of_month] -= 1
+
+            if remaining[first_day_of_month] == 0:
+                # Chunks do not overlap, so putting them in order gives the month's sorted times
+                month_chunks = sorted(results.pop(first_day_of_month), key=lambda chunk: chunk[0])
+                completed.append((first_day_of_month, np.concatenate([unix_times for chunk_start, unix_times in month_chunks])))
+
+        if completed:
+            yield sorted(completed, key=lambda month: month[0])
+
+def store_months_optimal_times(months_groups, latitude, longitude, batch_size=None, on_commit=None, store=None):
+    """
+    Writes months of optimal times to the optimal times store with batched writes.
 
-        results = query_ref.stream()
-        results_list = list(results)
+    Parameters:
+        months_groups (iterable[list[tuple[datetime, numpy.ndarray]]]): Groups of
+            (first_day_of_month, unix_times), e.g. from compute_months_optimal_times_parallel.
+            Each group is written as soon as it is received.
+        latitude (float): The latitude coordinate for the location.
+        longitude (float): The longitude coordinate for the location.
+        batch_size (int): The maximum number of documents in one batch. Defaults to OPTIMAL_TIMES_WRITE_BATCH_SIZE.
+        on_commit (callable): Called with the first days of the months of every committed batch.
+        store: The optimal times store (see storage_utils). Defaults to the process-wide store.
+    """
+
+    store = store or storage_utils.get_optimal_times_store()
+
+    latitude_course  = round(latitude, 2)
+    longitude_course = round(longitude, 2)
+
+    batch_size = batch_size or OPTIMAL_TIMES_WRITE_BATCH_SIZE
+
+    for months in months_groups:
+        for position in range(0, len(months), batch_size):
+            batch_months = months[position:position + batch_size]
+
+            store.set_many([get_optimal_times_document(first_day_of_month, get_first_day_of_next_month(first_day_of_month), latitude, longitude, unix_times)
+                            for first_day_of_month, unix_times in batch_months])
+
+            for first_day_of_month, unix_times in batch_months:
+                cache_month_optimal_times(first_day_of_month, latitude_course, longitude_course, unix_times)
+
+            if on_commit is not None:
+                on_commit([first_day_of_month for first_day_of_month, unix_times in batch_months])
+
+def get_optimal_times_document_id(first_day_of_month, latitude_course, longitude_course):
+    """
+    Returns the deterministic document ID of a month of optimal times for a location.
+
+    Parameters:
+        first_day_of_month (datetime): The first day of the month (UTC).
+        latitude_course (float): The latitude, rounded to 2 decimals.
+        longitude_course (float): The longitude, rounded to 2 decimals.
+
+    Returns:
+        str: The document ID in the optimal times store.
+
+    Example:
+        first_day_of_month = datetime.datetime(2023, 8, 1, tzinfo=pytz.utc)
+        print(get_optimal_times_document_id(first_day_of_month, 43.45, -80.58))  # Output: 2023-08_43.45_-80.58
+    """
+
+    return f"{first_day_of_month.strftime('%Y-%m')}_{latitude_course:.2f}_{longitude_course:.2f}"
+
+@contextmanager
+def _month_lock(key):
+    # One lock per (month, latitude_course, longitude_course), removed when no thread uses or waits for it
+    with _month_locks_guard:
+        entry = _month_locks.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _month_locks_guard:
+            entry[1] -= 1
+
+            if entry[1] == 0:
+                del _month_locks[key]
+
+def _claim_month(store, document_id, first_day_of_month, latitude_course, longitude_course):
+    """
+    Tries to claim the generation of a month by creating its document as 'pending'.
+
+    Returns True when this worker should generate the month. Returns False
+    when another worker holds an unexpired claim, or the month is already
+    stored.
+    """
+
+    now = datetime.datetime.now(pytz.utc)
+
+    pending_data = {
+        "start_date": first_day_of_month,
+        "end_date": get_first_day_of_next_month(first_day_of_month),
+        "latitude": latitude_course,
+        "longitude": longitude_course,
+        "status": OPTIMAL_TIMES_STATUS_PENDING,
+        "lease_expires_at": now + datetime.timedelta(seconds=OPTIMAL_TIMES_LEASE_SECONDS)
+    }
+
+    if store.create(document_id, pending_data):
+        return True
+
+    # The document exists: take over only if it is a claim whose worker went away.
+    # The takeover is conditional, so of several workers seeing the same expired claim only one wins.
+    return store.take_over(document_id, pending_data, now)
+
+def _wait_for_month(store, document_id):
+    """
+    Waits for another worker to finish generating a month.
+
+    Returns the decoded optimal times of the month, or None if the claim
+    expired (or was released) before the month was stored.
+    """
+
+    while True:
+        document = store.get(document_id)
+
+        if document is None:
+            return None
+
+        if document.get("status") != OPTIMAL_TIMES_STATUS_PENDING:
+            return decode_optimal_times_document(document)
+
+        if document["lease_expires_at"] < datetime.datetime.now(pytz.utc):
+            return None
+
+        time.sleep(OPTIMAL_TIMES_POLL_SECONDS)
+
+def get_or_generate_month_optimal_times(store, first_day_of_month, latitude, longitude):
+    """
+    Returns the optimal times of one month for a location, generating them at most once.
+
+    Concurrent callers for the same (month, latitude_course, longitude_course)
+    are coordinated in two ways. Within the process, a per-key lock lets one
+    thread generate while the others wait and then read the cached result.
+    Across processes, the month is claimed by creating its document (with a
+    deterministic ID) as 'pending'; create fails if the document already
+    exists, so only one worker generates and the others wait for the
+    document to become ready. A claim expires after
+    OPTIMAL_TIMES_LEASE_SECONDS so a crashed worker does not block the month.
+
+    Parameters:
+        store: The optimal times store (see storage_utils).
+        first_day_of_month (datetime): The first day of the month (UTC).
+        latitude (float): The latitude coordinate for the location.
+        longitude (float): The longitude coordinate for the location.
+
+    Returns:
+        numpy.ndarray: The optimal times of the month, in unix seconds.
+    """
+
+    latitude_course  = round(latitude, 2)
+    longitude_course = round(longitude, 2)
+
+    key = (first_day_of_month, latitude_course, longitude_course)
+    document_id = get_optimal_times_document_id(first_day_of_month, latitude_course, longitude_course)
+
+    with _month_lock(key):
+        # Another thread may have generated the month while this one was waiting for the lock
+        month_times = load_month_optimal_times(store, first_day_of_month, latitude_course, longitude_course)
+
+        while month_times is None:
+            if _claim_month(store, document_id, first_day_of_month, latitude_course, longitude_course):
+                try:
+                    generated_times = generate_optimal_times(first_day_of_month, get_first_day_of_next_month(first_day_of_month), latitude, longitude, store=store)
+                except Exception:
+                    # Release the claim so another worker can retry straight away
+                    store.delete(document_id)
+                    raise
+
+                month_times = generated_times.unix
+            else:
+                month_times = _wait_for_month(store, document_id)
+
+        return cache_month_optimal_times(first_day_of_month, latitude_course, longitude_course, month_times)
+
+def generate_months_optimal_times(store, first_day_of_month_list, latitude, longitude, executor, workers=None, chunk_days=None, on_commit=None):
+    """
+    Generates months of optimal times on a process pool, with the claims of get_or_generate_month_optimal_times.
+
+    The months are claimed OPTIMAL_TIMES_CLAIM_MONTHS at a time. The claimed
+    months are computed in parallel and stored as they complete; a month
+    claimed by another worker (e.g. a request) is waited for instead of
+    being generated twice. If generation fails, the claims of the months
+    not stored yet are released.
+
+    Parameters:
+        store: The optimal times store (see storage_utils).
+        first_day_of_month_list (list[datetime]): The first day of every month (UTC).
+        latitude (float): The latitude coordinate for the location.
+        longitude (float): The longitude coordinate for the location.
+        executor (ProcessPoolExecutor): The pool the tasks run on (see create_process_pool).
+        workers (int): The number of processes of the pool. Defaults to OPTIMAL_TIMES_WORKERS.
+        chunk_days (int): The number of days computed by one task (see get_generation_chunks).
+        on_commit (callable): Called with the first days of the months as they are stored,
+            including the months stored by other workers.
+    """
+
+    latitude_course  = round(latitude, 2)
+    longitude_course = round(longitude, 2)
+
+    for position in range(0, len(first_day_of_month_list), OPTIMAL_TIMES_CLAIM_MONTHS):
+        claimed_months = []
+        other_months = []
+
+        for first_day_of_month in first_day_of_month_list[position:position + OPTIMAL_TIMES_CLAIM_MONTHS]:
+            document_id = get_optimal_times_document_id(first_day_of_month, latitude_course, longitude_course)
 
-        if not results_list:
-            generate_optimal_times(first_day_of_month, get_first_day_of_next_month(first_day_of_month), latitude, longitude)
+            if _claim_month(store, document_id, first_day_of_month, latitude_course, longitude_course):
+                claimed_months.append(first_day_of_month)
+            else:
+                other_months.append(first_day_of_month)
 
-def generate_optimal_times(start_datetime_utc, end_datetime_utc, latitude, longitude):
+        unstored_months = set(claimed_months)
+
+        def committed(first_day_of_month_batch):
+            unstored_months.difference_update(first_day_of_month_batch)
+
+            if on_commit is not None:
+                on_commit(first_day_of_month_batch)
+
+        try:
+            months_groups = compute_months_optimal_times_parallel(claimed_months, latitude, longitude, executor, workers, chunk_days)
+            store_months_optimal_times(months_groups, latitude, longitude, on_commit=committed, store=store)
+        except Exception:
+            # Release the claims so another worker can retry straight away
+            for first_day_of_month in unstored_months:
+                store.delete(get_optimal_times_document_id(first_day_of_month, latitude_course, longitude_course))
+            raise
+
+        # Months stored or being generated by another worker (taken over if its claim expires)
+        for first_day_of_month in other_months:
+            get_or_generate_month_optimal_times(store, first_day_of_month, latitude, longitude)
+            committed([first_day_of_month])
+
+@metrics_utils.timed("generate")
+def compute_optimal_times(start_datetime_utc, end_datetime_utc, latitude, longitude):
+    """
+    Computes the optimal observation times for a given time range and location.
+
+    The time range is sampled on a 15-minute grid, and the Sun altitude, Moon
+    altitude and Moon illumination are evaluated for the whole grid at once.
+    A sample is kept when the Sun is more than 18 degrees below the horizon,
+    and the Moon is either more than 5 degrees below the horizon or less than
+    10 percent illuminated. Nothing is read from or written to the database.
+
+    The Sun and Moon positions are read from the ephemeris table
+    (ephemeris_utils) when it covers the time range, so only the rotation
+    into the observer's alt/az frame is computed; otherwise they are computed.
+    With FAST_ALTAZ, that rotation uses the analytic kernel of altaz_utils.
+
+    Parameters:
+        start_datetime_utc (datetime): The starting datetime of the range in UTC timezone.
+        end_datetime_utc (datetime): The ending datetime of the range in UTC timezone.
+        latitude (float): The latitude coordinate for the observation location.
+        longitude (float): The longitude coordinate for the observation location.
+
+    Returns:
+        astropy.time.Time: An array of astropy Time objects representing the
+            optimal times for astronomical observation within the specified
+            time range and location.
+
+    Example:
+        start_datetime_utc = datetime.datetime(2023, 8, 1, tzinfo=pytz.utc)
+        end_datetime_utc = datetime.datetime(2023, 9, 1, tzinfo=pytz.utc)
+        optimal_times = compute_optimal_times(start_datetime_utc, end_datetime_utc, 43.4494, -80.5752)
+        print(optimal_times.isot[:3])
+    """
+
+    site = geo_utils.get_site(latitude, longitude)
+    loc_elevation = site["elevation"]
+    loc_timezone_str = site["timezone"]
+
+    # Define the observer location
+    observer = Observer(latitude=latitude * u.deg,
+                        longitude=longitude * u.deg,
+                        elevation=loc_elevation * u.m,
+                        timezone=loc_timezone_str)
+
+    # Create the time grid in one call: every 15-minute sample strictly before the end of the range
+    interval_seconds = OPTIMAL_TIMES_INTERVAL_SECONDS
+    range_seconds = (end_datetime_utc - start_datetime_utc).total_seconds()
+    sample_count = max(int(np.ceil(range_seconds / interval_seconds)), 0)
+
+    start_date = Time(start_datetime_utc.astimezone(pytz.UTC))
+    times = start_date + TimeDelta(np.arange(sample_count) * interval_seconds, format='sec')
+
+    if sample_count == 0:
+        return times
+
+    # Sun and Moon positions for the whole grid, shared by the altitude and illumination calculations.
+    # They do not depend on the observer, so they are read from the ephemeris table when it covers the range.
+    positions = ephemeris_utils.get_sun_moon_positions(times)
+
+    if positions is not None:
+        sun, moon, moon_illum = positions
+    else:
+        sun = coord.get_sun(times)
+        moon = coord.get_body("moon", times)
+        moon_illum = ephemeris_utils.get_moon_illumination(sun, moon)
+
+    # Measure the altitude of the Sun and the Moon for the whole grid
+    if altaz_utils.FAST_ALTAZ:
+        sun_alt = altaz_utils.get_observer_altitudes(observer, times, sun)
+        moon_alt = altaz_utils.get_observer_altitudes(observer, times, moon)
+    else:
+        sun_alt = observer.altaz(times, sun).alt.deg
+        moon_alt = observer.altaz(times, moon).alt.deg
+
+    # Define "good" conditions:
+    # * sun is more than 18 degress below horizon
+    # * moon is more than 5 degrees below horizon or less than 10 percent illuminated
+    sun_horizon = -18
+    moon_horizon = -5
+    max_moon_illum = 0.1
+
+    dark_mask = (sun_alt < sun_horizon) & ((moon_alt < moon_horizon) | (moon_illum < max_moon_illum))
+
+    return times[dark_mask]
+
+def generate_optimal_times(start_datetime_utc, end_datetime_utc, latitude, longitude, store=None):
     """
     Generates a list of optimal times for astronomical observation within a given time range and location.
 
     This function calculates the optimal times for astronomical observations, such as stargazing,
     based on specific criteria. These criteria include the Sun being more than 18 degrees below
     the horizon, and the Moon being either more than 5 degrees below the horizon or less than 10 percent illuminated.
-    The calculated times are stored in a database for reuse.
+    The calculated times are stored in a database for reuse, one document per month, so the range
+    must be made of whole months.
 
     Parameters:
-        start_datetime_utc (datetime): The starting datetime of the range in UTC timezone.
-        end_datetime_utc (datetime): The ending datetime of the range in UTC timezone.
+        start_datetime_utc (datetime): The first day of the first month of the range in UTC timezone.
+        end_datetime_utc (datetime): The first day of the month after the range in UTC timezone.
         latitude (float): The latitude coordinate for the observation location.
         longitude (float): The longitude coordinate for the observation location.
+        store: The optimal times store (see storage_utils). Defaults to the process-wide store.
 
     Returns:
-        list[astropy.time.Time]: A list of astropy Time objects representing
+        astropy.time.Time: An array of astropy Time objects representing
             the optimal times for astronomical observation within the specified
             time range and location.
 
+    Raises:
+        ValueError: If the range does not start and end on the first day of a month.
+
     Example:
-        start_datetime_utc = datetime.datetime(2023, 2, 16, tzinfo=pytz.utc)
-        end_datetime_utc = datetime.datetime(2023, 5, 20, tzinfo=pytz.utc)
+        start_datetime_utc = datetime.datetime(2023, 2, 1, tzinfo=pytz.utc)
+        end_datetime_utc = datetime.datetime(2023, 5, 1, tzinfo=pytz.utc)
         latitude = 37.7749
         longitude = -122.4194
         optimal_times = generate_optimal_times(start_datetime_utc, end_datetime_utc, latitude, longitude)
@@ -265,87 +927,99 @@ def generate_optimal_times(start_datetime_utc, end_datetime_utc, latitude, longi
         # satisfying the defined criteria for astronomical observation.
 
     Note:
-        The implementation of this function relies on several external utilities and methods,
-        such as getting elevation, location name, and timezone, that must be properly implemented.
+        The darkness calculation itself is done by compute_optimal_times, which relies on
+        the geo_utils helpers (elevation and timezone) that must be properly implemented.
     """
 
-    # Define the location details
-    location_latitude  = latitude
-    location_longitude = longitude
+    first_day_of_month_list = get_whole_months(start_datetime_utc, end_datetime_utc)
 
-    latitude_course  = round(latitude, 2)
-    longitude_course = round(longitude, 2)
+    optimal_times = compute_optimal_times(start_datetime_utc, end_datetime_utc, latitude, longitude)
 
-    # TODO: Need to implement these methods for real
-    loc_elevation = geo_utils.get_elevation(location_latitude, location_longitude)
-    loc_name      = geo_utils.get_location_name(location_latitude, location_longitude)
+    # Split the (sorted) times at the month boundaries: one document per month
+    unix_times = optimal_times.unix
+    bounds = np.searchsorted(unix_times, [first_day_of_month.timestamp() for first_day_of_month in first_day_of_month_list] + [end_datetime_utc.timestamp()])
 
-    loc_timezone_str  = geo_utils.get_timezone(location_latitude, location_longitude)
-    loc_timezone = pytz.timezone(loc_timezone_str)
+    months = [(first_day_of_month, unix_times[bounds[index]:bounds[index + 1]]) for index, first_day_of_month in enumerate(first_day_of_month_list)]
 
-    utc_timezone = pytz.utc
+    store_months_optimal_times([months], latitude, longitude, store=store)
 
-    # Define the time range and intervals in local timezone
+    return optimal_times
 
-    # Convert the start and end times from UTC to the local timezone
-    start_date_local = start_datetime_utc.astimezone(loc_timezone)
-    end_date_local = end_datetime_utc.astimezone(loc_timezone)
+def get_whole_months(start_datetime_utc, end_datetime_utc):
+    """
+    Returns the first days of the months of a range made of whole months.
 
-    # Define the observer location
-    observer = Observer(latitude=location_latitude * u.deg,
-                        longitude=location_longitude * u.deg,
-                        elevation=loc_elevation * u.m,
-                        timezone=loc_timezone_str)
+    Optimal times are stored one document per month, under the ID of the
+    month (see get_optimal_times_document_id), so only whole months can be stored.
 
-    # Convert local times to UTC for astropy
-    start_date = Time(start_date_local.astimezone(pytz.UTC))
-    end_date = Time(end_date_local.astimezone(pytz.UTC))
+    Raises:
+        ValueError: If the range does not start and end on the first day of a month (at midnight).
 
-    # Define the 15-minute interval
-    interval = TimeDelta(15*60, format='sec')
+    Example:
+        months = get_whole_months(datetime.datetime(2023, 2, 1, tzinfo=pytz.utc), datetime.datetime(2023, 4, 1, tzinfo=pytz.utc))
+        print([month.strftime('%Y-%m') for month in months])  # Output: ['2023-02', '2023-03']
+    """
 
-    # Create the time grid
-    times = []
-    current_time = start_date
-    while current_time < end_date:
-        times.append(current_time)
-        current_time += interval
+    if start_datetime_utc != get_first_day_of_month(start_datetime_utc) or end_datetime_utc != get_first_day_of_month(end_datetime_utc) \
+            or end_datetime_utc <= start_datetime_utc:
+        raise ValueError(f"Optimal times are stored by whole months, not from {start_datetime_utc} to {end_datetime_utc}")
 
-    times = Time(times)  # Convert list to Time object
+    first_day_of_month_list = []
+    first_day_of_month = start_datetime_utc
 
-    # Measure the altitude of the Sun at each time
-    sun_alt = observer.altaz(times, coord.get_sun(times)).alt
+    while first_day_of_month < end_datetime_utc:
+        first_day_of_month_list.append(first_day_of_month)
+        first_day_of_month = get_first_day_of_next_month(first_day_of_month)
 
-    # Measure the altitude of the Moon at each time
-    moon_alt = observer.altaz(times, coord.get_body("moon", times)).alt
+    return first_day_of_month_list
 
-    # Define "good" conditions:
-    # * sun is more than 18 degress below horizon
-    # * moon is more than 5 degrees below horizon or less than 10 percent illuminated
-    sun_horizon = -18
-    moon_horizon = -5
-    max_moon_illum = 0.1
+def get_optimal_times_document(start_datetime_utc, end_datetime_utc, latitude, longitude, unix_times):
+    """
+    Builds the 'optimal_times' document of a month.
+
+    Parameters:
+        start_datetime_utc (datetime): The first day of the month (UTC).
+        end_datetime_utc (datetime): The first day of the next month (UTC).
+        latitude (float): The latitude coordinate for the location.
+        longitude (float): The longitude coordinate for the location.
+        unix_times (numpy.ndarray): The optimal times of the month, in unix seconds.
+
+    Returns:
+        tuple[str, dict]: The deterministic document ID and the document data.
+
+    Raises:
+        ValueError: If the range is not exactly one month.
+    """
 
-    # Create list of 'optimal_times'. These can be reused for future calculations from this location.
-    optimal_times = []
-    for index in range(len(times)):
-        # Is the sun below 'sun_horizon'?
-        if sun_alt[index].deg < sun_horizon:
-            # Is the moon below `moon_horizon` or below illum threshold?
-            if moon_alt[index].deg < moon_horizon or moon_illumination(times[index]) < max_moon_illum:
-                optimal_times.append(times[index])
-    
-    # Convert to json to store in Firestore
-    times_iso = [time.isot for time in optimal_times]
+    if get_whole_months(start_datetime_utc, end_datetime_utc) != [start_datetime_utc]:
+        raise ValueError(f"An optimal times document holds one month, not {start_datetime_utc} to {end_datetime_utc}")
+
+    latitude_course  = round(latitude, 2)
+    longitude_course = round(longitude, 2)
+
+    # Encode the times as a bitmask over the 15-minute grid to store
+    start_epoch = start_datetime_utc.timestamp()
+    slot_count = int(np.ceil((end_datetime_utc - start_datetime_utc).total_seconds() / OPTIMAL_TIMES_INTERVAL_SECONDS))
+
+    optimal_times_packed = encoding_utils.encode_optimal_times(start_epoch, OPTIMAL_TIMES_INTERVAL_SECONDS, slot_count, unix_times)
 
     data = {
         "start_date": start_datetime_utc,
         "end_date": end_datetime_utc,
         "latitude": latitude_course,
         "longitude": longitude_course,
-        "optimal_times": times_iso
+        "optimal_times_encoding": encoding_utils.OPTIMAL_TIMES_FORMAT_VERSION,
+        "optimal_times_packed": optimal_times_packed,
+        "status": OPTIMAL_TIMES_STATUS_READY
     }
 
-    g.db.collection("optimal_times").add(data)
+    return get_optimal_times_document_id(start_datetime_utc, latitude_course, longitude_course), data
+
+def store_optimal_times(start_datetime_utc, end_datetime_utc, latitude, longitude, unix_times, store=None):
+    """
+    Writes the optimal times of a month to the optimal times store (see get_optimal_times_document).
+    """
+
+    document_id, data = get_optimal_times_document(start_datetime_utc, end_datetime_utc, latitude, longitude, unix_times)
 
-    # return optimal_times
\ No newline at end of file
+    (store or storage_utils.get_optimal_times_store()).set(document_id, data)
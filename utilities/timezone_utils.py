@@ -0,0 +1,104 @@
+# timezone_utils.py
+
+import datetime
+import functools
+import numpy as np
+import pytz
+
+_UNIX_EPOCH = datetime.datetime(1970, 1, 1)
+
+@functools.lru_cache(maxsize=256)
+def get_transition_table(timezone_name):
+    """
+    Returns the UTC offset transitions of a timezone, from the pytz tables.
+
+    Returns:
+        tuple[numpy.ndarray, numpy.ndarray]: The instants from which each
+            offset applies (ascending, in unix seconds) and the offsets, in seconds.
+
+    Example:
+        transitions, offsets = get_transition_table('America/Toronto')
+    """
+
+    timezone = pytz.timezone(timezone_name)
+
+    # Timezones with a fixed offset (UTC, Etc/GMT+5, ...) have no transitions
+    if not hasattr(timezone, '_utc_transition_times'):
+        offset = timezone.utcoffset(datetime.datetime(2000, 1, 1))
+        return np.array([np.iinfo(np.int64).min]), np.array([int(offset.total_seconds())], dtype=np.int64)
+
+    transitions = np.array([int((transition - _UNIX_EPOCH).total_seconds()) for transition in timezone._utc_transition_times], dtype=np.int64)
+    offsets = np.array([int(utcoffset.total_seconds()) for utcoffset, dst, tzname in timezone._transition_info], dtype=np.int64)
+
+    # The first transition (year 1) stands for 'since always'
+    transitions[0] = np.iinfo(np.int64).min
+
+    return transitions, offsets
+
+def get_utc_offsets(unix_seconds, timezone_name):
+    """
+    Returns the UTC offset (in seconds) of a timezone at each of an array of instants.
+
+    This is the offset datetime.astimezone would use, found for the whole
+    array with one searchsorted call on the transition table.
+    """
+
+    transitions, offsets = get_transition_table(timezone_name)
+
+    return offsets[np.searchsorted(transitions, unix_seconds, side='right') - 1]
+
+def format_local_times(unix_times, timezone_name):
+    """
+    Formats unix times as local 'YYYY-MM-DDTHH:MM:SS.000' strings (without the offset).
+
+    Gives the same strings as converting every time to a datetime (rounded
+    to the microsecond), localizing it with astimezone and formatting it
+    with strftime('%Y-%m-%dT%H:%M:%S.000'), but for the whole array at once.
+    (On a day with a leap second, astropy's Time.datetime can be a second
+    off; the unix time is used as is here.)
+
+    Parameters:
+        unix_times (numpy.ndarray): The times, in unix seconds.
+        timezone_name (str): The timezone, e.g. 'America/Toronto'.
+
+    Returns:
+        list[str]: The formatted local times.
+
+    Example:
+        print(format_local_times(np.array([1690934400.0]), 'America/Toronto'))  # Output: ['2023-08-01T20:00:00.000']
+    """
+
+    unix_times = np.asarray(unix_times, dtype=np.float64)
+
+    if unix_times.size == 0:
+        return []
+
+    # Round to the microsecond (like Time.datetime), then drop the fraction of a second (like strftime)
+    utc_microseconds = np.rint(unix_times * 1e6).astype(np.int64)
+    utc_seconds = np.floor_divide(utc_microseconds, 1000000)
+
+    local_seconds = utc_seconds + get_utc_offsets(utc_seconds, timezone_name)
+
+    formatted = np.datetime_as_string(local_seconds.astype('datetime64[s]'), unit='s')
+
+    return np.char.add(formatted, '.000').tolist()
+
+def get_epoch_offsets(unix_times):
+    """
+    Returns a compact form of an array of times: the first time and the offsets of every time from it.
+
+    Returns:
+        dict: 'epoch' (the first time, in unix seconds, or None if there are
+            no times) and 'offsets' (seconds from the epoch).
+
+    Example:
+        print(get_epoch_offsets(np.array([1690934400.0, 1690935300.0])))
+        # Output: {'epoch': 1690934400, 'offsets': [0, 900]}
+    """
+
+    unix_seconds = np.rint(np.asarray(unix_times, dtype=np.float64)).astype(np.int64)
+
+    if unix_seconds.size == 0:
+        return {'epoch': None, 'offsets': []}
+
+    return {'epoch': int(unix_seconds[0]), 'offsets': (unix_seconds - unix_seconds[0]).tolist()}
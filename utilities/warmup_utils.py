@@ -0,0 +1,102 @@
+# warmup_utils.py
+
+import importlib
+import threading
+import time
+from utilities import lazy_utils
+from utilities import search_utils
+from utilities import storage_utils
+
+db_utils = lazy_utils.lazy_import('utilities.db_utils')
+ephemeris_utils = lazy_utils.lazy_import('utilities.ephemeris_utils')
+geo_utils = lazy_utils.lazy_import('utilities.geo_utils')
+resolver_utils = lazy_utils.lazy_import('utilities.resolver_utils')
+
+# Modules imported lazily by the app (see lazy_utils) that the pre-warm thread imports ahead of the first request
+PREWARM_MODULES = ['utilities.time_utils', 'utilities.target_utils', 'utilities.resolver_utils', 'utilities.timezone_utils']
+
+_prewarm_thread = None
+
+def load_search_index(app):
+    """
+    Builds the in-memory index used by /search_objects (which falls back to queries on the astro objects store without it).
+    """
+
+    try:
+        search_utils.search_index.load()
+    except FileNotFoundError:
+        app.logger.warning(f"Catalog not found at {search_utils.search_index.path}, searching the astro objects store instead")
+
+def _warm_astropy():
+    # Imported here: astropy is what the app avoids importing at startup
+    from astropy import units as u
+    from astropy.coordinates import AltAz, EarthLocation, SkyCoord, get_body
+    from astropy.time import Time
+    from astropy.utils import iers
+
+    # The IERS tables (downloaded if they are stale), then one transform to build astropy's frame graph
+    iers.earth_orientation_table.get()
+
+    now = Time.now()
+    frame = AltAz(obstime=now, location=EarthLocation.from_geodetic(0 * u.deg, 0 * u.deg))
+    SkyCoord(ra=0 * u.deg, dec=0 * u.deg).transform_to(frame)
+    get_body("moon", now).transform_to(frame)
+
+def _warm_caches():
+    ephemeris_utils.get_ephemeris()
+    geo_utils.get_timezone_finder()
+
+    storage_utils.get_optimal_times_store()
+    storage_utils.get_astro_objects_store()
+
+    # The Firestore client of this process
+    if storage_utils.get_backend() == 'firestore':
+        db_utils.get_client()
+
+def prewarm(app):
+    """
+    Does the work otherwise left to the first requests: loads the search
+    index and the catalog used to resolve target coordinates, imports the
+    astronomy modules, loads the IERS tables and builds astropy's
+    transforms, and opens the ephemeris table, the timezone data and the
+    storage clients.
+
+    A step that fails is logged and skipped; requests then do the work themselves.
+    """
+
+    started = time.perf_counter()
+
+    steps = [("search index", lambda: load_search_index(app)),
+             ("resolver catalog", lambda: resolver_utils.load_catalog_index()),
+             ("modules", lambda: [importlib.import_module(name) for name in PREWARM_MODULES]),
+             ("astropy", _warm_astropy),
+             ("caches", _warm_caches)]
+
+    for name, step in steps:
+        step_started = time.perf_counter()
+
+        try:
+            step()
+        except Exception:
+            app.logger.exception(f"Pre-warm of {name} failed")
+            continue
+
+        app.logger.info(f"Pre-warmed {name} in {time.perf_counter() - step_started:.2f} s")
+
+    app.logger.info(f"Pre-warm done in {time.perf_counter() - started:.2f} s")
+
+def start_prewarm(app):
+    """
+    Starts the background thread that pre-warms the process (see prewarm).
+
+    Parameters:
+        app (Flask): The application, used for logging.
+    """
+
+    global _prewarm_thread
+
+    if _prewarm_thread is not None:
+        return
+
+    _prewarm_thread = threading.Thread(target=prewarm, args=(app,), name="prewarm", daemon=True)
+    _prewarm_thread.start()